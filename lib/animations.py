@@ -0,0 +1,286 @@
+# LED strip animation engine.
+#
+# Effects precompute their frames into packed array('I') tables of raw pixel
+# words (see Neopixel.encode) whenever the table fits into MAX_TABLE_WORDS,
+# so playing a frame is a single bulk transfer to the strip. One timer drives
+# the current effect. The frame to show is derived from the time elapsed
+# since the previous one, so when the device is busy frames are skipped
+# instead of piling up.
+
+import array
+import time
+from machine import Timer
+
+MAX_TABLE_WORDS = 4096
+
+RED = (255, 0, 0)
+ORANGE = (255, 50, 0)
+YELLOW = (255, 100, 0)
+GREEN = (0, 255, 0)
+BLUE = (0, 0, 255)
+INDIGO = (100, 0, 90)
+VIOLET = (200, 0, 100)
+RAINBOW = (RED, ORANGE, YELLOW, GREEN, BLUE, INDIGO, VIOLET)
+
+
+def _scale(color, level):
+    return tuple((c * level + 127) // 255 for c in color)
+
+
+class Effect:
+    # time between two frames in ms
+    frame_ms = 50
+    # parameters that can be set from the web interface
+    options = ()
+
+    def __init__(self, strip):
+        self.strip = strip
+
+    def frame(self, index, skipped):
+        """
+        Show frame <index>, <skipped> frames were dropped since the last call.
+        """
+        raise NotImplementedError
+
+
+class TableEffect(Effect):
+    """Effect playing a precomputed table of frames in a loop."""
+
+    def __init__(self, strip, frames):
+        super().__init__(strip)
+        num_leds = strip.num_leds
+        # fewer frames for long strips, the table size stays bounded
+        self.frames = max(1, min(frames, MAX_TABLE_WORDS // num_leds))
+        self.table = array.array('I', [0] * (self.frames * num_leds))
+        self._table_mv = memoryview(self.table)
+        for n in range(self.frames):
+            self.build(n, self._table_mv[n * num_leds:(n + 1) * num_leds])
+
+    def build(self, n, words):
+        raise NotImplementedError
+
+    def frame(self, index, skipped):
+        num_leds = self.strip.num_leds
+        n = index % self.frames
+        self.strip.show_frame(self._table_mv[n * num_leds:(n + 1) * num_leds])
+
+
+class Rainbow(Effect):
+    """Rainbow gradient running along the strip."""
+
+    options = ('period',)
+
+    def __init__(self, strip, colors=RAINBOW, brightness=50, period=50):
+        """
+        :param period: [default: 50] ms between two one-pixel steps
+        """
+        super().__init__(strip)
+        self.frame_ms = max(10, period)
+        num_leds = strip.num_leds
+        step = max(1, round(num_leds / len(colors)))
+        current_pixel = 0
+        strip.clear()
+        strip.brightness(brightness)
+        for color1, color2 in zip(colors, colors[1:]):
+            if current_pixel + step >= num_leds:
+                break
+            strip.set_pixel_line_gradient(current_pixel, current_pixel + step, color1, color2)
+            current_pixel += step
+        strip.set_pixel_line_gradient(current_pixel, num_leds - 1, colors[-1], colors[0])
+
+    def frame(self, index, skipped):
+        self.strip.rotate_right(1 + skipped)
+        self.strip.show()
+
+
+class Breathe(TableEffect):
+    """Whole strip fading in and out."""
+
+    options = ('color', 'period')
+
+    def __init__(self, strip, color=GREEN, period=3000):
+        self.color = color
+        super().__init__(strip, max(2, period // 40))
+        # a long strip gets fewer frames, they are shown longer so a breath still takes <period>
+        self.frame_ms = max(20, period // self.frames)
+
+    def build(self, n, words):
+        half = self.frames // 2 or 1
+        level = n * 255 // half if n < half else (self.frames - n) * 255 // half
+        word = self.strip.encode(_scale(self.color, min(255, level)))
+        for i in range(len(words)):
+            words[i] = word
+
+
+class WateringPulse(TableEffect):
+    """Drop of light travelling along the strip with a fading tail."""
+
+    options = ('color', 'period')
+
+    def __init__(self, strip, color=BLUE, tail=4, period=60):
+        self.color = color
+        self.tail = tail
+        self.frame_ms = max(10, period)
+        super().__init__(strip, strip.num_leds)
+
+    def build(self, n, words):
+        num_leds = len(words)
+        # when the table had to be shortened, the drop moves several leds per frame
+        head = n * num_leds // self.frames
+        for i in range(num_leds):
+            distance = (head - i) % num_leds
+            if distance <= self.tail:
+                words[i] = self.strip.encode(_scale(self.color, 255 - distance * 255 // (self.tail + 1)))
+            else:
+                words[i] = 0
+
+
+class AlertBlink(TableEffect):
+    """Whole strip blinking."""
+
+    options = ('color', 'period')
+
+    def __init__(self, strip, color=RED, period=1000):
+        self.color = color
+        self.frame_ms = max(20, period // 2)
+        super().__init__(strip, 2)
+
+    def build(self, n, words):
+        word = self.strip.encode(self.color) if n == 0 else 0
+        for i in range(len(words)):
+            words[i] = word
+
+    def frame(self, index, skipped):
+        if self.frames > 1 or index % 2 == 0:
+            super().frame(index, skipped)
+        else:
+            # too many leds for the dark frame in the table
+            self.strip.clear()
+            self.strip.show()
+
+
+class MoistureBar(Effect):
+    """Bar graph of the soil moisture, redrawn only when the level changes."""
+
+    frame_ms = 500
+    options = ('color',)
+
+    def __init__(self, strip, level=0, color=GREEN, background=(20, 0, 0)):
+        """
+        :param level: moisture in percent, or a callable returning it
+        """
+        super().__init__(strip)
+        self.level = level
+        self.color = color
+        self.background = background
+        self._shown = None
+
+    def frame(self, index, skipped):
+        level = self.level() if callable(self.level) else self.level
+        if level is None:
+            level = 0
+        if level == self._shown:
+            return
+        strip = self.strip
+        lit = strip.num_leds * max(0, min(100, level)) // 100
+        strip.fill(self.background)
+        if lit:
+            strip.set_pixel_line(0, lit - 1, self.color)
+        strip.show()
+        self._shown = level
+
+
+EFFECTS = {
+    'rainbow': Rainbow,
+    'breathe': Breathe,
+    'moisture': MoistureBar,
+    'watering': WateringPulse,
+    'alert': AlertBlink,
+}
+
+
+class AnimationEngine:
+    def __init__(self, strip, timer=None):
+        """
+        :param strip: Neopixel instance
+        :param timer: [default: None] machine.Timer used for scheduling, a new virtual timer if None
+        """
+        self.strip = strip
+        self.timer = timer if timer is not None else Timer(-1)
+        self.effect = None
+        self.name = None
+        self._started = 0
+        self._last_index = -1
+        self._busy = False
+        self._window_start = 0
+        self._window_frames = 0
+        self.fps = 0
+        self.frames = 0
+        self.dropped = 0
+
+    def start(self, name, **params):
+        """
+        Start effect <name>, <params> are passed to the effect constructor.
+        Raises ValueError for an unknown effect, the running one is kept when
+        the constructor fails.
+        """
+        if name not in EFFECTS:
+            raise ValueError('Unknown animation: {}'.format(name))
+        # built before the running effect is stopped, it keeps going if the
+        # parameters are rejected, and it pauses while the new one draws
+        self._busy = True
+        try:
+            effect = EFFECTS[name](self.strip, **params)
+        finally:
+            self._busy = False
+        self.stop()
+        self.effect = effect
+        self.name = name
+        self.frames = 0
+        self.dropped = 0
+        self.fps = 0
+        self._last_index = -1
+        self._started = self._window_start = time.ticks_ms()
+        self._window_frames = 0
+        self.timer.init(period=self.effect.frame_ms, mode=Timer.PERIODIC, callback=self._tick)
+
+    def stop(self):
+        if self.effect is not None:
+            self.timer.deinit()
+        self.effect = None
+        self.name = None
+
+    @property
+    def running(self):
+        return self.effect is not None
+
+    def status(self):
+        return {'name': self.name, 'fps': self.fps, 'frames': self.frames, 'dropped': self.dropped}
+
+    def _tick(self, _):
+        effect = self.effect
+        if effect is None or self._busy:
+            return
+        self._busy = True
+        try:
+            now = time.ticks_ms()
+            steps = time.ticks_diff(now, self._started) // effect.frame_ms
+            if steps <= 0:
+                return
+            # <_started> follows the frames, the difference never gets near the ticks wrap
+            self._started = time.ticks_add(self._started, steps * effect.frame_ms)
+            skipped = steps - 1 if self._last_index >= 0 else 0
+            self.dropped += skipped
+            index = self._last_index + steps
+            self._last_index = index
+            effect.frame(index, skipped)
+            self.frames += 1
+
+            self._window_frames += 1
+            elapsed = time.ticks_diff(now, self._window_start)
+            if elapsed >= 1000:
+                self.fps = self._window_frames * 1000 // elapsed
+                self._window_frames = 0
+                self._window_start = now
+        finally:
+            self._busy = False
@@ -0,0 +1,136 @@
+# In-memory cache for the static pages served by the web servers.
+#
+# Each page is read from flash once. When a pre-built '<name>.gz' file exists
+# (see tools/build_assets.py) and the CRC and size in its gzip trailer match
+# the page, it is used as is. Otherwise, also for a page edited after the
+# build, the page is gzipped at boot if the firmware has the 'deflate'
+# module. Responses carry an ETag so a browser revisiting the dashboard gets
+# a bodyless 304.
+
+import binascii
+import io
+import struct
+
+from lib.httpserver import Response
+
+try:
+    import deflate
+
+    def _gzip(data):
+        stream = io.BytesIO()
+        with deflate.DeflateIO(stream, deflate.GZIP) as f:
+            f.write(data)
+        return stream.getvalue()
+except ImportError:
+    try:
+        import gzip
+
+        def _gzip(data):
+            return gzip.compress(data)
+    except ImportError:
+        _gzip = None
+
+
+CACHE_CONTROL = 'no-cache'
+
+
+def _read(filename):
+    with open(filename, 'rb') as file:
+        return file.read()
+
+
+class Asset:
+    def __init__(self, filename, content_type, raw, gz, etag):
+        self.filename = filename
+        self.content_type = content_type
+        self.raw = raw
+        self.gz = gz
+        self.etag = etag
+
+
+class AssetCache:
+    def __init__(self, cache_control=CACHE_CONTROL):
+        self.cache_control = cache_control
+        self.assets = {}
+        self.flash_reads = 0
+        # pre-built files that didn't match their page
+        self.stale = 0
+
+    def load(self, filename, content_type='text/html'):
+        """
+        Read <filename> into the cache, compressing it if possible.
+        The uncompressed copy is only kept when there is no gzip one.
+
+        :param filename: path of the file on flash
+        :param content_type: [default: 'text/html'] value of the Content-Type header
+        :return: Asset or None if the file does not exist
+        """
+        try:
+            raw = _read(filename)
+        except OSError:
+            return None
+        self.flash_reads += 1
+        crc = binascii.crc32(raw) & 0xFFFFFFFF
+        etag = '"{:08x}"'.format(crc)
+
+        gz = None
+        try:
+            gz = _read(filename + '.gz')
+            self.flash_reads += 1
+        except OSError:
+            pass
+        if gz is not None and (len(gz) < 8 or struct.unpack('<II', gz[-8:]) != (crc, len(raw) & 0xFFFFFFFF)):
+            # built from an older version of the page
+            self.stale += 1
+            gz = None
+        if gz is None and _gzip is not None:
+            try:
+                gz = _gzip(raw)
+            except (OSError, ValueError):
+                gz = None
+        if gz is not None and len(gz) >= len(raw):
+            gz = None
+
+        asset = Asset(filename, content_type, None if gz else raw, gz, etag)
+        self.assets[filename] = asset
+        return asset
+
+    def get(self, filename, content_type='text/html'):
+        asset = self.assets.get(filename)
+        if asset is None:
+            asset = self.load(filename, content_type)
+        return asset
+
+    def raw(self, filename):
+        """
+        Return the uncompressed content of <filename>, e.g. for templates
+        that are formatted before sending.
+        """
+        asset = self.get(filename)
+        if asset is None:
+            return None
+        if asset.raw is not None:
+            return asset.raw
+        self.flash_reads += 1
+        return _read(filename)
+
+    def response(self, filename, request=None, content_type='text/html'):
+        """
+        Build a response for <filename>, honouring If-None-Match and
+        Accept-Encoding of <request>.
+        """
+        asset = self.get(filename, content_type)
+        if asset is None:
+            return Response('Not found', 404)
+
+        headers = [('ETag', asset.etag), ('Cache-Control', self.cache_control)]
+        request_headers = request.headers if request is not None else {}
+        if request_headers.get('if-none-match') == asset.etag:
+            return Response(b'', 304, None, headers)
+
+        if asset.gz is not None:
+            headers.append(('Vary', 'Accept-Encoding'))
+            if 'gzip' in request_headers.get('accept-encoding', ''):
+                headers.append(('Content-Encoding', 'gzip'))
+                return Response(asset.gz, 200, asset.content_type, headers)
+        return Response(self.raw(filename), 200, asset.content_type, headers)
@@ -124,8 +124,8 @@ while True:
             data["soil_sensors"][index] = percent_soil
     try:   
         t_sensor.measure()
-        t_sensor_temperature = t_sensor.temperature()
-        t_sensor_humidity = t_sensor.humidity()
+        t_sensor_temperature = t_sensor.temperature
+        t_sensor_humidity = t_sensor.humidity
         oled.text(f'{t_sensor_temperature}C', 28, 18)
         oled.text(f'{t_sensor_humidity}%', 28, 46)
         data["outside_sensors"]["temperature"] = t_sensor_temperature
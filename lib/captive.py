@@ -0,0 +1,97 @@
+# Captive portal DNS for the access point mode.
+#
+# A phone or laptop joining a network looks up a well known host and fetches
+# a probe page from it. DNSResponder answers every A query with the address
+# of the pot, so the probe reaches the provisioning server, whose redirect
+# makes the system pop up its sign-in window with the setup page. Other
+# query types get an empty answer and the client falls back to A.
+#
+# uasyncio has no datagram streams, the socket is non-blocking and the task
+# polls it. A query costs one recvfrom and one sendto.
+
+import socket
+import struct
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+DNS_PORT = 53
+POLL_INTERVAL = 0.05
+TTL = 60
+MAX_QUERY = 512
+TYPE_A = 1
+
+
+def dns_answer(query, address):
+    """
+    :param query: DNS query packet
+    :param address: 4 bytes of the IPv4 address every name resolves to
+    :return: response packet, None for a packet that is not a standard query with one question
+    """
+    if len(query) < 12 or query[2] & 0xF8 or query[4] or query[5] != 1:
+        # a response, an opcode other than QUERY or not one question
+        return None
+    end = 12
+    while end < len(query) and query[end]:
+        end += query[end] + 1
+    # zero length label, type and class
+    end += 5
+    if end > len(query):
+        return None
+    found = (query[end - 4] << 8 | query[end - 3]) == TYPE_A
+    # QR and AA set, RD copied, RA set, no error, one question, one answer for A
+    header = query[:2] + bytes((0x84 | (query[2] & 0x01), 0x80, 0, 1, 0, 1 if found else 0, 0, 0, 0, 0))
+    if not found:
+        return header + query[12:end]
+    # the name is a pointer to the one in the question
+    return header + query[12:end] + b'\xc0\x0c' + struct.pack('>HHIH', TYPE_A, 1, TTL, 4) + address
+
+
+class DNSResponder:
+    def __init__(self, address, port=DNS_PORT, poll_interval=POLL_INTERVAL):
+        """
+        :param address: IPv4 address every name resolves to, e.g. '192.168.4.1'
+        :param port: [default: DNS_PORT] UDP port to listen on
+        :param poll_interval: [default: POLL_INTERVAL] seconds between two looks at an idle socket
+        """
+        self.address = bytes(int(part) for part in address.split('.'))
+        self.port = port
+        self.poll_interval = poll_interval
+        self.socket = None
+        self.queries = 0
+        self.answers = 0
+
+    def start(self, host='0.0.0.0'):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((host, self.port))
+        s.setblocking(False)
+        self.socket = s
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    async def serve(self):
+        """
+        Task answering the queries until close() is called.
+        """
+        while self.socket is not None:
+            try:
+                query, client = self.socket.recvfrom(MAX_QUERY)
+            except OSError:
+                # nothing waiting
+                await asyncio.sleep(self.poll_interval)
+                continue
+            self.queries += 1
+            response = dns_answer(query, self.address)
+            if response is None:
+                continue
+            try:
+                self.socket.sendto(response, client)
+                self.answers += 1
+            except OSError:
+                pass
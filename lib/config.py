@@ -0,0 +1,136 @@
+# Configuration store.
+#
+# All settings live in one JSON file with an in-RAM copy, reads never touch
+# the flash. Changes only mark the copy dirty. poll() writes it once no
+# change came for quiet_ms, so a burst of updates from the dashboard costs a
+# single flash write. Writes go to a temporary file that is then renamed over
+# the old one (littlefs replaces the target). Every write bumps 'version',
+# a complete temporary file with a newer version than the main one was cut
+# off before its rename and is loaded instead, a torn one doesn't parse and
+# the old version is kept. A write that failed leaves the changes pending,
+# poll() tries again after RETRY_MS, doubling up to MAX_RETRY_MS.
+
+import json
+import os
+import time
+
+QUIET_MS = 3000
+RETRY_MS = 5000
+MAX_RETRY_MS = 300000
+
+
+class ConfigStore:
+    def __init__(self, path='config.json', quiet_ms=QUIET_MS):
+        """
+        :param path: [default: 'config.json'] file holding the settings
+        :param quiet_ms: [default: QUIET_MS] time without changes before they are written
+        """
+        self.path = path
+        self.temp_path = path + '.tmp'
+        self.quiet_ms = quiet_ms
+        self.data = {}
+        self.version = 0
+        self.loaded = False
+        self.dirty = False
+        self.changed = 0
+        self.retry_ms = 0
+        self.retry_at = 0
+        self.error = None
+        # statistics
+        self.changes = 0
+        self.writes = 0
+        self.bytes_written = 0
+        self.failures = 0
+        self.load_us = 0
+
+    def _read(self, path):
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data if isinstance(data, dict) else None
+
+    def load(self):
+        """
+        Read the settings from flash, from the temporary file if the power
+        went away between writing it and the rename.
+
+        :return: True if a stored configuration was found
+        """
+        started = time.ticks_us()
+        data = self._read(self.path)
+        pending = self._read(self.temp_path)
+        if pending is not None and (data is None or pending.get('version', 0) > data.get('version', 0)):
+            data = pending
+        self.loaded = data is not None
+        self.data = data or {}
+        self.version = self.data.pop('version', 0)
+        self.dirty = False
+        self.load_us = time.ticks_diff(time.ticks_us(), started)
+        return self.loaded
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        """
+        Change a setting in RAM, it is written by the next poll() after the quiet period.
+
+        :return: False if the value didn't change
+        """
+        if self.data.get(key) == value:
+            return False
+        self.data[key] = value
+        self.dirty = True
+        self.changed = time.ticks_ms()
+        self.changes += 1
+        return True
+
+    def poll(self, now=None):
+        """
+        Write pending changes once none came for quiet_ms, called on every tick.
+
+        :return: True if the settings were written
+        """
+        if not self.dirty:
+            return False
+        if now is None:
+            now = time.ticks_ms()
+        if time.ticks_diff(now, self.changed) < self.quiet_ms:
+            return False
+        if self.retry_ms and time.ticks_diff(now, self.retry_at) < 0:
+            return False
+        return self.flush()
+
+    def flush(self):
+        """
+        Write pending changes right away.
+
+        :return: True if the settings were written, False if there were none or the write failed
+        """
+        if not self.dirty:
+            return False
+        self.data['version'] = self.version + 1
+        try:
+            text = json.dumps(self.data)
+        finally:
+            del self.data['version']
+        try:
+            with open(self.temp_path, 'w') as f:
+                f.write(text)
+            os.rename(self.temp_path, self.path)
+        except OSError as e:
+            # e.g. a full file system, the changes stay pending
+            self.failures += 1
+            self.error = str(e)
+            self.retry_ms = min(self.retry_ms * 2, MAX_RETRY_MS) if self.retry_ms else RETRY_MS
+            self.retry_at = time.ticks_add(time.ticks_ms(), self.retry_ms)
+            return False
+        self.retry_ms = 0
+        self.error = None
+        self.version += 1
+        self.dirty = False
+        self.writes += 1
+        self.bytes_written += len(text)
+        return True
@@ -1,7 +1,7 @@
 import array
 import micropython
 import utime
-from machine import Pin
+from machine import Pin, Timer
 from micropython import const
  
 class InvalidChecksum(Exception):
@@ -12,8 +12,15 @@ class InvalidPulseCount(Exception):
  
 MAX_UNCHANGED = const(100)
 MIN_INTERVAL_US = const(200000)
+# ticks_ms wraps after 2^29 ms, a reading this old is dropped before its age becomes ambiguous
+MAX_AGE_MS = const(3600000)
 HIGH_LEVEL = const(50)
 EXPECTED_PULSES = const(84)
+START_SIGNAL_MS = const(20)
+MAX_RETRIES = const(3)
+
+IDLE = const(0)
+STARTED = const(1)
  
 class DHT11:
     _temperature: float
@@ -21,36 +28,146 @@ class DHT11:
  
     def __init__(self, pin):
         self._pin = pin
-        self._last_measure = utime.ticks_us()
+        self._last_good_ms = utime.ticks_ms()
         self._temperature = -1
         self._humidity = -1
+        # non-blocking acquisition, see start()
+        self._state = IDLE
+        self._timer = Timer(-1)
+        self._retries = 0
+        self._start_us = 0
+        self._valid = False
+        # statistics
+        self.readings = 0
+        self.checksum_errors = 0
+        self.pulse_errors = 0
+        self.failures = 0
+        self.driver_us = 0
+        self._pin.init(Pin.OUT, Pin.PULL_DOWN)
+        self._pin.value(1)
  
     def measure(self):
-        current_ticks = utime.ticks_us()
-        if utime.ticks_diff(current_ticks, self._last_measure) < MIN_INTERVAL_US and (
-            self._temperature > -1 or self._humidity > -1
-        ):
+        """
+        Blocking read with up to MAX_RETRIES attempts, raises the last error
+        when all of them fail.
+        """
+        age = self.age_ms()
+        if age is not None and age < MIN_INTERVAL_US // 1000:
             # Less than a second since last read, which is too soon according
             # to the datasheet
             return
+        if self._state != IDLE:
+            # a non-blocking reading is in progress
+            return
  
-        self._send_init_signal()
-        pulses = self._capture_pulses()
-        buffer = self._convert_pulses_to_buffer(pulses)
-        self._verify_checksum(buffer)
+        self._start_us = 0
+        for attempt in range(MAX_RETRIES):
+            started = utime.ticks_us()
+            self._send_init_signal()
+            try:
+                self._collect(started)
+                return
+            except (InvalidChecksum, InvalidPulseCount):
+                if attempt == MAX_RETRIES - 1:
+                    self.failures += 1
+                    raise
+                utime.sleep_ms(MIN_INTERVAL_US // 1000)
+
+    def start(self):
+        """
+        Start a reading without blocking. The line is pulled low for the
+        start signal and a one-shot timer collects the answer START_SIGNAL_MS
+        later. Failed readings are retried up to MAX_RETRIES times, the
+        properties keep returning the last good values in the meantime.
+
+        :return: False if a reading is already in progress or it is too soon
+        """
+        if self._state != IDLE:
+            return False
+        age = self.age_ms()
+        if age is not None and age < MIN_INTERVAL_US // 1000:
+            return False
+        started = utime.ticks_us()
+        self._state = STARTED
+        self._pin.init(Pin.OUT, Pin.PULL_DOWN)
+        self._pin.value(0)
+        self._start_us = utime.ticks_diff(utime.ticks_us(), started)
+        self._timer.init(period=START_SIGNAL_MS, mode=Timer.ONE_SHOT, callback=self._collect_cb)
+        return True
+
+    def _collect_cb(self, _):
+        started = utime.ticks_us()
+        try:
+            self._collect(started)
+            self._retries = 0
+            self._state = IDLE
+        except (InvalidChecksum, InvalidPulseCount):
+            self._retries += 1
+            if self._retries < MAX_RETRIES:
+                # the sensor needs a pause before it can be asked again
+                self._pin.value(1)
+                self._timer.init(period=MIN_INTERVAL_US // 1000, mode=Timer.ONE_SHOT, callback=self._retry_cb)
+            else:
+                self.failures += 1
+                self._retries = 0
+                self._state = IDLE
+
+    def _retry_cb(self, _):
+        self._state = IDLE
+        self.start()
+
+    def _collect(self, started):
+        try:
+            pulses = self._capture_pulses()
+            buffer = self._convert_pulses_to_buffer(pulses)
+            self._verify_checksum(buffer)
+        except InvalidChecksum:
+            self.checksum_errors += 1
+            raise
+        except InvalidPulseCount:
+            self.pulse_errors += 1
+            raise
+        finally:
+            # leave the line idle high, ready for the next start signal
+            self._pin.value(1)
  
         self._humidity = buffer[0] + buffer[1] / 10
         self._temperature = buffer[2] + buffer[3] / 10
-        self._last_measure = utime.ticks_us()
+        self._last_good_ms = utime.ticks_ms()
+        self._valid = True
+        self.readings += 1
+        self.driver_us = self._start_us + utime.ticks_diff(utime.ticks_us(), started)
+
+    @property
+    def busy(self):
+        return self._state != IDLE
+
+    @property
+    def valid(self):
+        return self._valid
+
+    def age_ms(self):
+        """
+        Age of the cached reading in ms, None if there was no good reading
+        in the last MAX_AGE_MS.
+        """
+        if not self._valid:
+            return None
+        age = utime.ticks_diff(utime.ticks_ms(), self._last_good_ms)
+        if age < 0 or age > MAX_AGE_MS:
+            # too old to tell, the properties keep the values but they are stale
+            self._valid = False
+            return None
+        return age
  
     @property
     def humidity(self):
-        self.measure()
+        # cached value, never touches the bus
         return self._humidity
  
     @property
     def temperature(self):
-        self.measure()
+        # cached value, never touches the bus
         return self._temperature
  
     def _send_init_signal(self):
@@ -78,7 +195,7 @@ class DHT11:
                         "Got more than {} pulses".format(EXPECTED_PULSES)
                     )
                 now = utime.ticks_us()
-                transitions[idx] = now - timestamp
+                transitions[idx] = utime.ticks_diff(now, timestamp)
                 timestamp = now
                 idx += 1
  
@@ -0,0 +1,303 @@
+# Persistent event log.
+#
+# log() packs a record into a preallocated RAM buffer and returns, it never
+# touches the flash. The writer() task appends the buffer to the active
+# segment file in one write every FLUSH_INTERVAL seconds, or sooner once the
+# buffer is half full. When the buffer is full new records are dropped and
+# counted. A segment that grew past segment_size is closed and the oldest
+# ones are deleted, so the log never takes more than
+# segments * segment_size bytes of flash (plus one record).
+#
+# Record: marker 0xA5, event code, time.time(), signed 16 bit value, length
+# of the message and the UTF-8 message, 9 bytes plus at most MAX_MESSAGE.
+# A record cut short by a power loss ends the segment when reading.
+#
+# Positions are cursors 'segment:offset'. The RAM buffer is the not yet
+# written tail of the active segment, so a cursor stays valid when it is
+# flushed.
+
+import json
+import os
+import struct
+import time
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+from lib.httpserver import Response
+
+MARKER = 0xA5
+HEADER = '<BBIhB'
+HEADER_SIZE = struct.calcsize(HEADER)
+MAX_MESSAGE = 96
+BUFFER_SIZE = 1024
+SEGMENT_SIZE = 4096
+SEGMENTS = 4
+FLUSH_INTERVAL = 30
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+INFO = 0
+BOOT = 1
+PUMP = 2
+WIFI = 3
+WIFI_FAILED = 4
+DHT_FAILED = 5
+CONFIG_FAILED = 6
+EVENTS = ('info', 'boot', 'pump', 'wifi', 'wifi_failed', 'dht_failed', 'config_failed')
+
+
+def decode(data):
+    try:
+        return data.decode()
+    except UnicodeError:
+        # a message cut inside a character by an older firmware
+        return ''.join(chr(b) if b < 0x80 else '\ufffd' for b in data)
+
+
+class EventLog:
+    def __init__(self, directory='events', buffer_size=BUFFER_SIZE, segment_size=SEGMENT_SIZE, segments=SEGMENTS):
+        """
+        :param directory: [default: 'events'] directory of the segment files
+        :param buffer_size: [default: BUFFER_SIZE] bytes of records kept in RAM between two writes
+        :param segment_size: [default: SEGMENT_SIZE] size after which a new segment is started
+        :param segments: [default: SEGMENTS] segments kept, the oldest one is deleted first
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.segments = segments
+        self.buffer = bytearray(buffer_size)
+        self.used = 0
+        self.logged = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.bytes_written = 0
+        try:
+            os.mkdir(directory)
+        except OSError:
+            pass
+        numbers = self._numbers()
+        self.first = numbers[0] if numbers else 0
+        self.active = numbers[-1] if numbers else 0
+        self.size = self._size(self.active)
+        end = 0
+        for end, _ in self._segment(self.active, 0):
+            pass
+        if self.size >= segment_size or end != self.size:
+            # full, or it ends in a record torn by a power loss that would
+            # hide everything appended after it
+            self._rotate()
+
+    def _numbers(self):
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.log'):
+                try:
+                    numbers.append(int(name[:-4]))
+                except ValueError:
+                    pass
+        numbers.sort()
+        return numbers
+
+    def _path(self, number):
+        return '{}/{}.log'.format(self.directory, number)
+
+    def _size(self, number):
+        try:
+            return os.stat(self._path(number))[6]
+        except OSError:
+            return 0
+
+    def _rotate(self):
+        self.active += 1
+        self.size = 0
+        while self.active - self.first >= self.segments:
+            try:
+                os.remove(self._path(self.first))
+            except OSError:
+                pass
+            self.first += 1
+
+    def log(self, code, message='', value=0, timestamp=None):
+        """
+        Add a record to the RAM buffer.
+
+        :param code: one of the event codes, INFO, BOOT, PUMP, ...
+        :param message: [default: ''] text, cut to MAX_MESSAGE bytes
+        :param value: [default: 0] number stored with the event, clamped to 16 bits
+        :param timestamp: [default: None] time.time() if None
+        :return: False if the buffer was full and the record was dropped
+        """
+        data = message.encode() if message else b''
+        if len(data) > MAX_MESSAGE:
+            end = MAX_MESSAGE
+            # don't cut a multi-byte character in half
+            while end and data[end] & 0xC0 == 0x80:
+                end -= 1
+            data = data[:end]
+        end = self.used + HEADER_SIZE + len(data)
+        if end > len(self.buffer):
+            self.dropped += 1
+            return False
+        if timestamp is None:
+            timestamp = time.time()
+        value = max(-32768, min(32767, value))
+        struct.pack_into(HEADER, self.buffer, self.used, MARKER, code, int(timestamp), value, len(data))
+        self.buffer[self.used + HEADER_SIZE:end] = data
+        self.used = end
+        self.logged += 1
+        return True
+
+    def flush(self):
+        """
+        Append the buffered records to the active segment in one write.
+
+        :return: bytes written
+        """
+        used = self.used
+        if not used:
+            return 0
+        with open(self._path(self.active), 'ab') as f:
+            f.write(memoryview(self.buffer)[:used])
+        # the timers may have logged during the write, keep what came after
+        self.buffer[:self.used - used] = self.buffer[used:self.used]
+        self.used -= used
+        self.size += used
+        self.flushes += 1
+        self.bytes_written += used
+        if self.size >= self.segment_size:
+            self._rotate()
+        return used
+
+    async def writer(self, interval=FLUSH_INTERVAL):
+        """
+        Task flushing the buffer every <interval> seconds, or sooner once it is half full.
+        """
+        waited = 0
+        while True:
+            await asyncio.sleep(1)
+            waited += 1
+            if self.used and (waited >= interval or self.used * 2 >= len(self.buffer)):
+                self.flush()
+                waited = 0
+
+    def oldest(self):
+        return '{}:0'.format(self.first)
+
+    def parse_cursor(self, cursor):
+        """
+        :return: (segment, offset) of <cursor>, raises ValueError for a malformed one
+        """
+        if not cursor:
+            return self.first, 0
+        number, _, offset = cursor.partition(':')
+        number = int(number)
+        offset = int(offset or 0)
+        if number < self.first:
+            return self.first, 0
+        return number, offset
+
+    def entries(self, cursor=None, limit=PAGE_SIZE):
+        """
+        Records from <cursor> on, oldest first. They are read one at a time,
+        a page never sits in RAM as a whole.
+
+        :param cursor: [default: None] 'segment:offset' as returned before, the oldest record if None
+        :param limit: [default: PAGE_SIZE] records returned at most
+        :return: generator of (cursor after the record, (timestamp, event name, value, message))
+        """
+        number, offset = self.parse_cursor(cursor)
+        count = 0
+        while number <= self.active:
+            records = self._segment(number, offset)
+            try:
+                for position, entry in records:
+                    yield '{}:{}'.format(number, position), entry
+                    count += 1
+                    if count >= limit:
+                        return
+            finally:
+                # closes the segment file of a page that ended inside it
+                records.close()
+            number += 1
+            offset = 0
+
+    def _segment(self, number, offset):
+        # Records of segment <number> from <offset> on. The writer may flush
+        # or rotate while the caller waits between two records, so the end of
+        # the file and the RAM tail are looked up again for every record.
+        f = None
+        opened = 0
+        try:
+            while True:
+                size = self.size if number == self.active else self._size(number)
+                if offset < size:
+                    if f is None or size > opened:
+                        # appended bytes may not show up in a handle opened before
+                        if f is not None:
+                            f.close()
+                        f = open(self._path(number), 'rb')
+                        opened = size
+                    f.seek(offset)
+                    data = f.read(min(HEADER_SIZE + MAX_MESSAGE, size - offset))
+                elif number == self.active:
+                    # the records still in RAM follow the end of the file
+                    start = offset - size
+                    data = bytes(self.buffer[start:min(self.used, start + HEADER_SIZE + MAX_MESSAGE)])
+                else:
+                    return
+                record = self._record(data)
+                if record is None:
+                    return
+                offset += record[0]
+                yield offset, record[1]
+        except OSError:
+            return
+        finally:
+            if f is not None:
+                f.close()
+
+    def _record(self, data):
+        # :return: (size, entry) of the record <data> starts with, None if it is incomplete or torn
+        if len(data) < HEADER_SIZE:
+            return None
+        marker, code, timestamp, value, length = struct.unpack_from(HEADER, data)
+        if marker != MARKER or len(data) < HEADER_SIZE + length:
+            # a torn write, the rest of the segment is unreadable
+            return None
+        message = decode(data[HEADER_SIZE:HEADER_SIZE + length])
+        return HEADER_SIZE + length, (timestamp, EVENTS[code] if code < len(EVENTS) else code, value, message)
+
+class LogStream(Response):
+    def __init__(self, log, cursor=None, limit=PAGE_SIZE):
+        super().__init__(b'', 200, 'application/json', [('Transfer-Encoding', 'chunked'), ('Cache-Control', 'no-cache')])
+        self.log = log
+        self.cursor = cursor
+        self.limit = min(limit, MAX_PAGE_SIZE)
+
+    def head(self, keep_alive):
+        # no Content-Length, the body is sent in chunks as the records are read
+        lines = ['HTTP/1.1 200 OK', 'Content-Type: application/json', 'Transfer-Encoding: chunked',
+                 'Cache-Control: no-cache', 'Connection: keep-alive' if keep_alive else 'Connection: close']
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+    def _chunk(self, writer, text):
+        data = text.encode()
+        writer.write('{:x}\r\n'.format(len(data)).encode() + data + b'\r\n')
+
+    async def write(self, writer, keep_alive):
+        writer.write(self.head(keep_alive))
+        self._chunk(writer, '{"entries": [')
+        cursor = self.cursor or self.log.oldest()
+        separator = ''
+        for count, (cursor, entry) in enumerate(self.log.entries(self.cursor, self.limit)):
+            timestamp, event, value, message = entry
+            self._chunk(writer, separator + json.dumps({'t': timestamp, 'event': event, 'value': value, 'message': message}))
+            separator = ', '
+            if count % 10 == 9:
+                await writer.drain()
+        self._chunk(writer, '], "next": {}}}'.format(json.dumps(cursor)))
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
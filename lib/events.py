@@ -0,0 +1,94 @@
+# Server-Sent Events for the dashboard.
+#
+# StateFeed watches a snapshot of the tracked values and bumps a version
+# number whenever one of them changes. Every open /events connection is an
+# EventStream which sends the first snapshot in full and after that only the
+# fields that changed.
+
+import json
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+from lib.httpserver import Response
+
+
+POLL_INTERVAL = 0.05
+HEARTBEAT_INTERVAL = 15
+MAX_STREAMS = 4
+
+
+class StateFeed:
+    def __init__(self, snapshot):
+        """
+        :param snapshot: callable returning a dict of the tracked values
+        """
+        self.snapshot = snapshot
+        self.state = None
+        self.version = 0
+        self.streams = 0
+
+    def poll(self):
+        state = self.snapshot()
+        if state != self.state:
+            self.state = state
+            self.version += 1
+        return self.version
+
+
+class EventStream(Response):
+    def __init__(self, feed, poll_interval=POLL_INTERVAL, heartbeat_interval=HEARTBEAT_INTERVAL):
+        super().__init__(b'', 200, 'text/event-stream', [('Cache-Control', 'no-cache')])
+        self.feed = feed
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+
+    def head(self, keep_alive):
+        # No Content-Length, the body lasts until the client goes away
+        lines = ['HTTP/1.1 200 OK', 'Content-Type: text/event-stream', 'Cache-Control: no-cache', 'Connection: keep-alive']
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+    async def write(self, writer, keep_alive):
+        feed = self.feed
+        feed.streams += 1
+        try:
+            writer.write(self.head(True))
+            writer.write(b'retry: 3000\n\n')
+            await writer.drain()
+
+            sent = {}
+            version = -1
+            idle = 0
+            while True:
+                if feed.poll() != version:
+                    version = feed.version
+                    changes = {}
+                    for key, value in feed.state.items():
+                        if key not in sent or sent[key] != value:
+                            changes[key] = value
+                    sent = feed.state
+                    if changes:
+                        writer.write(b'data: ' + json.dumps(changes).encode() + b'\n\n')
+                        await writer.drain()
+                        idle = 0
+                elif idle >= self.heartbeat_interval:
+                    # comment line, keeps proxies and the browser from timing out
+                    writer.write(b': ping\n\n')
+                    await writer.drain()
+                    idle = 0
+                await asyncio.sleep(self.poll_interval)
+                idle += self.poll_interval
+        finally:
+            feed.streams -= 1
+
+
+def event_stream(feed, max_streams=MAX_STREAMS):
+    """
+    Return an EventStream for <feed>, or a 503 once <max_streams> clients are
+    connected so the page falls back to polling.
+    """
+    if feed.streams >= max_streams:
+        return Response('Too many streams', 503)
+    return EventStream(feed)
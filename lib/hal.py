@@ -0,0 +1,13 @@
+# Hardware abstraction layer.
+#
+# The firmware reaches the hardware only through the MicroPython modules
+# machine, rp2, network, framebuf, micropython and utime. On the board these
+# are the built-ins. Under CPython the simulator in sim/ installs modules with
+# the same names, backed by a virtual clock and simulated devices (see
+# sim/__init__.py), so the same code runs on both. What differs between the
+# two runtimes beyond that is resolved here, today only the name of asyncio.
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
@@ -0,0 +1,186 @@
+# Fixed size telemetry history.
+#
+# Samples live in preallocated array.array columns used as a ring buffer, so
+# recording a sample never allocates and the memory use is known at boot:
+# size * (4 + len(fields) * 2 + 1) bytes. Sensor values are stored as tenths
+# in signed 16 bit integers, MISSING marks a failed or not yet available
+# reading.
+
+import array
+
+MISSING = -32768
+FIELDS = ('soil', 'temperature', 'humidity')
+MAX_BUCKETS = 200
+
+
+def _to_int(value):
+    if value is None or isinstance(value, str):
+        return MISSING
+    return int(round(value * 10))
+
+
+class History:
+    def __init__(self, size=1440, fields=FIELDS):
+        """
+        :param size: [default: 1440] number of samples kept, two hours at one sample per 5s
+        :param fields: [default: FIELDS] names of the recorded values
+        """
+        self.size = size
+        self.fields = tuple(fields)
+        self.count = 0
+        self.head = 0
+        self.timestamps = array.array('i', [0] * size)
+        self.columns = [array.array('h', [MISSING] * size) for _ in self.fields]
+        self.pump = array.array('B', [0] * size)
+
+    def memory(self):
+        return self.size * (4 + len(self.fields) * 2 + 1)
+
+    def column(self, field):
+        return self.columns[self.fields.index(field)]
+
+    def append(self, timestamp, values, pump_event=False):
+        """
+        :param timestamp: time of the sample in seconds
+        :param values: sequence of values in the order of fields, None or a string for a missing one
+        :param pump_event: [default: False] the pump ran since the previous sample
+        """
+        i = self.head
+        self.timestamps[i] = int(timestamp)
+        columns = self.columns
+        for c in range(len(columns)):
+            columns[c][i] = _to_int(values[c])
+        self.pump[i] = 1 if pump_event else 0
+        self.head = (i + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def _index(self, n):
+        # index of the n-th oldest sample
+        return (self.head - self.count + n) % self.size
+
+    def oldest(self):
+        return self.timestamps[self._index(0)] if self.count else None
+
+    def newest(self):
+        return self.timestamps[self._index(self.count - 1)] if self.count else None
+
+    def trend(self, field, start=None):
+        """
+        Least squares slope of <field> over the newest samples, going back to
+        <start> or to the last pump event, whichever comes first.
+
+        :return: (slope in units per second or None, valid samples, span in seconds)
+        """
+        column = self.column(field)
+        newest = None
+        oldest = None
+        n = 0
+        sx = sy = sxx = sxy = 0
+        for k in range(self.count - 1, -1, -1):
+            i = self._index(k)
+            timestamp = self.timestamps[i]
+            if start is not None and timestamp < start:
+                break
+            if self.pump[i]:
+                break
+            value = column[i]
+            if value == MISSING:
+                continue
+            if newest is None:
+                newest = timestamp
+            oldest = timestamp
+            # relative to the newest sample to keep the sums small
+            x = timestamp - newest
+            n += 1
+            sx += x
+            sy += value
+            sxx += x * x
+            sxy += x * value
+        if n < 2:
+            return None, n, 0
+        denominator = n * sxx - sx * sx
+        if not denominator:
+            return None, n, 0
+        return (n * sxy - sx * sy) / denominator / 10, n, newest - oldest
+
+    def downsample(self, start=None, end=None, step=None):
+        """
+        Aggregate samples between <start> and <end> (inclusive) into buckets of
+        <step> seconds. Every bucket is a list of
+        [time, count, <field>_min, <field>_max, <field>_mean, ..., pump_events]
+        with the fields in order, sensor values are None when the bucket has no
+        valid reading. The step is widened when it would produce more than
+        MAX_BUCKETS buckets.
+
+        :return: (step, buckets)
+        """
+        if not self.count:
+            return step or 0, []
+        if start is None:
+            start = self.oldest()
+        if end is None:
+            end = self.newest()
+        if end < start:
+            return step or 0, []
+        span = end - start + 1
+        if not step or step < 1:
+            step = max(1, span // 100)
+        if span // step > MAX_BUCKETS:
+            step = (span + MAX_BUCKETS - 1) // MAX_BUCKETS
+
+        columns = self.columns
+        channels = len(columns)
+        pump_slot = 2 + channels * 3
+        buckets = []
+        bucket = None
+        bucket_start = None
+        sums = [0] * channels
+        valid = [0] * channels
+        for n in range(self.count):
+            i = self._index(n)
+            timestamp = self.timestamps[i]
+            if timestamp < start:
+                continue
+            if timestamp > end:
+                break
+            offset = start + (timestamp - start) // step * step
+            if offset != bucket_start:
+                if bucket is not None:
+                    self._close(bucket, sums, valid)
+                    buckets.append(bucket)
+                bucket_start = offset
+                bucket = [None] * (pump_slot + 1)
+                bucket[0] = offset
+                bucket[1] = 0
+                bucket[pump_slot] = 0
+                for c in range(channels):
+                    sums[c] = 0
+                    valid[c] = 0
+            bucket[1] += 1
+            bucket[pump_slot] += self.pump[i]
+            for c in range(channels):
+                value = columns[c][i]
+                if value == MISSING:
+                    continue
+                base = 2 + c * 3
+                if bucket[base] is None or value < bucket[base]:
+                    bucket[base] = value
+                if bucket[base + 1] is None or value > bucket[base + 1]:
+                    bucket[base + 1] = value
+                sums[c] += value
+                valid[c] += 1
+        if bucket is not None:
+            self._close(bucket, sums, valid)
+            buckets.append(bucket)
+        return step, buckets
+
+    def _close(self, bucket, sums, valid):
+        # turn tenths back into sensor units and compute the means
+        for c in range(len(sums)):
+            base = 2 + c * 3
+            if not valid[c]:
+                continue
+            bucket[base] /= 10
+            bucket[base + 1] /= 10
+            bucket[base + 2] = round(sums[c] / valid[c] / 10, 1)
@@ -0,0 +1,448 @@
+# Small asyncio HTTP/1.1 server, works with uasyncio on the Pico W and with
+# asyncio on CPython (handy for profiling the routes on a Linux host).
+#
+# Every connection is served by its own task, so one slow client no longer
+# stalls everybody else. Reads are guarded by a per-connection timeout and
+# keep-alive can be switched on to reuse a connection for several requests.
+#
+# Requests are read into a preallocated buffer (readinto on uasyncio) and
+# parsed incrementally, a request line or header may arrive in any number of
+# pieces and the body may be larger than the buffer. Router dispatches on the
+# path with one dict lookup and checks the method.
+#
+# A response with upgrade set (a WebSocket) takes the connection over once
+# its head is written, HTTPServer hands it the reader and stops reading
+# requests on it.
+
+import time
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+try:
+    from micropython import native
+except ImportError:
+    def native(function):
+        return function
+
+
+READ_TIMEOUT = 5
+KEEP_ALIVE_MAX = 20
+MAX_HEADERS = 32
+MAX_BODY = 4096
+BUFFER_SIZE = 1024
+HEX_DIGITS = '0123456789abcdefABCDEF'
+
+STATUS_TEXT = {
+    101: 'Switching Protocols',
+    200: 'OK',
+    204: 'No Content',
+    302: 'Found',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    408: 'Request Timeout',
+    413: 'Payload Too Large',
+    426: 'Upgrade Required',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class HTTPError(ValueError):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def unquote(text, plus=False):
+    """
+    Percent-decode <text>, malformed escapes are kept as they are.
+
+    :param plus: [default: False] decode '+' as a space, as in query strings and forms
+    """
+    if plus and '+' in text:
+        text = text.replace('+', ' ')
+    if '%' not in text:
+        return text
+    parts = text.split('%')
+    data = bytearray(parts[0].encode())
+    for part in parts[1:]:
+        if len(part) >= 2 and part[0] in HEX_DIGITS and part[1] in HEX_DIGITS:
+            data.append(int(part[:2], 16))
+            data.extend(part[2:].encode())
+        else:
+            data.extend(b'%' + part.encode())
+    return bytes(data).decode()
+
+
+def parse_query(query):
+    """
+    :return: dict of the decoded parameters of a query string or form body,
+        the value of a key without '=' is an empty string, raises HTTPError
+        400 if an escape decodes to invalid UTF-8
+    """
+    params = {}
+    for pair in query.split('&'):
+        key, _, value = pair.partition('=')
+        if key:
+            try:
+                params[unquote(key, True)] = unquote(value, True)
+            except UnicodeError:
+                raise HTTPError(400, 'Malformed query')
+    return params
+
+
+class Request:
+    def __init__(self, method, path, query, headers, body):
+        """
+        :param path: percent-decoded path
+        :param query: query string as sent, parsed by the params property
+        """
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self._params = None
+
+    @property
+    def params(self):
+        if self._params is None:
+            self._params = parse_query(self.query) if self.query else {}
+        return self._params
+
+    def form(self):
+        """
+        :return: dict of the fields of an application/x-www-form-urlencoded body
+        """
+        return parse_query(bytes(self.body).decode()) if self.body else {}
+
+
+if hasattr(bytearray, 'find'):
+    def _find_lf(buffer, start, end):
+        return buffer.find(b'\n', start, end)
+else:
+    # MicroPython's bytearray has no find()
+    @native
+    def _find_lf(buffer, start, end):
+        for i in range(start, end):
+            if buffer[i] == 10:
+                return i
+        return -1
+
+
+HEAD = 0
+BODY = 1
+
+
+class RequestParser:
+    def __init__(self, size=BUFFER_SIZE, max_body=MAX_BODY):
+        """
+        Incremental HTTP/1.1 request parser working on a preallocated buffer.
+        Fill space() with received bytes, report them with received() and call
+        parse() until it returns a Request. The search for the end of the
+        head resumes where the previous call stopped, the head is then
+        decoded and split in one go.
+
+        :param size: [default: BUFFER_SIZE] bytes of the buffer, the longest request head it accepts
+        :param max_body: [default: MAX_BODY] larger bodies are refused with 413
+        """
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.max_body = max_body
+        self.start = 0
+        self.end = 0
+        self.reset()
+
+    def reset(self):
+        # ready for the next request, bytes already received are kept
+        self.state = HEAD
+        self.request = None
+        self.body = None
+        self.length = 0
+        self._got = 0
+        self._scanned = self.start
+
+    def space(self):
+        """
+        :return: memoryview of the free part of the buffer
+        """
+        if self.start == self.end:
+            self.start = self.end = self._scanned = 0
+        elif self.end == len(self.buffer) and self.start:
+            # move the incomplete head to the front
+            pending = bytes(self.view[self.start:self.end])
+            self.end = len(pending)
+            self.buffer[:self.end] = pending
+            self._scanned -= self.start
+            self.start = 0
+        return self.view[self.end:]
+
+    def received(self, count):
+        self.end += count
+
+    def _head_end(self):
+        # index after the empty line ending the head, -1 if it isn't there yet
+        buffer = self.buffer
+        end = self.end
+        # stray line breaks between requests
+        while self.start < end and buffer[self.start] in (10, 13):
+            self.start += 1
+        i = max(self._scanned, self.start)
+        while True:
+            i = _find_lf(buffer, i, end)
+            if i < 0 or i + 1 >= end:
+                break
+            if buffer[i + 1] == 10:
+                return i + 2
+            if buffer[i + 1] == 13:
+                if i + 2 >= end:
+                    break
+                if buffer[i + 2] == 10:
+                    return i + 3
+            i += 1
+        # continue from the last line break next time
+        self._scanned = i if i >= 0 else end
+        if self.start == 0 and end == len(buffer):
+            raise HTTPError(431, 'Request head too large')
+        return -1
+
+    def parse(self):
+        """
+        :return: the Request once it is complete, None if more bytes are needed
+        """
+        if self.state == HEAD:
+            end = self._head_end()
+            if end < 0:
+                return None
+            lines = str(self.view[self.start:end], 'utf-8').split('\n')
+            self.start = self._scanned = end
+            parts = lines[0].split()
+            if len(parts) < 2:
+                raise HTTPError(400, 'Malformed request line')
+            if len(lines) > MAX_HEADERS + 3:
+                raise HTTPError(431, 'Too many headers')
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                name = name.strip()
+                if name:
+                    headers[name.lower()] = value.strip()
+            try:
+                self.length = int(headers.get('content-length', 0))
+            except ValueError:
+                raise HTTPError(400, 'Bad Content-Length')
+            if self.length > self.max_body:
+                raise HTTPError(413, 'Body too large')
+            path, _, query = parts[1].partition('?')
+            self.request = Request(parts[0], unquote(path), query, headers, b'')
+            if not self.length:
+                return self._complete()
+            self.body = bytearray(self.length)
+            self.state = BODY
+        count = min(self.end - self.start, self.length - self._got)
+        self.body[self._got:self._got + count] = self.view[self.start:self.start + count]
+        self._got += count
+        self.start += count
+        self._scanned = self.start
+        if self._got < self.length:
+            return None
+        self.request.body = self.body
+        return self._complete()
+
+    def _complete(self):
+        request = self.request
+        self.reset()
+        return request
+
+
+class Router:
+    def __init__(self, fallback=None):
+        """
+        Dispatch requests on their path.
+
+        :param fallback: [default: None] handler for unknown paths, a 404 if None
+        """
+        self.routes = {}
+        self.fallback = fallback
+
+    def add(self, path, handler, methods=('GET',)):
+        self.routes[path] = (methods, handler)
+
+    def route(self, path, methods=('GET',)):
+        """
+        Decorator adding the function as the handler of <path>.
+        """
+        def decorator(handler):
+            self.add(path, handler, methods)
+            return handler
+        return decorator
+
+    def __call__(self, request):
+        entry = self.routes.get(request.path)
+        if entry is None:
+            if self.fallback is not None:
+                return self.fallback(request)
+            return Response('Not found', 404)
+        methods, handler = entry
+        if request.method not in methods:
+            return Response('Method not allowed', 405, headers=[('Allow', ', '.join(methods))])
+        return handler(request)
+
+
+class Response:
+    # True if serve(reader, writer) takes the connection over after write()
+    upgrade = False
+
+    def __init__(self, body=b'', status=200, content_type='text/plain', headers=None):
+        """
+        :param body: str or bytes sent as the response body
+        :param status: HTTP status code
+        :param content_type: value of the Content-Type header
+        :param headers: [default: None] list of (name, value) tuples with extra headers
+        """
+        if isinstance(body, str):
+            body = body.encode()
+        self.body = body
+        self.status = status
+        self.content_type = content_type
+        self.headers = headers
+
+    def head(self, keep_alive):
+        lines = ['HTTP/1.1 {} {}'.format(self.status, STATUS_TEXT.get(self.status, 'OK'))]
+        if self.content_type:
+            lines.append('Content-Type: ' + self.content_type)
+        lines.append('Content-Length: {}'.format(len(self.body)))
+        if self.headers:
+            for name, value in self.headers:
+                lines.append('{}: {}'.format(name, value))
+        lines.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+    async def write(self, writer, keep_alive):
+        writer.write(self.head(keep_alive))
+        if self.body:
+            writer.write(self.body)
+        await writer.drain()
+
+
+class HTTPServer:
+    def __init__(self, handler, read_timeout=READ_TIMEOUT, keep_alive=False, keep_alive_max=KEEP_ALIVE_MAX,
+                 observer=None, buffer_size=BUFFER_SIZE, max_body=MAX_BODY):
+        """
+        :param handler: callable taking a Request and returning a Response
+        :param read_timeout: [default: READ_TIMEOUT] seconds to wait for a complete request
+        :param keep_alive: [default: False] serve more than one request per connection
+        :param keep_alive_max: [default: KEEP_ALIVE_MAX] requests served before the connection is closed
+        :param observer: [default: None] callable(request, response, us) called after every response was written,
+            us is the time from the parsed request to the written response (needs time.ticks_us)
+        :param buffer_size: [default: BUFFER_SIZE] receive buffer of every connection
+        :param max_body: [default: MAX_BODY] larger request bodies are refused
+        """
+        self.handler = handler
+        self.read_timeout = read_timeout
+        self.keep_alive = keep_alive
+        self.keep_alive_max = keep_alive_max
+        self.observer = observer
+        self.buffer_size = buffer_size
+        self.max_body = max_body
+        self.server = None
+        self.connections = 0
+        self.requests = 0
+        # parsers of closed connections, their buffers are reused
+        self._parsers = []
+
+    async def start(self, host='0.0.0.0', port=80, backlog=5):
+        self.server = await asyncio.start_server(self._serve_client, host, port, backlog=backlog)
+        return self.server
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+    async def wait_closed(self):
+        if self.server is not None:
+            await self.server.wait_closed()
+
+    async def _read_request(self, reader, parser):
+        readinto = getattr(reader, 'readinto', None)
+        while True:
+            request = parser.parse()
+            if request is not None:
+                return request
+            space = parser.space()
+            if readinto is not None:
+                count = await readinto(space)
+            else:
+                # asyncio on CPython has no readinto
+                data = await reader.read(len(space))
+                count = len(data)
+                space[:count] = data
+            if not count:
+                if parser.state != HEAD or parser.start != parser.end:
+                    raise EOFError
+                return None
+            parser.received(count)
+
+    async def _serve_client(self, reader, writer):
+        self.connections += 1
+        served = 0
+        parser = self._parsers.pop() if self._parsers else RequestParser(self.buffer_size, self.max_body)
+        parser.start = parser.end = 0
+        parser.reset()
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader, parser), self.read_timeout)
+                except asyncio.TimeoutError:
+                    break
+                except HTTPError as e:
+                    await Response(str(e), e.status).write(writer, False)
+                    break
+                except ValueError:
+                    await Response('Bad request', 400).write(writer, False)
+                    break
+                if request is None:
+                    break
+
+                served += 1
+                self.requests += 1
+                if self.observer is not None:
+                    started = time.ticks_us()
+                keep_alive = (
+                    self.keep_alive
+                    and served < self.keep_alive_max
+                    and request.headers.get('connection', '').lower() != 'close'
+                )
+                try:
+                    response = self.handler(request)
+                except HTTPError as e:
+                    # e.g. a malformed query, only found when the handler reads the params
+                    response = Response(str(e), e.status)
+                except Exception as e:
+                    print('Request handler failed:', e)
+                    response = Response('Internal error', 500)
+                    keep_alive = False
+                await response.write(writer, keep_alive)
+                if self.observer is not None:
+                    self.observer(request, response, time.ticks_diff(time.ticks_us(), started))
+                if response.upgrade:
+                    await response.serve(reader, writer)
+                    break
+                if not keep_alive:
+                    break
+        except (OSError, EOFError):
+            pass
+        finally:
+            self.connections -= 1
+            self._parsers.append(parser)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
@@ -0,0 +1,242 @@
+# Runtime metrics, exported in the Prometheus text format and as JSON.
+#
+# Everything is allocated when a metric is registered. Label values are
+# declared up front and every metric keeps one row per value in array.array
+# columns, plus an 'other' row for values it doesn't know. Recording is a
+# dict lookup and a few integer additions, nothing is allocated, so the
+# instrumentation stays on in production. Values other objects count anyway
+# (DHT failures, display bytes, pump pulses) are not mirrored, a callable
+# reads them when the metrics are exported.
+
+import array
+import gc
+import time
+
+OTHER = 'other'
+# microseconds
+LATENCY_BUCKETS = (1000, 5000, 10000, 25000, 50000, 100000, 250000, 1000000)
+CALLBACK_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 100000)
+
+
+def _format(value):
+    if isinstance(value, float):
+        return '{:.6f}'.format(value).rstrip('0').rstrip('.')
+    return str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=None, label='label', read=None):
+        """
+        :param name: metric name without the prefix of the registry
+        :param help: one line description
+        :param labels: [default: None] tuple of the values of the label, None for an unlabelled metric. Values
+            recorded for any other label go to an extra row 'other'
+        :param label: [default: 'label'] name of the label
+        :param read: [default: None] callable returning the value, a sequence in the order of <labels> for a labelled metric
+        """
+        self.name = name
+        self.help = help
+        self.label = label
+        # a read metric has no values to record, so no need for 'other'
+        self.labels = (tuple(labels) + ((OTHER,) if read is None else ())) if labels else None
+        self.read = read
+        self._rows = {value: row for row, value in enumerate(self.labels)} if self.labels else {}
+        self._other = len(self.labels) - 1 if self.labels else 0
+        self.values = array.array('i', [0] * (len(self.labels) if self.labels else 1))
+
+    def current(self):
+        if self.read is None:
+            return self.values
+        value = self.read()
+        return value if self.labels else (value,)
+
+    def _suffix(self, row, extra=None):
+        pairs = []
+        if self.labels:
+            pairs.append('{}="{}"'.format(self.label, self.labels[row]))
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def prometheus(self, prefix, lines):
+        name = prefix + self.name
+        lines.append('# HELP {} {}'.format(name, self.help))
+        lines.append('# TYPE {} {}'.format(name, self.kind))
+        for row, value in enumerate(self.current()):
+            if value is not None:
+                lines.append('{}{} {}'.format(name, self._suffix(row), _format(value)))
+
+    def snapshot(self):
+        values = self.current()
+        if not self.labels:
+            return values[0]
+        # rows still at zero are left out, the JSON stays small
+        return {label: values[row] for row, label in enumerate(self.labels) if values[row]}
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, label=None, n=1):
+        self.values[self._rows.get(label, self._other)] += n
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, label=None):
+        self.values[self._rows.get(label, self._other)] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets, labels=None, label='label', scale=1000000):
+        """
+        :param buckets: ascending upper bounds of the buckets, integers in the unit of the observed values
+        :param scale: [default: 1000000] exported values are divided by it, microseconds become seconds
+        """
+        super().__init__(name, help, labels, label)
+        self.buckets = tuple(buckets)
+        self.scale = scale
+        rows = len(self.values)
+        self._width = len(self.buckets) + 1
+        self.counts = array.array('I', [0] * (rows * self._width))
+        # the sum is kept as whole units of <scale> and the remainder, a
+        # single small int would overflow into a heap allocated long
+        self.sums = array.array('I', [0] * rows)
+        self.remainders = array.array('I', [0] * rows)
+
+    def observe(self, value, label=None):
+        row = self._rows.get(label, self._other)
+        if value < 0:
+            value = 0
+        buckets = self.buckets
+        i = 0
+        n = len(buckets)
+        while i < n and value > buckets[i]:
+            i += 1
+        self.counts[row * self._width + i] += 1
+        self.values[row] += 1
+        remainder = self.remainders[row] + value
+        if remainder >= self.scale:
+            self.sums[row] += remainder // self.scale
+            remainder %= self.scale
+        self.remainders[row] = remainder
+
+    def total(self, row):
+        return self.sums[row] + self.remainders[row] / self.scale
+
+    def prometheus(self, prefix, lines):
+        name = prefix + self.name
+        lines.append('# HELP {} {}'.format(name, self.help))
+        lines.append('# TYPE {} histogram'.format(name))
+        for row in range(len(self.values)):
+            if self.labels and not self.values[row]:
+                continue
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += self.counts[row * self._width + i]
+                lines.append('{}_bucket{} {}'.format(
+                    name, self._suffix(row, 'le="{}"'.format(_format(bound / self.scale))), cumulative))
+            lines.append('{}_bucket{} {}'.format(name, self._suffix(row, 'le="+Inf"'), self.values[row]))
+            lines.append('{}_sum{} {}'.format(name, self._suffix(row), _format(self.total(row))))
+            lines.append('{}_count{} {}'.format(name, self._suffix(row), self.values[row]))
+
+    def _row_snapshot(self, row):
+        start = row * self._width
+        return {
+            'count': self.values[row],
+            'sum': self.total(row),
+            'counts': list(self.counts[start:start + self._width]),
+        }
+
+    def snapshot(self):
+        # counts has one entry per bound in le and a last one above all of them
+        if not self.labels:
+            result = self._row_snapshot(0)
+        else:
+            result = {'values': {label: self._row_snapshot(row) for row, label in enumerate(self.labels) if self.values[row]}}
+        result['le'] = [bound / self.scale for bound in self.buckets]
+        return result
+
+
+class Heap:
+    def __init__(self):
+        """
+        Free heap and garbage collections. MicroPython has no hook for a
+        collection, sample() counts the times the allocated heap shrank since
+        the previous call, so the count is a lower bound.
+        """
+        self.collections = 0
+        self._allocated = 0
+
+    def sample(self):
+        if not hasattr(gc, 'mem_alloc'):
+            return
+        allocated = gc.mem_alloc()
+        if allocated < self._allocated:
+            self.collections += 1
+        self._allocated = allocated
+
+    def free(self):
+        return gc.mem_free() if hasattr(gc, 'mem_free') else None
+
+    def runs(self):
+        if hasattr(gc, 'get_stats'):
+            # CPython counts them itself
+            return sum(generation['collections'] for generation in gc.get_stats())
+        return self.collections
+
+
+def timed(callback, histogram, label=None):
+    """
+    Wrap a timer callback, the duration of every call is observed in <histogram>.
+    """
+    def wrapper(arg):
+        started = time.ticks_us()
+        try:
+            callback(arg)
+        finally:
+            histogram.observe(time.ticks_diff(time.ticks_us(), started), label)
+    return wrapper
+
+
+class Metrics:
+    def __init__(self, prefix=''):
+        """
+        :param prefix: [default: ''] put in front of every metric name
+        """
+        self.prefix = prefix
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=None, label='label', read=None):
+        return self.add(Counter(name, help, labels, label, read))
+
+    def gauge(self, name, help, labels=None, label='label', read=None):
+        return self.add(Gauge(name, help, labels, label, read))
+
+    def histogram(self, name, help, buckets, labels=None, label='label', scale=1000000):
+        return self.add(Histogram(name, help, buckets, labels, label, scale))
+
+    def prometheus(self):
+        """
+        :return: all metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for metric in self.metrics:
+            metric.prometheus(self.prefix, lines)
+        lines.append('')
+        return '\n'.join(lines)
+
+    def snapshot(self):
+        """
+        :return: dict of the current values by metric name, histograms as count, sum and per bucket counts
+        """
+        return {metric.name: metric.snapshot() for metric in self.metrics}
@@ -45,19 +45,23 @@ class slice_maker_class:
 
 slice_maker = slice_maker_class()
 
+# RP2040 PIO register addresses, used to feed the TX FIFO by DMA
+PIO_BASE = (0x50200000, 0x50300000)
+TXF0_OFFSET = 0x10
+
 
 # Delay here is the reset time. You need a pause to reset the LED strip back to the initial LED
 # however, if you have quite a bit of processing to do before the next time you update the strip
 # you could put in delay=0 (or a lower delay)
 #
-# Class supports different order of individual colors (GRB, RGB, WRGB, GWRB ...). In order to achieve
-# this, we need to flip the indexes: in 'RGBW', 'R' is on index 0, but we need to shift it left by 3 * 8bits,
-# so in it's inverse, 'WBGR', it has exactly right index. Since micropython doesn't have [::-1] and recursive rev()
-# isn't too efficient we simply do that by XORing (operator ^) each index with 3 (0b11) to make this flip.
-# When dealing with just 'RGB' (3 letter string), this means same but reduced by 1 after XOR!.
-# Example: in 'GRBW' we want final form of 0bGGRRBBWW, meaning G with index 0 needs to be shifted 3 * 8bit ->
-# 'G' on index 0: 0b00 ^ 0b11 -> 0b11 (3), just as we wanted.
-# Same hold for every other index (and - 1 at the end for 3 letter strings).
+# Class supports different order of individual colors (GRB, RGB, WRGB, GWRB ...). Every pixel is one 32 bit
+# word holding the components in the order they are sent, the first letter of the mode in the top byte. A
+# component on index i of the mode is therefore shifted left by (3 - i) * 8 bits, and since micropython doesn't
+# have [::-1] and recursive rev() isn't too efficient we simply get 3 - i by XORing (operator ^) the index with
+# 3 (0b11). Example: in 'GRBW' we want final form of 0bGGRRBBWW, meaning G with index 0 needs to be shifted
+# 3 * 8bit -> 'G' on index 0: 0b00 ^ 0b11 -> 0b11 (3), just as we wanted.
+# The same shifts are used for 3 letter modes: the state machine shifts out the top 24 bits of a word and
+# the low byte stays 0, so 'GRB' gives 0bGGRRBB00 and the words go to the TX FIFO as they are stored.
 
 class Neopixel:
     # Micropython doesn't implement __slots__, but it's good to have a place
@@ -71,6 +75,11 @@ class Neopixel:
     #    'shift',      # shift amount for each component, in a tuple for (R,B,G,W)
     #    'delay',      # delay amount
     #    'brightnessvalue', # brightness scale factor 1..255
+    #    'offset',     # storage index of logical pixel 0, used by rotations
+    #    'dma',        # rp2.DMA channel feeding the state machine, or None
+    #    'gamma_value',# gamma correction exponent or None
+    #    'lut',        # bytearray(256): color component -> scaled (and gamma corrected) value
+    #    'inverse_lut',# bytearray(256): scaled value -> color component, used by get_pixel
     # ]
 
     def __init__(self, num_leds, state_machine, pin, mode="RGB", delay=0.0001):
@@ -95,12 +104,31 @@ class Neopixel:
                           (mode.index('B') ^ 3) * 8, (mode.index('W') ^ 3) * 8)
         else:
             self.sm = rp2.StateMachine(state_machine, ws2812, freq=8000000, sideset_base=Pin(pin))
-            self.shift = (((mode.index('R') ^ 3) - 1) * 8, ((mode.index('G') ^ 3) - 1) * 8,
-                          ((mode.index('B') ^ 3) - 1) * 8, 0)
+            # the PIO reads the top 24 bits, so keep the colors there already
+            # and the words can go to the state machine without shifting
+            self.shift = ((mode.index('R') ^ 3) * 8, (mode.index('G') ^ 3) * 8,
+                          (mode.index('B') ^ 3) * 8, 0)
         self.sm.active(1)
         self.num_leds = num_leds
         self.delay = delay
         self.brightnessvalue = 255
+        self.gamma_value = None
+        self.lut = bytearray(256)
+        self.inverse_lut = bytearray(256)
+        self._custom_lut = bytearray(256)
+        self._custom_bright = None
+        self._build_lut(self.lut, 255)
+        self.offset = 0
+        self._pixels_mv = memoryview(self.pixels)
+        self.dma = None
+        self._dma_ctrl = 0
+        self._txf = 0
+        if hasattr(rp2, 'DMA'):
+            # state machines 0-3 belong to PIO0, 4-7 to PIO1
+            pio = state_machine // 4
+            self.dma = rp2.DMA()
+            self._dma_ctrl = self.dma.pack_ctrl(size=2, inc_write=False, treq_sel=pio * 8 + state_machine % 4)
+            self._txf = PIO_BASE[pio] + TXF0_OFFSET + (state_machine % 4) * 4
 
     def brightness(self, brightness=None):
         """
@@ -117,11 +145,53 @@ class Neopixel:
                 brightness = 1
         if brightness > 255:
             brightness = 255
-        self.brightnessvalue = brightness
+        if brightness != self.brightnessvalue:
+            self.brightnessvalue = brightness
+            self._build_lut(self.lut, brightness)
+            self._custom_bright = None
+
+    def gamma(self, gamma=None):
+        """
+        Enable gamma correction of the color components, usually with a value
+        around 2.8, or disable it with None.
+
+        :param gamma: [default: None] gamma exponent or None to disable the correction
+        :return: None
+        """
+        self.gamma_value = gamma
+        self._build_lut(self.lut, self.brightnessvalue)
+        self._custom_bright = None
+
+    def _build_lut(self, lut, how_bright):
+        # lut[v] = round(gamma(v) * how_bright / 255), all integer once built
+        gamma = self.gamma_value
+        for v in range(256):
+            if gamma is not None:
+                v_in = int(((v / 255) ** gamma) * 255 + 0.5)
+            else:
+                v_in = v
+            lut[v] = (v_in * how_bright + 127) // 255
+        if lut is self.lut:
+            # scaled value -> color component, the inverse of the above
+            inverse = self.inverse_lut
+            for value in range(256):
+                v_in = min(255, value * 255 // how_bright)
+                if gamma is not None:
+                    v_in = int(((v_in / 255) ** (1 / gamma)) * 255 + 0.5)
+                inverse[value] = v_in
+
+    def _lut_for(self, how_bright):
+        if how_bright is None or how_bright == self.brightnessvalue:
+            return self.lut
+        if how_bright != self._custom_bright:
+            self._build_lut(self._custom_lut, max(0, min(255, how_bright)))
+            self._custom_bright = how_bright
+        return self._custom_lut
 
     def set_pixel_line_gradient(self, pixel1, pixel2, left_rgb_w, right_rgb_w, how_bright=None):
         """
         Create a gradient with two RGB colors between "pixel1" and "pixel2" (inclusive)
+        The interpolation is done in 16.16 fixed point in a single pass over the pixels.
 
         :param pixel1: Index of starting pixel (inclusive)
         :param pixel2: Index of ending pixel (inclusive)
@@ -134,25 +204,35 @@ class Neopixel:
             return
         right_pixel = max(pixel1, pixel2)
         left_pixel = min(pixel1, pixel2)
+        span = right_pixel - left_pixel
 
+        lut = self._lut_for(how_bright)
+        sh_R, sh_G, sh_B, sh_W = self.shift
         with_W = len(left_rgb_w) == 4 and self.W_in_mode
-        r_diff = right_rgb_w[0] - left_rgb_w[0]
-        g_diff = right_rgb_w[1] - left_rgb_w[1]
-        b_diff = right_rgb_w[2] - left_rgb_w[2]
-        if with_W:
-            w_diff = (right_rgb_w[3] - left_rgb_w[3])
-
-        for i in range(right_pixel - left_pixel + 1):
-            fraction = i / (right_pixel - left_pixel)
-            red = round(r_diff * fraction + left_rgb_w[0])
-            green = round(g_diff * fraction + left_rgb_w[1])
-            blue = round(b_diff * fraction + left_rgb_w[2])
-            # if it's (r, g, b, w)
-            if with_W:
-                white = round(w_diff * fraction + left_rgb_w[3])
-                self.set_pixel(left_pixel + i, (red, green, blue, white), how_bright)
-            else:
-                self.set_pixel(left_pixel + i, (red, green, blue), how_bright)
+        r_acc = left_rgb_w[0] << 16
+        g_acc = left_rgb_w[1] << 16
+        b_acc = left_rgb_w[2] << 16
+        w_acc = left_rgb_w[3] << 16 if with_W else 0
+        r_step = ((right_rgb_w[0] - left_rgb_w[0]) << 16) // span
+        g_step = ((right_rgb_w[1] - left_rgb_w[1]) << 16) // span
+        b_step = ((right_rgb_w[2] - left_rgb_w[2]) << 16) // span
+        w_step = ((right_rgb_w[3] - left_rgb_w[3]) << 16) // span if with_W else 0
+
+        pixels = self.pixels
+        num_leds = self.num_leds
+        index = (left_pixel + self.offset) % num_leds
+        for _ in range(span + 1):
+            pixels[index] = (lut[(w_acc + 0x8000) >> 16] << sh_W if with_W else 0) \
+                | lut[(b_acc + 0x8000) >> 16] << sh_B \
+                | lut[(r_acc + 0x8000) >> 16] << sh_R \
+                | lut[(g_acc + 0x8000) >> 16] << sh_G
+            r_acc += r_step
+            g_acc += g_step
+            b_acc += b_step
+            w_acc += w_step
+            index += 1
+            if index == num_leds:
+                index = 0
 
     def set_pixel_line(self, pixel1, pixel2, rgb_w, how_bright=None):
         """
@@ -167,37 +247,48 @@ class Neopixel:
         if pixel2 >= pixel1:
             self.set_pixel(slice_maker[pixel1:pixel2 + 1], rgb_w, how_bright)
 
-    def set_pixel(self, pixel_num, rgb_w, how_bright=None):
+    def encode(self, rgb_w, how_bright=None):
         """
-        Set red, green and blue (+ white) value of pixel on position <pixel_num>
-        pixel_num may be a 'slice' object, and then the operation is applied
-        to all pixels implied by the slice (most useful when called via __setitem__)
+        Convert a color to the raw word stored in the pixel array, with
+        brightness and gamma applied.
 
-        :param pixel_num: Index of pixel to be set or slice object representing multiple leds
         :param rgb_w: Tuple of form (r, g, b) or (r, g, b, w) representing color to be used
         :param how_bright: [default: None] Brightness of current interval. If None, use global brightness value
-        :return: None
+        :return: int
         """
-        if how_bright is None:
-            how_bright = self.brightness()
+        lut = self._lut_for(how_bright)
         sh_R, sh_G, sh_B, sh_W = self.shift
-        bratio = how_bright / 255.0
 
-        red = round(rgb_w[0] * bratio)
-        green = round(rgb_w[1] * bratio)
-        blue = round(rgb_w[2] * bratio)
+        red = lut[rgb_w[0]]
+        green = lut[rgb_w[1]]
+        blue = lut[rgb_w[2]]
         white = 0
         # if it's (r, g, b, w)
         if len(rgb_w) == 4 and self.W_in_mode:
-            white = round(rgb_w[3] * bratio)
+            white = lut[rgb_w[3]]
+
+        return white << sh_W | blue << sh_B | red << sh_R | green << sh_G
 
-        pix_value = white << sh_W | blue << sh_B | red << sh_R | green << sh_G
+    def set_pixel(self, pixel_num, rgb_w, how_bright=None):
+        """
+        Set red, green and blue (+ white) value of pixel on position <pixel_num>
+        pixel_num may be a 'slice' object, and then the operation is applied
+        to all pixels implied by the slice (most useful when called via __setitem__)
+
+        :param pixel_num: Index of pixel to be set or slice object representing multiple leds
+        :param rgb_w: Tuple of form (r, g, b) or (r, g, b, w) representing color to be used
+        :param how_bright: [default: None] Brightness of current interval. If None, use global brightness value
+        :return: None
+        """
+        pix_value = self.encode(rgb_w, how_bright)
         # set some subset, if pixel_num is a slice:
+        num_leds = self.num_leds
+        offset = self.offset
         if type(pixel_num) is slice:
-            for i in range(*pixel_num.indices(self.num_leds)):
-                self.pixels[i] = pix_value
+            for i in range(*pixel_num.indices(num_leds)):
+                self.pixels[(i + offset) % num_leds] = pix_value
         else:
-            self.pixels[pixel_num] = pix_value
+            self.pixels[(pixel_num + offset) % num_leds] = pix_value
 
     def get_pixel(self, pixel_num):
         """
@@ -206,18 +297,19 @@ class Neopixel:
         :param pixel_num: Index of pixel to be set
         :return rgb_w: Tuple of form (r, g, b) or (r, g, b, w) representing color to be used
         """
-        balance = self.pixels[pixel_num]
+        balance = self.pixels[(pixel_num + self.offset) % self.num_leds]
         sh_R, sh_G, sh_B, sh_W = self.shift
         if self.W_in_mode:
             w = (balance >> sh_W) & 255
         b = (balance >> sh_B) & 255
         r = (balance >> sh_R) & 255
         g = (balance >> sh_G) & 255
-        red = int(r * 255 / self.brightness() )
-        green = int(g * 255 / self.brightness() )
-        blue = int(b * 255 / self.brightness() )
+        inverse = self.inverse_lut
+        red = inverse[r]
+        green = inverse[g]
+        blue = inverse[b]
         if self.W_in_mode:
-            white = int(w * 255 / self.brightness() )
+            white = inverse[w]
             return (red,green,blue,white)
         else:
             return (red,green,blue)
@@ -295,40 +387,59 @@ class Neopixel:
 
     def rotate_left(self, num_of_pixels=None):
         """
-        Rotate <num_of_pixels> pixels to the left
+        Rotate <num_of_pixels> pixels to the left.
+        Only the logical start of the strip moves, pixel data is not copied.
 
         :param num_of_pixels: Number of pixels to be shifted to the left. If None, it shifts for 1.
         :return: None
         """
         if num_of_pixels is None:
             num_of_pixels = 1
-        self.pixels = self.pixels[num_of_pixels:] + self.pixels[:num_of_pixels]
+        self.offset = (self.offset + num_of_pixels) % self.num_leds
 
     def rotate_right(self, num_of_pixels=None):
         """
-        Rotate <num_of_pixels> pixels to the right
+        Rotate <num_of_pixels> pixels to the right.
+        Only the logical start of the strip moves, pixel data is not copied.
 
         :param num_of_pixels: Number of pixels to be shifted to the right. If  None, it shifts for 1.
         :return: None
         """
         if num_of_pixels is None:
             num_of_pixels = 1
-        num_of_pixels = -1 * num_of_pixels
-        self.pixels = self.pixels[num_of_pixels:] + self.pixels[:num_of_pixels]
+        self.offset = (self.offset - num_of_pixels) % self.num_leds
+
+    def _push(self, buf):
+        if self.dma is None:
+            # one call, the loop over the words runs in C
+            self.sm.put(buf)
+            return
+        self.dma.config(read=buf, write=self._txf, count=len(buf), ctrl=self._dma_ctrl, trigger=True)
+        while self.dma.active():
+            pass
 
     def show(self):
         """
         Send data to led-strip, making all changes on leds have an effect.
         This method should be used after every method that changes the state of leds or after a chain of changes.
+        The whole pixel array goes out in one bulk transfer (two when the strip is rotated).
         :return: None
         """
-        # If mode is RGB, we cut 8 bits of, otherwise we keep all 32
-        cut = 8
-        if self.W_in_mode:
-            cut = 0
-        sm_put = self.sm.put
-        for pixval in self.pixels:
-            sm_put(pixval, cut)
+        offset = self.offset
+        self._push(self._pixels_mv[offset:])
+        if offset:
+            self._push(self._pixels_mv[:offset])
+        time.sleep(self.delay)
+
+    def show_frame(self, frame):
+        """
+        Send a prepared frame to the led-strip without touching the pixel array.
+        Used by animations that precompute their frames.
+
+        :param frame: array('I') or memoryview of num_leds words made with encode()
+        :return: None
+        """
+        self._push(frame)
         time.sleep(self.delay)
 
     def fill(self, rgb_w, how_bright=None):
@@ -348,4 +459,7 @@ class Neopixel:
 
         :return: None
         """
-        self.pixels = array.array("I", [0] * self.num_leds)
\ No newline at end of file
+        pixels = self.pixels
+        for i in range(self.num_leds):
+            pixels[i] = 0
+        self.offset = 0
\ No newline at end of file
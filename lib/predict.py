@@ -0,0 +1,177 @@
+# Predictive watering policy.
+#
+# The threshold policy waits until a zone is at its threshold and then waters
+# in fixed pump_time bursts until it recovers. This policy learns two numbers
+# per zone instead:
+#
+#   drying    - how fast the moisture falls, a least squares fit over the
+#               recorded history since the last watering
+#   response  - how many percent one second of pumping adds, an average of
+#               the gain measured once the water of a pulse has soaked in
+#
+# and waters once the threshold would be crossed within <lead> seconds, with a
+# single pulse sized to lift the zone <band> percent above its threshold. The
+# lead is hours rather than minutes: the sensor reports whole percent, a
+# prediction less than one percent ahead waters at the threshold anyway. A
+# pulse may be up to <max_bursts> pump_time bursts long, so one activation
+# replaces the series of fixed bursts the threshold policy needs for the same
+# amount of water. Until a zone has learned both numbers it behaves like the
+# threshold policy, which is also kept as a safety net.
+
+import time
+
+LEAD = 10800
+BAND = 40
+# the target never gets closer than this to saturated soil
+HEADROOM = 10
+MAX_BURSTS = 3
+WINDOW = 7200
+SETTLE = 600
+MIN_SPAN = 1200
+REFIT_PERIOD = 300
+COOLDOWN = 900
+MIN_PULSE_MS = 500
+RESPONSE_ALPHA = 0.5
+
+
+class SoilModel:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # percent per second, positive while the soil dries
+        self.drying = None
+        # percent per second of pumping
+        self.response = None
+        self.fits = 0
+        self.fit_samples = 0
+        self.fit_span = 0
+        self.pulses = 0
+        self.last_pulse = None
+        self.last_fit = None
+        # (zone, moisture before, pulse ms) of a pulse waiting to settle
+        self.pending = None
+
+    def state(self):
+        return {
+            'drying_per_hour': round(self.drying * 3600, 2) if self.drying is not None else None,
+            'response_per_second': round(self.response, 2) if self.response is not None else None,
+            'fits': self.fits,
+            'fit_samples': self.fit_samples,
+            'fit_span': self.fit_span,
+            'pulses': self.pulses,
+        }
+
+
+class PredictivePolicy:
+    name = 'predictive'
+
+    def __init__(self, history, fields, lead=LEAD, band=BAND, window=WINDOW, cooldown=COOLDOWN, max_bursts=MAX_BURSTS,
+                 clock=time.time):
+        """
+        :param history: History the drying rate is fitted on
+        :param fields: dict of zone name -> history field with the moisture of the zone
+        :param lead: [default: LEAD] seconds ahead the threshold crossing is predicted
+        :param band: [default: BAND] percent above the threshold a pulse aims for
+        :param window: [default: WINDOW] seconds of history used by a fit
+        :param cooldown: [default: COOLDOWN] seconds after a pulse before the next early one
+        :param max_bursts: [default: MAX_BURSTS] longest pulse in pump_time bursts of the zone
+        :param clock: [default: time.time] time source matching the history timestamps
+        """
+        self.history = history
+        self.fields = fields
+        self.lead = lead
+        self.band = band
+        self.window = window
+        self.cooldown = cooldown
+        self.max_bursts = max_bursts
+        self.clock = clock
+        self.models = {name: SoilModel() for name in fields}
+
+    def reset(self, name=None):
+        for zone_name, model in self.models.items():
+            if name is None or zone_name == name:
+                model.reset()
+
+    def observe(self):
+        """
+        Refit the drying rate of the zones that are due, called after a sample
+        is recorded.
+        """
+        now = self.clock()
+        for name, model in self.models.items():
+            if model.pending is not None and now - model.last_pulse >= SETTLE:
+                self._learn_response(model, now)
+            if model.last_fit is not None and now - model.last_fit < REFIT_PERIOD:
+                continue
+            model.last_fit = now
+            start = now - self.window
+            if model.last_pulse is not None:
+                start = max(start, model.last_pulse + SETTLE)
+            slope, samples, span = self.history.trend(self.fields[name], start)
+            if slope is None or span < MIN_SPAN:
+                continue
+            model.drying = max(0, -slope)
+            model.fits += 1
+            model.fit_samples = samples
+            model.fit_span = span
+
+    def wants_water(self, zone):
+        if not zone.enabled or zone.moisture is None:
+            return False
+        if zone.moisture <= zone.treshold:
+            return True
+        model = self.models.get(zone.name)
+        if model is None or not model.drying or model.response is None:
+            return False
+        if model.last_pulse is not None and self.clock() - model.last_pulse < self.cooldown:
+            return False
+        return zone.moisture - model.drying * self.lead <= zone.treshold
+
+    def pulse_ms(self, zone):
+        model = self.models.get(zone.name)
+        limit = zone.pump_time * 1000
+        if model is None or not model.response:
+            return limit
+        target = min(zone.treshold + self.band, 100 - HEADROOM)
+        # the zone keeps drying while the water soaks in
+        missing = target - zone.moisture + (model.drying or 0) * SETTLE
+        return max(MIN_PULSE_MS, min(limit * self.max_bursts, int(missing / model.response * 1000)))
+
+    def watered(self, zone, before, pulse_ms):
+        """
+        Remember a finished pulse, its gain is measured after SETTLE seconds.
+        """
+        model = self.models.get(zone.name)
+        if model is None:
+            return
+        model.pulses += 1
+        model.last_pulse = self.clock()
+        if before is not None and pulse_ms > 0:
+            model.pending = (zone, before, pulse_ms)
+
+    def _learn_response(self, model, now):
+        zone, before, pulse_ms = model.pending
+        model.pending = None
+        if zone.moisture is None:
+            return
+        # add back what dried out while the water soaked in
+        gain = zone.moisture - before + (model.drying or 0) * (now - model.last_pulse)
+        if gain <= 0:
+            return
+        sample = gain * 1000 / pulse_ms
+        if model.response is None:
+            model.response = sample
+        else:
+            model.response += (sample - model.response) * RESPONSE_ALPHA
+
+    def state(self):
+        return {
+            'policy': self.name,
+            'lead': self.lead,
+            'band': self.band,
+            'window': self.window,
+            'cooldown': self.cooldown,
+            'max_bursts': self.max_bursts,
+            'zones': {name: model.state() for name, model in self.models.items()},
+        }
@@ -0,0 +1,216 @@
+# Watering state machine.
+#
+#   idle -> check -> pulse -> soak -> verify -> idle
+#                      ^                  |
+#                      +---- backoff <----+  (still too dry)
+#   check -> disabled -> idle                (too many attempts)
+#
+# step() is called on every scheduler tick and only compares deadlines, it
+# never sleeps, so sensors, display and the web server keep running while a
+# zone is watered. Pump access goes through the ZoneScheduler lock. When and
+# how long to water is up to the policy, see ThresholdPolicy for the interface.
+
+import time
+
+IDLE = 'idle'
+CHECK = 'check'
+PULSE = 'pulse'
+SOAK = 'soak'
+VERIFY = 'verify'
+BACKOFF = 'backoff'
+DISABLED = 'disabled'
+STATES = (IDLE, CHECK, PULSE, SOAK, VERIFY, BACKOFF, DISABLED)
+
+SOAK_MS = 5000
+VERIFY_SAMPLES = 3
+VERIFY_INTERVAL_MS = 3000
+BACKOFF_MS = 3000
+DISABLED_HOLD_MS = 3000
+MAX_ATTEMPTS = 2
+TRANSITIONS_KEPT = 8
+
+
+class ThresholdPolicy:
+    # waters a zone once it is at its threshold, pump_time seconds a pulse
+    name = 'threshold'
+
+    def wants_water(self, zone):
+        return zone.needs_water()
+
+    def pulse_ms(self, zone):
+        return zone.pump_time * 1000
+
+    def watered(self, zone, before, pulse_ms):
+        pass
+
+    def observe(self):
+        pass
+
+    def reset(self, name=None):
+        pass
+
+    def state(self):
+        return {'policy': self.name}
+
+
+class PumpController:
+    def __init__(self, scheduler, log=None, policy=None, max_attempts=MAX_ATTEMPTS, soak_ms=SOAK_MS,
+                 verify_samples=VERIFY_SAMPLES, verify_interval_ms=VERIFY_INTERVAL_MS, backoff_ms=BACKOFF_MS,
+                 on_watered=None):
+        """
+        :param scheduler: ZoneScheduler owning the zones and the pump lock
+        :param log: [default: None] callable receiving status messages, None clears the message
+        :param policy: [default: ThresholdPolicy()] decides when and how long a zone is watered
+        :param max_attempts: [default: MAX_ATTEMPTS] pulses in a row before a zone that stays dry is disabled
+        :param soak_ms: [default: SOAK_MS] wait after a pulse before verifying
+        :param verify_samples: [default: VERIFY_SAMPLES] sensor readings taken after soaking
+        :param verify_interval_ms: [default: VERIFY_INTERVAL_MS] time between the verify readings
+        :param backoff_ms: [default: BACKOFF_MS] pause before the next attempt when the soil is still dry
+        :param on_watered: [default: None] callable(zone, before, pulse_ms) called with the policy's watered()
+        """
+        self.scheduler = scheduler
+        self.log = log if log is not None else (lambda message: None)
+        self.policy = policy if policy is not None else ThresholdPolicy()
+        self.max_attempts = max_attempts
+        self.soak_ms = soak_ms
+        self.verify_samples = verify_samples
+        self.verify_interval_ms = verify_interval_ms
+        self.backoff_ms = backoff_ms
+        self.on_watered = on_watered if on_watered is not None else (lambda zone, before, pulse_ms: None)
+        self.state = IDLE
+        self.zone = None
+        self.since = time.ticks_ms()
+        self.deadline = 0
+        self.cycles = 0
+        self.pulses = 0
+        self._verified = 0
+        self._before = None
+        self._pulse_ms = 0
+        # ring of the last transitions as [ticks_ms, state, zone name]
+        self.transitions = [[0, IDLE, None] for _ in range(TRANSITIONS_KEPT)]
+        self._next_transition = 0
+
+    @property
+    def busy(self):
+        return self.state != IDLE
+
+    def _enter(self, state, now, delay_ms=0):
+        self.state = state
+        self.since = now
+        self.deadline = time.ticks_add(now, delay_ms)
+        entry = self.transitions[self._next_transition]
+        entry[0] = now
+        entry[1] = state
+        entry[2] = self.zone.name if self.zone is not None else None
+        self._next_transition = (self._next_transition + 1) % TRANSITIONS_KEPT
+
+    def _due(self, now):
+        return time.ticks_diff(now, self.deadline) >= 0
+
+    def stop(self, now=None):
+        """
+        Abort watering, the pump is switched off right away.
+        """
+        if now is None:
+            now = time.ticks_ms()
+        if self.zone is not None:
+            self.scheduler.release_pump(self.zone)
+        self.zone = None
+        if self.state != IDLE:
+            self.log(None)
+            self._enter(IDLE, now)
+
+    def step(self, enabled, now=None):
+        """
+        Advance the state machine by at most one transition.
+
+        :param enabled: master pump switch, watering stops when it goes off
+        :param now: [default: None] time.ticks_ms() of the tick
+        """
+        if now is None:
+            now = time.ticks_ms()
+        state = self.state
+        zone = self.zone
+
+        if state == IDLE:
+            if enabled:
+                zone = self.scheduler.next_thirsty(self.policy.wants_water)
+                if zone is not None:
+                    self.zone = zone
+                    self.cycles += 1
+                    self._enter(CHECK, now)
+            return
+
+        if not enabled or (zone is not None and not zone.enabled and state != DISABLED):
+            self.stop(now)
+            return
+
+        if state == CHECK:
+            if not self.policy.wants_water(zone):
+                print(f'Humidity level {zone.name} OK - skiping starting pump')
+                zone.attempts = 0
+                self.stop(now)
+            elif zone.attempts >= self.max_attempts:
+                self.log(f'Too many tries - disabling pump {zone.name}')
+                zone.enabled = False
+                zone.attempts = 0
+                self._enter(DISABLED, now, DISABLED_HOLD_MS)
+            elif self.scheduler.start_pump(zone):
+                zone.attempts += 1
+                self.pulses += 1
+                self._before = zone.moisture
+                self._pulse_ms = self.policy.pulse_ms(zone)
+                self.log(f'Humidity level {zone.name} low - starting pump for {self._pulse_ms / 1000}s, attemp #{zone.attempts}')
+                self._enter(PULSE, now, self._pulse_ms)
+        elif state == PULSE:
+            if self._due(now):
+                self.scheduler.release_pump(zone)
+                # the moisture jumps after watering, don't let the average lag behind
+                zone.sensor.filter.reset()
+                self.log(f'Waiting for imersia {self.soak_ms // 1000}s')
+                self._enter(SOAK, now, self.soak_ms)
+        elif state == SOAK:
+            if self._due(now):
+                self._verified = 0
+                self._enter(VERIFY, now)
+        elif state == VERIFY:
+            if self._due(now):
+                zone.sample()
+                self._verified += 1
+                self.log(f'Reading sensor {zone.name} after watering - current level: {zone.moisture}%')
+                if self._verified < self.verify_samples:
+                    self.deadline = time.ticks_add(now, self.verify_interval_ms)
+                    return
+                self.policy.watered(zone, self._before, self._pulse_ms)
+                self.on_watered(zone, self._before, self._pulse_ms)
+                if zone.needs_water():
+                    self._enter(BACKOFF, now, self.backoff_ms)
+                else:
+                    zone.attempts = 0
+                    self.stop(now)
+        elif state == BACKOFF:
+            if self._due(now):
+                self._enter(CHECK, now)
+        elif state == DISABLED:
+            if self._due(now):
+                self.zone = None
+                self.log(None)
+                self._enter(IDLE, now)
+
+    def status(self, now=None):
+        if now is None:
+            now = time.ticks_ms()
+        transitions = []
+        for i in range(TRANSITIONS_KEPT):
+            entry = self.transitions[(self._next_transition + i) % TRANSITIONS_KEPT]
+            if entry[0] or entry[2] is not None:
+                transitions.append({'ago_ms': time.ticks_diff(now, entry[0]), 'state': entry[1], 'zone': entry[2]})
+        return {
+            'state': self.state,
+            'zone': self.zone.name if self.zone is not None else None,
+            'for_ms': time.ticks_diff(now, self.since),
+            'cycles': self.cycles,
+            'pulses': self.pulses,
+            'policy': self.policy.name,
+            'transitions': transitions,
+        }
@@ -0,0 +1,84 @@
+# Cached rendering for the OLED pages.
+#
+# Every page has a static background (labels, lines, icons) drawn once into
+# its own buffer. A frame copies the background into the display buffer and
+# draws only the dynamic values on top. When the values are the same as in
+# the previous frame nothing is drawn or sent at all.
+
+import framebuf
+import time
+
+
+class Renderer:
+    def __init__(self, display):
+        """
+        :param display: SSD1306 instance (any FrameBuffer with a 'buffer' and show())
+        """
+        self.display = display
+        self.layers = {}
+        self._display_mv = memoryview(display.buffer)
+        self._last = None
+        self._wrapped_message = None
+        self._wrapped_rows = ()
+        self.frames = 0
+        self.skipped_frames = 0
+        self.render_us = 0
+
+    def add_layer(self, name, draw=None):
+        """
+        Pre-render the static background of page <name>.
+
+        :param name: page name
+        :param draw: [default: None] callable receiving a FrameBuffer to draw the static parts on
+        """
+        display = self.display
+        buf = bytearray(len(display.buffer))
+        if draw is not None:
+            draw(framebuf.FrameBuffer(buf, display.width, display.height, framebuf.MONO_VLSB))
+        self.layers[name] = memoryview(buf)
+
+    def invalidate(self):
+        self._last = None
+
+    def wrap(self, message, columns=16):
+        """
+        Word wrap <message> into rows of at most <columns> characters.
+        The result of the last call is cached since messages rarely change.
+        """
+        if message == self._wrapped_message:
+            return self._wrapped_rows
+        rows = []
+        row = ''
+        for word in message.split(' '):
+            if len(row) + len(word) < columns or not row:
+                row += word + ' '
+            else:
+                rows.append(row)
+                row = word + ' '
+        rows.append(row)
+        self._wrapped_message = message
+        self._wrapped_rows = tuple(rows)
+        return self._wrapped_rows
+
+    def render(self, page, values, draw=None):
+        """
+        Draw page <page> showing <values>.
+
+        :param page: name of a layer added with add_layer
+        :param values: tuple of everything the dynamic part depends on
+        :param draw: [default: None] callable drawing the dynamic part, called as draw(display, values)
+        :return: True if a new frame was drawn and shown
+        """
+        key = (page, values)
+        if key == self._last:
+            self.skipped_frames += 1
+            return False
+        started = time.ticks_us()
+        self._display_mv[:] = self.layers[page]
+        if draw is not None:
+            draw(self.display, values)
+        self.display.show()
+        self._last = key
+        self.frames += 1
+        self.render_us = time.ticks_diff(time.ticks_us(), started)
+        return True
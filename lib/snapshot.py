@@ -0,0 +1,72 @@
+# Cached serialized state snapshots.
+#
+# The dashboards and the scraper poll the state far more often than it
+# changes. SnapshotCache keeps the encoded body of every format together
+# with the StateFeed version it was built from, a request encodes again only
+# after the feed saw a tracked value change, otherwise the cached bytes are
+# sent as they are. Detecting a change still builds the snapshot dict and
+# compares it, which is much cheaper than encoding it. The ETag is the CRC of
+# the body, taken once per encoding, a client sending it back gets a 304.
+
+import binascii
+import time
+
+from lib.httpserver import Response
+
+
+class SnapshotCache:
+    def __init__(self, feed, formats, cache_control='no-cache'):
+        """
+        :param feed: StateFeed of the tracked values, its version keys the cache
+        :param formats: dict of format name to (content type, encoder), the encoder takes the state dict and returns bytes
+        :param cache_control: [default: 'no-cache'] Cache-Control header, the client revalidates with the ETag
+        """
+        self.feed = feed
+        self.formats = formats
+        self.cache_control = cache_control
+        self.names = tuple(formats)
+        self._index = {name: index for index, name in enumerate(self.names)}
+        count = len(self.names)
+        self.versions = [-1] * count
+        self.bodies = [b''] * count
+        self.etags = [''] * count
+        # statistics, one entry per format in the order of names
+        self.hits = [0] * count
+        self.misses = [0] * count
+        self.encode_us = [0] * count
+        self.total_encode_us = [0] * count
+
+    def body(self, name):
+        """
+        :return: (body, etag) of format <name> for the current state
+        """
+        index = self._index[name]
+        version = self.feed.poll()
+        if self.versions[index] == version:
+            self.hits[index] += 1
+        else:
+            started = time.ticks_us()
+            body = self.formats[name][1](self.feed.state)
+            self.etags[index] = '"{:08x}"'.format(binascii.crc32(body) & 0xFFFFFFFF)
+            self.bodies[index] = body
+            self.versions[index] = version
+            us = time.ticks_diff(time.ticks_us(), started)
+            self.encode_us[index] = us
+            self.total_encode_us[index] += us
+            self.misses[index] += 1
+        return self.bodies[index], self.etags[index]
+
+    def response(self, request=None, name='json'):
+        """
+        Build a response with the snapshot in format <name>, honouring If-None-Match of <request>.
+        """
+        body, etag = self.body(name)
+        headers = [('ETag', etag), ('Cache-Control', self.cache_control)]
+        if request is not None and request.headers.get('if-none-match') == etag:
+            return Response(b'', 304, None, headers)
+        return Response(body, 200, self.formats[name][0], headers)
+
+    def hit_rate(self):
+        hits = sum(self.hits)
+        requests = hits + sum(self.misses)
+        return hits / requests if requests else None
@@ -0,0 +1,105 @@
+# Soil moisture acquisition.
+#
+# Every update takes a short burst of ADC samples, uses their median to drop
+# spikes and feeds it into an exponential moving average. Everything runs in
+# integer arithmetic: the average and the variance estimate are kept in fixed
+# point with FRACTION_BITS fractional bits. tools/soil_filter_reference.py has
+# a numpy implementation of the same filter for checking recorded traces.
+
+import array
+import time
+
+BURST = 9
+BURST_INTERVAL_US = 100
+# smoothing factor alpha = 1 / 2**ALPHA_SHIFT
+ALPHA_SHIFT = 2
+FRACTION_BITS = 4
+
+
+def median(samples, count):
+    """
+    Median of the first <count> samples, sorts them in place.
+    """
+    for i in range(1, count):
+        value = samples[i]
+        j = i - 1
+        while j >= 0 and samples[j] > value:
+            samples[j + 1] = samples[j]
+            j -= 1
+        samples[j + 1] = value
+    return samples[count // 2]
+
+
+class SoilFilter:
+    def __init__(self, alpha_shift=ALPHA_SHIFT):
+        self.alpha_shift = alpha_shift
+        self.mean = None
+        self.variance = 0
+
+    def update(self, value):
+        """
+        Feed one (median) raw value, return the smoothed raw value.
+        """
+        fixed = value << FRACTION_BITS
+        if self.mean is None:
+            self.mean = fixed
+            self.variance = 0
+        else:
+            delta = fixed - self.mean
+            self.mean += delta >> self.alpha_shift
+            # EMA of the squared deviation, same fixed point as the mean squared
+            self.variance += (((delta * delta) >> FRACTION_BITS) - self.variance) >> self.alpha_shift
+        return self.mean >> FRACTION_BITS
+
+    def reset(self):
+        self.mean = None
+        self.variance = 0
+
+
+class SoilSensor:
+    def __init__(self, adc, soil_min, soil_max, burst=BURST, alpha_shift=ALPHA_SHIFT):
+        """
+        :param adc: machine.ADC of the sensor
+        :param soil_min: raw reading in water (100%)
+        :param soil_max: raw reading in dry air (0%)
+        :param burst: [default: BURST] samples per update
+        :param alpha_shift: [default: ALPHA_SHIFT] EMA smoothing, alpha = 1 / 2**alpha_shift
+        """
+        self.adc = adc
+        self.soil_min = soil_min
+        self.soil_max = soil_max
+        self.burst = burst
+        self.samples = array.array('H', [0] * burst)
+        self.filter = SoilFilter(alpha_shift)
+        self.raw = None
+        self.percent = None
+        self.updates = 0
+        self.sample_us = 0
+
+    def to_percent(self, raw):
+        percent = (self.soil_max - raw) * 100 // (self.soil_max - self.soil_min)
+        return max(0, min(100, percent))
+
+    def update(self):
+        """
+        Take a burst of samples and update the filtered value.
+
+        :return: smoothed moisture in percent
+        """
+        started = time.ticks_us()
+        samples = self.samples
+        read = self.adc.read_u16
+        for i in range(self.burst):
+            samples[i] = read()
+            time.sleep_us(BURST_INTERVAL_US)
+        self.raw = self.filter.update(median(samples, self.burst))
+        self.percent = self.to_percent(self.raw)
+        self.updates += 1
+        self.sample_us = time.ticks_diff(time.ticks_us(), started)
+        return self.percent
+
+    def variance(self):
+        """
+        Variance estimate of the readings in raw ADC units squared.
+        """
+        return self.filter.variance >> FRACTION_BITS
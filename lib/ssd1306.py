@@ -2,6 +2,7 @@
 
 from micropython import const
 import framebuf
+import micropython
 
 
 # register definitions
@@ -23,6 +24,29 @@ SET_PRECHARGE = const(0xD9)
 SET_VCOM_DESEL = const(0xDB)
 SET_CHARGE_PUMP = const(0x8D)
 
+# bytes on the bus for one command (I2C control byte + command)
+CMD_COST = const(2)
+
+
+# Find the first and last column of a page that differ from what was last
+# sent to the display, (-1, -1) if the page is unchanged.
+@micropython.native
+def _dirty_columns(buf, shadow, start, width):
+    x0 = -1
+    for x in range(width):
+        if buf[start + x] != shadow[start + x]:
+            x0 = x
+            break
+    if x0 < 0:
+        return -1, -1
+    x1 = x0
+    for x in range(width - 1, x0, -1):
+        if buf[start + x] != shadow[start + x]:
+            x1 = x
+            break
+    return x0, x1
+
+
 # Subclassing FrameBuffer provides support for graphics primitives
 # http://docs.micropython.org/en/latest/pyboard/library/framebuf.html
 class SSD1306(framebuf.FrameBuffer):
@@ -32,6 +56,18 @@ class SSD1306(framebuf.FrameBuffer):
         self.external_vcc = external_vcc
         self.pages = self.height // 8
         self.buffer = bytearray(self.pages * self.width)
+        # copy of the display RAM, used to send only what changed
+        self.shadow = bytearray(self.pages * self.width)
+        self._buffer_mv = memoryview(self.buffer)
+        self._shadow_mv = memoryview(self.shadow)
+        self._full_refresh = True
+        # first and last dirty column of every page, 0xFF when clean
+        self._ranges = bytearray(self.pages * 2)
+        # bytes sent by the last show() and since power on
+        self.bytes_sent = 0
+        self.total_bytes_sent = 0
+        self.frames = 0
+        self.skipped_frames = 0
         super().__init__(self.buffer, self.width, self.height, framebuf.MONO_VLSB)
         self.init_display()
 
@@ -85,9 +121,11 @@ class SSD1306(framebuf.FrameBuffer):
     def invert(self, invert):
         self.write_cmd(SET_NORM_INV | (invert & 1))
 
-    def show(self):
-        x0 = 0
-        x1 = self.width - 1
+    def invalidate(self):
+        """Force the next show() to send the whole framebuffer."""
+        self._full_refresh = True
+
+    def _window(self, x0, x1, page0, page1):
         if self.width == 64:
             # displays with width of 64 pixels are shifted by 32
             x0 += 32
@@ -96,9 +134,55 @@ class SSD1306(framebuf.FrameBuffer):
         self.write_cmd(x0)
         self.write_cmd(x1)
         self.write_cmd(SET_PAGE_ADDR)
-        self.write_cmd(0)
-        self.write_cmd(self.pages - 1)
-        self.write_data(self.buffer)
+        self.write_cmd(page0)
+        self.write_cmd(page1)
+        return 6 * CMD_COST
+
+    def show(self):
+        """
+        Send the framebuffer to the display. Only the changed column range of
+        every changed 8 row page is sent, nothing at all when the frame is
+        identical to the previous one. The number of bytes put on the bus is
+        stored in bytes_sent.
+        """
+        width = self.width
+        ranges = self._ranges
+        self.frames += 1
+        dirty = 0
+        if not self._full_refresh:
+            for page in range(self.pages):
+                x0, x1 = _dirty_columns(self.buffer, self.shadow, page * width, width)
+                ranges[page * 2] = x0 & 0xFF
+                ranges[page * 2 + 1] = x1 & 0xFF
+                if x0 >= 0:
+                    dirty += 1
+            if not dirty:
+                self.skipped_frames += 1
+                self.bytes_sent = 0
+                return
+
+        if self._full_refresh or dirty > self.pages // 2:
+            # most of the screen changed, one full window is cheaper
+            sent = self._window(0, width - 1, 0, self.pages - 1)
+            self.write_data(self.buffer)
+            self._shadow_mv[:] = self._buffer_mv
+            self._full_refresh = False
+            sent += len(self.buffer) + 1
+        else:
+            sent = 0
+            for page in range(self.pages):
+                x0 = ranges[page * 2]
+                x1 = ranges[page * 2 + 1]
+                if x0 == 0xFF:
+                    continue
+                start = page * width
+                sent += self._window(x0, x1, page, page)
+                region = self._buffer_mv[start + x0:start + x1 + 1]
+                self.write_data(region)
+                self._shadow_mv[start + x0:start + x1 + 1] = region
+                sent += x1 - x0 + 2
+        self.bytes_sent = sent
+        self.total_bytes_sent += sent
 
 
 class SSD1306_I2C(SSD1306):
@@ -0,0 +1,234 @@
+# WebSocket (RFC 6455) channel for the dashboard controls.
+#
+# Channel.accept() answers the upgrade request with a WebSocket response.
+# After its 101 head is written HTTPServer hands it the connection: one task
+# reads the frames and passes every text message to on_message, another one
+# writes. Updates for a client are dicts merged into its pending dict, so a
+# slow client gets the latest value of every key in one frame instead of a
+# growing queue, and only the writer task ever touches the stream.
+#
+# Only what the dashboard needs is implemented: text messages up to
+# MAX_PAYLOAD bytes, no fragmentation and no extensions. The client must
+# wait for the 101 before sending, bytes that came with the request are
+# dropped.
+
+import binascii
+import hashlib
+import json
+import struct
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+from lib.httpserver import Response
+
+GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_PAYLOAD = 512
+MAX_CLIENTS = 4
+PING_INTERVAL = 20
+
+CONTINUATION = 0
+TEXT = 1
+BINARY = 2
+CLOSE = 8
+PING = 9
+PONG = 10
+
+# close codes
+NORMAL = 1000
+PROTOCOL_ERROR = 1002
+UNSUPPORTED = 1003
+TOO_BIG = 1009
+
+
+def accept_key(key):
+    digest = hashlib.sha1(key.encode() + GUID).digest()
+    return binascii.b2a_base64(digest).strip().decode()
+
+
+def frame(opcode, payload=b''):
+    """
+    :return: an unmasked final frame, servers never mask
+    """
+    length = len(payload)
+    if length < 126:
+        head = struct.pack('>BB', 0x80 | opcode, length)
+    elif length < 65536:
+        head = struct.pack('>BBH', 0x80 | opcode, 126, length)
+    else:
+        head = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+    return head + payload
+
+
+def close_frame(code):
+    return frame(CLOSE, struct.pack('>H', code))
+
+
+def unmask(payload, mask):
+    for i in range(len(payload)):
+        payload[i] ^= mask[i & 3]
+
+
+class WebSocket(Response):
+    upgrade = True
+
+    def __init__(self, channel, key):
+        super().__init__(b'', 101, None)
+        self.channel = channel
+        self.accept = accept_key(key)
+        self.pending = {}
+        self.messages = 0
+        self.frames_sent = 0
+        self._control = None
+        self._closing = False
+        self._wake = asyncio.Event()
+
+    def head(self, keep_alive):
+        lines = ['HTTP/1.1 101 Switching Protocols', 'Upgrade: websocket', 'Connection: Upgrade',
+                 'Sec-WebSocket-Accept: ' + self.accept]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+    def send(self, data):
+        """
+        Queue the keys of <data> for the client, newer values replace the ones not sent yet.
+        """
+        self.pending.update(data)
+        self._wake.set()
+
+    def close(self, code=NORMAL):
+        self._control = close_frame(code)
+        self._closing = True
+        self._wake.set()
+
+    async def serve(self, reader, writer):
+        channel = self.channel
+        channel.clients.append(self)
+        sender = asyncio.create_task(self._sender(writer))
+        try:
+            if channel.on_open is not None:
+                channel.on_open(self)
+            await self._receive(reader)
+        except (OSError, EOFError, asyncio.TimeoutError):
+            pass
+        finally:
+            if self in channel.clients:
+                channel.clients.remove(self)
+            if self._closing:
+                # give the writer the chance to send the close frame
+                try:
+                    await asyncio.wait_for(sender, 1)
+                except (OSError, asyncio.TimeoutError):
+                    pass
+            else:
+                sender.cancel()
+
+    async def _receive(self, reader):
+        while not self._closing:
+            # a live client answers the pings, silence for two intervals means it is gone
+            head = await asyncio.wait_for(reader.readexactly(2), 2 * self.channel.ping_interval)
+            final = head[0] & 0x80
+            opcode = head[0] & 0x0F
+            length = head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack('>H', await reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack('>Q', await reader.readexactly(8))[0]
+            if not head[1] & 0x80:
+                # frames from a client are always masked
+                self.close(PROTOCOL_ERROR)
+                return
+            if length > MAX_PAYLOAD:
+                self.close(TOO_BIG)
+                return
+            mask = await reader.readexactly(4)
+            payload = bytearray(await reader.readexactly(length)) if length else bytearray()
+            unmask(payload, mask)
+            if opcode == TEXT and final:
+                self.messages += 1
+                self.channel.messages += 1
+                try:
+                    self.channel.on_message(self, payload.decode())
+                except Exception as e:
+                    print('WebSocket handler failed:', e)
+            elif opcode == PING:
+                self._control = frame(PONG, payload)
+                self._wake.set()
+            elif opcode == CLOSE:
+                self.close(NORMAL)
+            elif opcode != PONG:
+                # binary and fragmented messages
+                self.close(UNSUPPORTED)
+
+    async def _sender(self, writer):
+        try:
+            await self._send_frames(writer)
+        except OSError:
+            # the client went away, stop queueing updates for it
+            self._closing = True
+            if self in self.channel.clients:
+                self.channel.clients.remove(self)
+
+    async def _send_frames(self, writer):
+        ping_interval = self.channel.ping_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), ping_interval)
+            except asyncio.TimeoutError:
+                if self._control is None:
+                    self._control = frame(PING)
+            self._wake.clear()
+            control = self._control
+            self._control = None
+            if control is not None and not self._closing:
+                writer.write(control)
+            if self.pending:
+                writer.write(frame(TEXT, json.dumps(self.pending).encode()))
+                self.pending = {}
+                self.frames_sent += 1
+                self.channel.frames_sent += 1
+            if control is not None and self._closing:
+                # the close frame is the last one
+                writer.write(control)
+                await writer.drain()
+                return
+            await writer.drain()
+
+
+class Channel:
+    def __init__(self, on_message, on_open=None, max_clients=MAX_CLIENTS, ping_interval=PING_INTERVAL):
+        """
+        :param on_message: callable(client, text) called for every text message
+        :param on_open: [default: None] callable(client) called when a client connected, e.g. to send the full state
+        :param max_clients: [default: MAX_CLIENTS] further upgrade requests get a 503
+        :param ping_interval: [default: PING_INTERVAL] seconds without traffic before the client is pinged
+        """
+        self.on_message = on_message
+        self.on_open = on_open
+        self.max_clients = max_clients
+        self.ping_interval = ping_interval
+        self.clients = []
+        self.messages = 0
+        self.frames_sent = 0
+
+    def accept(self, request):
+        """
+        :return: the WebSocket response to an upgrade request, an error response otherwise
+        """
+        headers = request.headers
+        key = headers.get('sec-websocket-key')
+        if headers.get('upgrade', '').lower() != 'websocket' or not key:
+            return Response('Expected a WebSocket upgrade', 400)
+        if headers.get('sec-websocket-version') != '13':
+            return Response('Unsupported WebSocket version', 426, headers=[('Sec-WebSocket-Version', '13')])
+        if len(self.clients) >= self.max_clients:
+            return Response('Too many clients', 503)
+        return WebSocket(self, key)
+
+    def broadcast(self, data):
+        """
+        Queue <data> for every connected client.
+        """
+        for client in self.clients:
+            client.send(data)
@@ -0,0 +1,207 @@
+# WiFi connection manager.
+#
+#   off -> idle -> connecting -> connected
+#            ^      |      ^          |
+#            |      v      |          |  link lost, reconnect right away
+#            |    backoff -+          |
+#            +------------------------+
+#
+# step() is called periodically and only looks at the interface status, it
+# never waits for the connection. A failed attempt is retried after
+# backoff_ms, doubling up to max_backoff_ms, so a router that is down for a
+# while doesn't keep the radio busy. A connection that drops is retried at
+# once and the backoff starts over.
+#
+# The first attempt scans to pick the strongest access point of the
+# network, the one blocking call, it ends once a connection succeeded. The
+# BSSID and channel of that access point and the IP configuration are then
+# kept: a reconnect goes straight to the same access point with the old
+# address, skipping the scan and DHCP. If that fails the cache is dropped
+# and the next attempt starts from scratch. The channel can't be passed to
+# connect(), it is only reported.
+
+import time
+
+import network
+
+OFF = 'off'
+IDLE = 'idle'
+CONNECTING = 'connecting'
+CONNECTED = 'connected'
+BACKOFF = 'backoff'
+
+CONNECT_TIMEOUT_MS = 15000
+BACKOFF_MS = 2000
+MAX_BACKOFF_MS = 120000
+
+ERRORS = {
+    network.STAT_WRONG_PASSWORD: 'Wrong password',
+    network.STAT_NO_AP_FOUND: 'No access point found',
+    network.STAT_CONNECT_FAIL: 'Failed to connect',
+}
+
+
+class WiFiManager:
+    def __init__(self, wlan, on_change=None, connect_timeout_ms=CONNECT_TIMEOUT_MS, backoff_ms=BACKOFF_MS,
+                 max_backoff_ms=MAX_BACKOFF_MS):
+        """
+        :param wlan: network.WLAN(network.STA_IF)
+        :param on_change: [default: None] callable(manager) called after every state change
+        :param connect_timeout_ms: [default: CONNECT_TIMEOUT_MS] an attempt not connected after this failed
+        :param backoff_ms: [default: BACKOFF_MS] wait after the first failed attempt
+        :param max_backoff_ms: [default: MAX_BACKOFF_MS] longest wait between two attempts
+        """
+        self.wlan = wlan
+        self.on_change = on_change if on_change is not None else (lambda manager: None)
+        self.connect_timeout_ms = connect_timeout_ms
+        self.backoff_ms = backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.ssid = None
+        self.password = None
+        self.state = OFF
+        self.since = time.ticks_ms()
+        self.deadline = self.since
+        self.delay_ms = backoff_ms
+        self.error = None
+        self.ip = None
+        # the last good connection
+        self.bssid = None
+        self.channel = None
+        self.ifconfig = None
+        self._fast = False
+        self._candidate = None
+        # statistics
+        self.attempts = 0
+        self.failures = 0
+        self.connects = 0
+        self.fast_connects = 0
+        self.reconnects = 0
+        # duration of the last successful attempt and time from the loss of
+        # the link to the next connection
+        self.connect_ms = None
+        self.reconnect_ms = None
+        self.lost_at = None
+
+    @property
+    def connected(self):
+        return self.state == CONNECTED
+
+    def configure(self, ssid, password, now=None):
+        """
+        Use new credentials, the next step() connects with them. The cache of the old network is dropped.
+        """
+        if now is None:
+            now = time.ticks_ms()
+        if self.state in (CONNECTING, CONNECTED):
+            self.wlan.disconnect()
+        self.ssid = ssid
+        self.password = password
+        self._forget()
+        self.delay_ms = self.backoff_ms
+        self.lost_at = None
+        self.wlan.active(True)
+        self._enter(IDLE if ssid else OFF, now)
+
+    def _forget(self):
+        self.bssid = None
+        self.channel = None
+        if self.ifconfig is not None:
+            self.ifconfig = None
+            try:
+                self.wlan.ifconfig('dhcp')
+            except (OSError, TypeError, ValueError):
+                pass
+
+    def _enter(self, state, now, delay_ms=0):
+        self.state = state
+        self.since = now
+        self.deadline = time.ticks_add(now, delay_ms)
+        self.on_change(self)
+
+    def step(self, now=None):
+        """
+        Advance the state machine, called periodically.
+
+        :return: the state
+        """
+        if now is None:
+            now = time.ticks_ms()
+        state = self.state
+        if state == IDLE or (state == BACKOFF and time.ticks_diff(now, self.deadline) >= 0):
+            self._connect(now)
+        elif state == CONNECTING:
+            status = self.wlan.status()
+            if status == network.STAT_GOT_IP:
+                self._connected(now)
+            elif status < 0 or time.ticks_diff(now, self.since) >= self.connect_timeout_ms:
+                self._failed(now, status)
+        elif state == CONNECTED and not self.wlan.isconnected():
+            self.lost_at = now
+            self.error = 'Connection lost'
+            self.ip = None
+            self.wlan.disconnect()
+            self._enter(IDLE, now)
+        return self.state
+
+    def _connect(self, now):
+        wlan = self.wlan
+        self.attempts += 1
+        self._fast = self.ifconfig is not None
+        if self._fast:
+            wlan.ifconfig(self.ifconfig)
+            wlan.connect(self.ssid, self.password, bssid=self.bssid)
+        else:
+            best = None
+            for found in wlan.scan():
+                if found[0].decode() == self.ssid and (best is None or found[3] > best[3]):
+                    best = found
+            # a hidden network is not in the scan, connect() finds it anyway
+            self._candidate = (best[1], best[2]) if best is not None else (None, None)
+            wlan.connect(self.ssid, self.password, bssid=self._candidate[0])
+        self._enter(CONNECTING, now)
+
+    def _connected(self, now):
+        self.ifconfig = self.wlan.ifconfig()
+        self.ip = self.ifconfig[0]
+        if self._fast:
+            self.fast_connects += 1
+        else:
+            self.bssid, self.channel = self._candidate
+        self.connects += 1
+        self.connect_ms = time.ticks_diff(now, self.since)
+        if self.lost_at is not None:
+            self.reconnect_ms = time.ticks_diff(now, self.lost_at)
+            self.reconnects += 1
+            self.lost_at = None
+        self.delay_ms = self.backoff_ms
+        self.error = None
+        self._enter(CONNECTED, now)
+
+    def _failed(self, now, status):
+        self.failures += 1
+        self.error = ERRORS.get(status, 'Timed out')
+        self.ip = None
+        self.wlan.disconnect()
+        if self._fast:
+            # the access point or the address changed, start over right away
+            self._forget()
+            self._enter(IDLE, now)
+            return
+        delay_ms = self.delay_ms
+        self.delay_ms = min(delay_ms * 2, self.max_backoff_ms)
+        self._enter(BACKOFF, now, delay_ms)
+
+    def status(self):
+        return {
+            'state': self.state,
+            'ssid': self.ssid,
+            'ip': self.ip,
+            'bssid': ':'.join('{:02x}'.format(b) for b in self.bssid) if self.bssid else None,
+            'channel': self.channel,
+            'error': self.error,
+            'attempts': self.attempts,
+            'failures': self.failures,
+            'reconnects': self.reconnects,
+            'connect_ms': self.connect_ms,
+            'reconnect_ms': self.reconnect_ms,
+        }
@@ -0,0 +1,135 @@
+# Watering zones.
+#
+# A zone is one soil sensor with its own calibration, watering threshold and
+# pump channel. ZoneScheduler samples the zones round robin, a fixed number
+# per tick, so the cost of a tick doesn't grow with the number of zones. It
+# also owns the pump lock: only one zone may run its pump at a time to stay
+# within the power supply budget.
+
+PUMP_FREQ = 200
+PUMP_DUTY = 45000
+
+
+class Zone:
+    def __init__(self, name, sensor, pump, treshold=50, pump_time=5):
+        """
+        :param name: short label shown on the display, e.g. 'A'
+        :param sensor: SoilSensor of the zone
+        :param pump: machine.PWM driving the pump of the zone
+        :param treshold: [default: 50] moisture in percent at or below which the zone is watered
+        :param pump_time: [default: 5] seconds of a single watering pulse
+        """
+        self.name = name
+        self.sensor = sensor
+        self.pump = pump
+        self.treshold = treshold
+        self.pump_time = pump_time
+        self.enabled = True
+        self.moisture = None
+        self.watering = False
+        self.pump_cycles = 0
+        # watering attempts in a row that didn't bring the moisture up
+        self.attempts = 0
+
+    def sample(self):
+        self.moisture = self.sensor.update()
+        if self.moisture > self.treshold:
+            self.attempts = 0
+        return self.moisture
+
+    def needs_water(self):
+        return self.enabled and self.moisture is not None and self.moisture <= self.treshold
+
+    def pump_on(self):
+        self.pump.freq(PUMP_FREQ)
+        self.pump.duty_u16(PUMP_DUTY)
+        self.watering = True
+        self.pump_cycles += 1
+
+    def pump_off(self):
+        self.pump.duty_u16(0)
+        self.watering = False
+
+    def state(self):
+        return {
+            'name': self.name,
+            'soil': self.moisture,
+            'treshold': self.treshold,
+            'time': self.pump_time,
+            'enabled': self.enabled,
+            'watering': self.watering,
+        }
+
+
+class ZoneScheduler:
+    def __init__(self, zones, samples_per_tick=1):
+        """
+        :param zones: list of Zone
+        :param samples_per_tick: [default: 1] zones sampled on every tick
+        """
+        self.zones = zones
+        self.samples_per_tick = min(samples_per_tick, len(zones))
+        self.pump_owner = None
+        self._next_sample = 0
+        self._next_check = 0
+
+    def zone(self, name):
+        for zone in self.zones:
+            if zone.name == name:
+                return zone
+        return None
+
+    def tick(self):
+        """
+        Sample the next zones in turn.
+        """
+        count = len(self.zones)
+        for _ in range(self.samples_per_tick):
+            self.zones[self._next_sample].sample()
+            self._next_sample = (self._next_sample + 1) % count
+
+    def sample_all(self):
+        for zone in self.zones:
+            zone.sample()
+
+    def next_thirsty(self, wants_water=None):
+        """
+        Return the next zone (round robin) that needs water, or None.
+
+        :param wants_water: [default: None] predicate used instead of Zone.needs_water
+        """
+        count = len(self.zones)
+        for i in range(count):
+            zone = self.zones[(self._next_check + i) % count]
+            if wants_water(zone) if wants_water is not None else zone.needs_water():
+                self._next_check = (self._next_check + i + 1) % count
+                return zone
+        return None
+
+    def acquire_pump(self, zone):
+        """
+        Take the pump lock for <zone>, False while another zone holds it.
+        """
+        if self.pump_owner is not None and self.pump_owner is not zone:
+            return False
+        self.pump_owner = zone
+        return True
+
+    def start_pump(self, zone):
+        """
+        Switch the pump of <zone> on if it can take the pump lock.
+        """
+        if not self.acquire_pump(zone):
+            return False
+        zone.pump_on()
+        return True
+
+    def release_pump(self, zone):
+        if self.pump_owner is zone:
+            zone.pump_off()
+            self.pump_owner = None
+
+    def stop_all(self):
+        for zone in self.zones:
+            zone.pump_off()
+        self.pump_owner = None
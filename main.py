@@ -1,16 +1,32 @@
 from machine import Pin, PWM, ADC, I2C, Timer
 import machine
+import os
 import time
 from lib.neopixel import Neopixel
 from dht import DHT11
 from ssd1306 import SSD1306_I2C
 import framebuf
-import _thread
 import network
-import socket
-import ure
 import json
-import _thread
+import struct
+from lib.hal import asyncio
+from lib.httpserver import HTTPServer, Response, Router
+from lib.assets import AssetCache
+from lib.events import StateFeed, event_stream
+from lib.history import History
+from lib.renderer import Renderer
+from lib.animations import AnimationEngine, EFFECTS
+from lib.soil import SoilSensor
+from lib.zones import Zone, ZoneScheduler
+from lib.pump import PumpController, ThresholdPolicy, DISABLED, IDLE, STATES
+from lib.predict import PredictivePolicy
+from lib.metrics import Metrics, Heap, timed, LATENCY_BUCKETS, CALLBACK_BUCKETS
+from lib.config import ConfigStore
+from lib.websocket import Channel
+from lib.snapshot import SnapshotCache
+from lib.captive import DNSResponder
+from lib.wifi import WiFiManager, CONNECTING, CONNECTED, BACKOFF, IDLE as WIFI_IDLE
+from lib.eventlog import EventLog, LogStream, INFO, BOOT, PUMP, WIFI, WIFI_FAILED, DHT_FAILED, CONFIG_FAILED
 
 # LOOP CONTROLER
 running = True
@@ -18,7 +34,6 @@ running = True
 # VARIABLE DEFINITIONS
 outside_humidity = '-'
 outside_temperature = '-'
-inside_humidity = None
 
 # BUTTONS
 debounce_time = 200
@@ -32,19 +47,26 @@ status_diode_2 = Pin(13, Pin.OUT)
 
 # PUMP
 pump_active = False
-pump_running = False
-pump_flag = 0
-pump_time = 5
-pump_treshold = 50
-pwm = PWM(Pin(26))
+pump_event = False
+max_pump_attempts = 2
+
+# SCHEDULER
+# the hardware timer ticks fast to step the pump, sensors are read less often
+tick_ms = 250
+sensor_period = 5000
+last_sensor_read = None
 
 # SENSORS
 dht11 = DHT11(Pin(5))
-soil_sensor = {
-    "port": ADC(Pin(27)),
-    "soil_min": 18600,
-    "soil_max": 43000
-}
+dht_max_age = 30000
+
+# ZONES
+# one soil sensor and pump per zone, the display has room for four
+zones = [
+    Zone('A', SoilSensor(ADC(Pin(27)), soil_min=18600, soil_max=43000), PWM(Pin(26))),
+    # Zone('B', SoilSensor(ADC(Pin(28)), soil_min=25000, soil_max=44500), PWM(Pin(22))),
+]
+zone_scheduler = ZoneScheduler(zones)
 
 # OLED
 i2c=I2C(0,sda=Pin(0), scl=Pin(1), freq=400000)
@@ -53,236 +75,285 @@ info_message = None
 display_page = 'main'
 
 # ACCES POINT
+# the provisioning portal runs on the asyncio loop next to everything else
 ap_mode = False
+ap_ssid = 'SmartPot'
+ap_password = 'qqqwwweee'
+ap_ip = None
+ap_http_port = 80
+dns_port = 53
+
+# WEB SERVER
+http_port = 80
 
 # LED STRIP
 numpix = 8
 strip = Neopixel(numpix, 0, 6, "RGB")
-strip_timer = Timer(-1)
-animation_running = False
+animations = AnimationEngine(strip)
+# last color set, as [r, g, b], None while an animation runs
+strip_color = [0, 0, 0]
 
 # WIFI
+# the connection manager runs on the asyncio loop and reconnects in the
+# background, the web server runs while the link is up
 connection_info = {
     "status": 'Disconnected',
     "name": '-',
     "ip": None
 }
+wifi_check_ms = 500
+wifi_message_ms = 3000
+wifi_message_until = None
+wifi_reconnects = 0
+wifi = WiFiManager(network.WLAN(network.STA_IF), lambda manager: wifi_changed(manager))
 
 # PLANT DATA
 plant_date = '-'
 plant_name = '-'
 
+# CONFIG
+# settings are read from RAM, changes reach the flash after a quiet period
+config = ConfigStore('config.json')
+legacy_config_files = ('wifi_config.txt', 'pump_config.txt', 'plant_data.txt')
+
+# EVENT LOG
+# kept in RAM and written in batches by a task on the asyncio loop
+eventlog = EventLog('events')
+dht_failures_logged = 0
+config_failures_logged = 0
+
+# STATIC PAGES
+assets = AssetCache()
+
+# HISTORY
+if len(zones) == 1:
+    history = History()
+else:
+    history = History(fields=['soil_' + zone.name.lower() for zone in zones] + ['temperature', 'humidity'])
+history_values = [None] * len(history.fields)
+# the soil fields come first, in the order of the zones
+history_fields = {zone.name: history.fields[index] for index, zone in enumerate(zones)}
+
+# WATERING POLICIES
+# the threshold one waters until /set_watering_policy opts in to the predictive
+# one, the choice is kept in the config. Every policy learns from the samples
+# and pulses, a switch starts with a trained model.
+watering_policies = {
+    'threshold': ThresholdPolicy(),
+    'predictive': PredictivePolicy(history, history_fields),
+}
+
 
-def logger(message):
+def logger(message, event=INFO, value=0):
     global info_message
     if (message is not None):
         print(message)
+        eventlog.log(event, message, value)
     info_message = message
 
-def run_display(_):
-    global running
-    global inside_humidity
-    global info_message
-    global display_page
-    global pump_treshold
-    global pump_time
-    global connection_info
-    global plant_date
-    global plant_name
-    thermometer_ba = bytearray(b'\x00\x00\x00\x00\x00\x00\x00<\x00\x00f\x00\x00B\xe0\x00B\x00\x00B\x00\x00B\xe0\x00B\x00\x00B\x00\x00B\xe0\x00B\x00\x00B\x00\x00B\xe0\x00B\x00\x00\xc3\x00\x00\x81\x00\x00\x81\x00\x00\x81\x00\x00\x81\x00\x00\xc3\x00\x00~\x00\x00\x00\x00\x00\x00\x00'
-    )
-    thermometer_fb = framebuf.FrameBuffer(thermometer_ba,24,24, framebuf.MONO_HLSB)
-    
-    tear_ba = bytearray(b'\x00\x10\x00\x00\x18\x00\x00\x18\x00\x00<\x00\x00,\x00\x00$\x00\x00f\x00\x00\xc3\x00\x00\x81\x00\x01\x81\x80\x03\x00\xc0\x06\x00`\x04\x00`\x04\x00 \x0c\x000\x04\x00 \x0c\x000\x08\x00 \x04\x00 \x06\x00`\x06\x00@\x03\x01\xc0\x01\xef\x00\x00|\x00')
-    tear_fb = framebuf.FrameBuffer(tear_ba, 24,24, framebuf.MONO_HLSB)
+# PUMP CONTROLLER
+def pulse_watered(zone, before, pulse_ms):
+    # the active policy is told by the controller
+    for policy in watering_policies.values():
+        if policy is not pump_controller.policy:
+            policy.watered(zone, before, pulse_ms)
+
+pump_controller = PumpController(zone_scheduler, lambda message: logger(message, PUMP), policy=watering_policies['threshold'], max_attempts=max_pump_attempts, on_watered=pulse_watered)
+
+# METRICS
+# the HTTP metrics are added with the routes
+heap = Heap()
+metrics = Metrics('smartpot_')
+timer_duration = metrics.histogram('timer_callback_duration_seconds', 'Duration of the timer callbacks', CALLBACK_BUCKETS, ('display', 'hardware'), 'timer')
+metrics.counter('dht_failures_total', 'DHT11 readings failed after all retries', read=lambda: dht11.failures)
+metrics.counter('dht_errors_total', 'Failed DHT11 reading attempts', ('checksum', 'pulses'), 'kind', read=lambda: (dht11.checksum_errors, dht11.pulse_errors))
+metrics.counter('pump_cycles_total', 'Watering cycles started', read=lambda: pump_controller.cycles)
+metrics.counter('pump_pulses_total', 'Times a pump was switched on', read=lambda: pump_controller.pulses)
+metrics.counter('display_flushes_total', 'Frames sent to the display', read=lambda: oled.frames - oled.skipped_frames)
+metrics.counter('display_bytes_total', 'Bytes sent to the display', read=lambda: oled.total_bytes_sent)
+metrics.counter('gc_runs_total', 'Garbage collections seen', read=lambda: heap.runs())
+metrics.gauge('heap_free_bytes', 'Free heap', read=lambda: heap.free())
+metrics.counter('config_changes_total', 'Configuration changes', read=lambda: config.changes)
+metrics.counter('config_writes_total', 'Configuration writes to flash', read=lambda: config.writes)
+metrics.counter('config_bytes_written_total', 'Configuration bytes written to flash', read=lambda: config.bytes_written)
+metrics.counter('config_write_failures_total', 'Configuration writes that failed', read=lambda: config.failures)
+metrics.gauge('config_load_seconds', 'Time the configuration took to load at boot', read=lambda: config.load_us / 1000000)
+metrics.counter('events_logged_total', 'Events added to the event log', read=lambda: eventlog.logged)
+metrics.counter('events_dropped_total', 'Events dropped because the log buffer was full', read=lambda: eventlog.dropped)
+metrics.counter('eventlog_writes_total', 'Event log writes to flash', read=lambda: eventlog.flushes)
+metrics.counter('eventlog_bytes_written_total', 'Event log bytes written to flash', read=lambda: eventlog.bytes_written)
+metrics.gauge('wifi_connected', 'WiFi link up', read=lambda: 1 if wifi.connected else 0)
+metrics.counter('wifi_attempts_total', 'WiFi connection attempts', read=lambda: wifi.attempts)
+metrics.counter('wifi_failures_total', 'Failed WiFi connection attempts', read=lambda: wifi.failures)
+metrics.counter('wifi_fast_connects_total', 'WiFi connections made with the cached access point and address', read=lambda: wifi.fast_connects)
+metrics.gauge('wifi_connect_seconds', 'Duration of the last successful WiFi connection attempt', read=lambda: wifi.connect_ms / 1000 if wifi.connect_ms is not None else None)
+wifi_reconnect = metrics.histogram('wifi_reconnect_seconds', 'Time from a lost WiFi link to the next connection', (1000, 2000, 5000, 10000, 30000, 60000, 300000), scale=1000)
+metrics.gauge('ws_clients', 'Connected WebSocket clients', read=lambda: len(control_channel.clients))
+metrics.counter('ws_messages_total', 'WebSocket messages received', read=lambda: control_channel.messages)
+metrics.counter('ws_frames_sent_total', 'WebSocket frames sent', read=lambda: control_channel.frames_sent)
+metrics.counter('ws_strip_coalesced_total', 'Strip changes replaced by a newer one before they were shown', read=lambda: strip_coalesced)
+
+# DISPLAY PAGES
+thermometer_fb = framebuf.FrameBuffer(bytearray(b'\x00\x00\x00\x00\x00\x00\x00<\x00\x00f\x00\x00B\xe0\x00B\x00\x00B\x00\x00B\xe0\x00B\x00\x00B\x00\x00B\xe0\x00B\x00\x00B\x00\x00B\xe0\x00B\x00\x00\xc3\x00\x00\x81\x00\x00\x81\x00\x00\x81\x00\x00\x81\x00\x00\xc3\x00\x00~\x00\x00\x00\x00\x00\x00\x00'
+), 24, 24, framebuf.MONO_HLSB)
+tear_fb = framebuf.FrameBuffer(bytearray(b'\x00\x10\x00\x00\x18\x00\x00\x18\x00\x00<\x00\x00,\x00\x00$\x00\x00f\x00\x00\xc3\x00\x00\x81\x00\x01\x81\x80\x03\x00\xc0\x06\x00`\x04\x00`\x04\x00 \x0c\x000\x04\x00 \x0c\x000\x08\x00 \x04\x00 \x06\x00`\x06\x00@\x03\x01\xc0\x01\xef\x00\x00|\x00'
+), 24, 24, framebuf.MONO_HLSB)
+
+
+def draw_main_layer(fb):
+    fb.text('OUTSIDE', 0, 3)
+    fb.blit(thermometer_fb, 0, 12)
+    fb.blit(tear_fb, 0, 40)
+    fb.vline(58, 0, 64, 1)
+    fb.text('SENSOR', 65, 3)
+    fb.rect(64, 13, 60, 20, 1)
+    fb.text('DATA', 65, 36)
+
+
+def draw_main_values(fb, values):
+    temperature, humidity, soil, date, name = values
+    fb.text(f'{date}', 65, 46)
+    fb.text(f'{name}', 65, 56)
+    fb.text(f'{temperature}C', 28, 18)
+    fb.text(f'{humidity}%', 28, 46)
+    _fill_value = int(0 + (soil / 100) * (60 - 0)) if soil is not None else 0
+    fb.fill_rect(64, 13, _fill_value, 20, 1)
+
+
+sensors_position = [66, 80, 94, 108]
+
+
+def draw_zones_layer(fb):
+    draw_main_layer(fb)
+    fb.fill_rect(59, 0, 69, 64, 0)
+    fb.text('SENSORS', 65, 3)
+    for index, zone in enumerate(zones[:len(sensors_position)]):
+        fb.rect(sensors_position[index], 13, 10, 42, 1)
+        fb.text(zone.name, sensors_position[index] + 1, 57)
+
+
+def draw_zones_values(fb, values):
+    fb.text(f'{values[0]}C', 28, 18)
+    fb.text(f'{values[1]}%', 28, 46)
+    for index, moisture in enumerate(values[2:]):
+        if moisture:
+            bar = 42 * moisture // 100
+            fb.fill_rect(sensors_position[index], 55 - bar, 10, bar, 1)
+
+
+def draw_info_layer(fb):
+    fb.text('Treshold:', 0, 3)
+    fb.text('Pump time:', 0, 13)
+    fb.text('WiFi:', 0, 23)
+    fb.text('State:', 0, 33)
+
+
+def draw_info_values(fb, values):
+    treshold, seconds, name, status, ip = values
+    fb.text(f'{treshold}%', 80, 3)
+    fb.text(f'{seconds}s', 88, 13)
+    fb.text(f'{name}', 48, 23)
+    fb.text(f'{status}', 56, 33)
+    fb.text(f'{ip}', 0, 43)
+
+
+def draw_message(fb, values):
+    height = 0
+    for row in values[0]:
+        fb.text(row, 0, height)
+        height += 10
+
+
+renderer = Renderer(oled)
+renderer.add_layer('main', draw_main_layer)
+renderer.add_layer('info', draw_info_layer)
+renderer.add_layer('zones', draw_zones_layer)
+renderer.add_layer('message')
 
-    oled.fill(0)
-    
+
+def run_display(_):
     if info_message is not None:
-        height = 0
-        row = ''
-        for word in info_message.split(' '):
-            if len(row) + len(word) < 16:
-                row += word + ' '
-                oled.text(row, 0, height)
-            else:
-                height += 10
-                row = word + ' '
-                oled.text(row, 0, height)
+        renderer.render('message', (renderer.wrap(info_message),), draw_message)
+    elif display_page == 'main' and len(zones) > 1:
+        renderer.render('zones', (outside_temperature, outside_humidity) + tuple(zone.moisture for zone in zones), draw_zones_values)
     elif display_page == 'main':
-        oled.text('OUTSIDE', 0, 3)
-        oled.blit(thermometer_fb,0,12)
-        oled.blit(tear_fb, 0, 40)
-        
-        oled.vline(58, 0, 64, 1)
-        
-        oled.text('SENSOR', 65, 3)
-        
-        oled.rect(64, 13, 60, 20, 1)
-
-        oled.text('DATA', 65, 36)
-        oled.text(f'{plant_date}', 65, 46)
-        oled.text(f'{plant_name}', 65, 56)
-        oled.text(f'{outside_temperature}C', 28, 18)
-        oled.text(f'{outside_humidity}%', 28, 46)
-        
-        # FILL DATA
-        _fill_value = int(0 + (inside_humidity / 100) * (60 - 0)) if inside_humidity is not None else 0
-        oled.fill_rect(64, 13, _fill_value, 20, 1)
+        renderer.render('main', (outside_temperature, outside_humidity, zones[0].moisture, plant_date, plant_name), draw_main_values)
     elif display_page == 'info':
-        oled.text(f'Treshold: {pump_treshold}%', 0, 3)
-        oled.text(f'Pump time: {pump_time}s', 0, 13)
-        oled.text(f'WiFi: {connection_info["name"]}', 0, 23)
-        oled.text(f'State: {connection_info["status"]}', 0, 33)
-        oled.text(f'{connection_info["ip"]}', 0, 43)
-    
-    oled.show()
-    
-
-def run_pump():
-    global running
-    global pump_running
-    global pwm
-    global pump_active
-    global pump_flag
-    global pump_time
-    global inside_humidity
-    global pump_treshold
-    global info_message
-    
+        renderer.render('info', (zones[0].treshold, zones[0].pump_time, connection_info["name"], connection_info["status"], connection_info["ip"]), draw_info_values)
     
-    pump_running = True
-    while running:
-        if not pump_active:
-            print('Pump disabled - skiping starting pump')
-            logger(None)
-            break
-        if inside_humidity > pump_treshold:
-            print('Humidity level OK - skiping starting pump')
-            logger(None)
-            pump_flag = 0
-            break
-        
-        pump_flag += 1
-        logger(f'Humidity level low - trying to start pump: attemp #{pump_flag}')
-        run_display(None)
-        time.sleep(3)
-        
-        if pump_flag > 2:
-            logger(f'Too many tries - disabling pump')
-            switch_pump(False)
-            pump_flag = 0
-            time.sleep(3)
-            break
-        
-        logger(f'Starting pump for {pump_time}s')
-        run_display(None)
-        # start pump
-        pwm.freq(200)
-        pwm.duty_u16(45000)
-        
-        # water for x time
-        time.sleep(pump_time)
-        
-        # stop pump
-        pwm.duty_u16(0)
-        
-        logger(f'Waiting for imersia 5s')
-        run_display(None)
-        # wait for imersia
-        time.sleep(5)
-        
-        # do three measures
-        for _ in range(3):
-            read_soil_sensor()
-            logger(f'Reading sensor after watering - current level: {inside_humidity}%')
-            run_display(None)
-            time.sleep(3)
-    pump_running = False
-    
-def strip_animation_a(_):
-    global strip
-    
-    strip.rotate_right(1)
-    strip.show()
-
 
-def run_strip_animation(animation):
-    global strip_timer
-    global animation_running
-    
-    if animation_running:
-        strip_timer.deinit()
-    
-    animation_running = True
-    
-    red = (255, 0, 0)
-    orange = (255, 50, 0)
-    yellow = (255, 100, 0)
-    green = (0, 255, 0)
-    blue = (0, 0, 255)
-    indigo = (100, 0, 90)
-    violet = (200, 0, 100)
-    colors_rgb = [red, orange, yellow, green, blue, indigo, violet]
-
-    # same colors as normaln rgb, just 0 added at the end
-    colors_rgbw = [color+tuple([0]) for color in colors_rgb]
-    colors_rgbw.append((0, 0, 0, 255))
-
-    # uncomment colors_rgbw if you have RGBW strip
-    colors = colors_rgb
-    # colors = colors_rgbw
-    
+def run_pump(now):
+    # one step of the watering state machine, never blocks
+    global pump_event
+    pulses = pump_controller.pulses
+    state = pump_controller.state
+    pump_controller.step(pump_active, now)
+    if pump_controller.pulses != pulses:
+        pump_event = True
+    if state == DISABLED and pump_controller.state == IDLE and not any(zone.enabled for zone in zones):
+        switch_pump(False)
+
+def parse_color(rgb):
+    # the strip is wired GRB while driven in RGB mode, swap red and green
+    return (int(rgb[1]), int(rgb[0]), int(rgb[2]))
+
+
+def run_strip_animation(animation, color=None, period=None):
+    global strip_color
+    options = {}
+    if color is not None:
+        options['color'] = parse_color(color)
+    if period is not None:
+        options['period'] = period
     if animation == 'a':
-        
-        step = round(numpix / len(colors))
-        current_pixel = 0
-        strip.brightness(50)
-
-        for color1, color2 in zip(colors, colors[1:]):
-            strip.set_pixel_line_gradient(current_pixel, current_pixel + step, color1, color2)
-            current_pixel += step
-
-        strip.set_pixel_line_gradient(current_pixel, numpix - 1, violet, red)
-        strip_timer.init(period=50, mode=Timer.PERIODIC, callback=strip_animation_a)
+        animation = 'rainbow'
+    elif animation == 'moisture':
+        options['level'] = lambda: zones[0].moisture
+    animations.start(animation, **options)
+    strip_color = None
     
+
 def set_strip_color(rgb):
     global strip
-    global strip_timer
-    global animation_running
+    global strip_color
     
-    if animation_running:
-        strip_timer.deinit()
-        animation_running = False
+    animations.stop()
         
-    color = (int(rgb[1]), int(rgb[0]), int(rgb[2]))
+    color = parse_color(rgb)
+    strip_color = [int(value) for value in rgb]
     strip.fill(color)
     strip.show()
     print(f"LEDs set to color: {color}")
     
 def read_dht():
-    try:
-        global outside_humidity
-        global outside_temperature
-        dht11.measure()
-        outside_humidity = dht11.humidity()
-        outside_temperature = dht11.temperature()
-        print(f'Room Temperature: {outside_humidity}C')
-        print(f'Room Humidity: {outside_temperature}%')
-    except:
-        print('Failed to read dht')
+    # Takes the cached reading and starts the next one in the background,
+    # readings older than dht_max_age are shown as missing.
+    global outside_humidity
+    global outside_temperature
+    global dht_failures_logged
+    age = dht11.age_ms()
+    if age is not None and age < dht_max_age:
+        outside_humidity = dht11.humidity
+        outside_temperature = dht11.temperature
+        print(f'Room Temperature: {outside_temperature}C')
+        print(f'Room Humidity: {outside_humidity}% (read in {dht11.driver_us}us)')
+    else:
+        outside_humidity = '-'
+        outside_temperature = '-'
+        print(f'No recent dht reading, failed readings: {dht11.failures}')
+    if dht11.failures != dht_failures_logged:
+        dht_failures_logged = dht11.failures
+        eventlog.log(DHT_FAILED, 'DHT11 reading failed', dht11.failures)
+    dht11.start()
         
 def read_soil_sensor():
-    global inside_humidity
-    _value = soil_sensor["port"].read_u16()
-    _percent_value = (soil_sensor["soil_max"] - _value) * 100 / (soil_sensor["soil_max"] - soil_sensor["soil_min"])
-    inside_humidity = max(0, min(100, int(_percent_value)))
-    print(f'Soil Humidity: {inside_humidity}%')
+    # samples the next zones in turn, the cost per tick doesn't grow with the zones
+    zone_scheduler.tick()
+    for zone in zones:
+        print(f'Soil Humidity {zone.name}: {zone.moisture}% (variance {zone.sensor.variance()})')
 
 def button1_handler(pin):
     global pump_active
-    if ap_mode:
-        return
     pump_active = not pump_active
     switch_pump(pump_active)
     print("Button 1 pressed")
@@ -320,62 +391,50 @@ def switch_pump(value):
     global status_diode_2
     global pump_active
     pump_active = value
+    if value:
+        for zone in zones:
+            zone.enabled = True
+    else:
+        pump_controller.stop()
+        zone_scheduler.stop_all()
     status_diode_1.value(value)
     status_diode_2.value(not value)
     
 
-def load_html(filename):
-    with open(filename, 'rb') as file:
-        return file.read()
-
-
 def save_wifi_config(ssid, password):
-    with open('wifi_config.txt', 'w', encoding='utf-8') as f:
-        f.write(f'{ssid}\n{password}')
+    # written right away, the user may power the pot off or reset it as soon as the setup page confirms
+    config.set('wifi', {'ssid': ssid, 'password': password})
+    config.flush()
         
 
 def load_wifi_config():
-    try:
-        with open('wifi_config.txt', 'r') as f:
-            ssid = f.readline().strip()
-            password = f.readline().strip()
-            return ssid, password
-    except OSError:
+    wifi = config.get('wifi')
+    if not wifi:
         return None, None
+    return wifi['ssid'], wifi['password']
     
-def save_pump_config(treshold, time):
-    with open('pump_config.txt', 'w', encoding='utf-8') as f:
-        f.write(f'{treshold}\n{time}')
+def save_pump_config():
+    # treshold and time of every zone by zone name
+    config.set('zones', {zone.name: {'treshold': zone.treshold, 'time': zone.pump_time} for zone in zones})
     
 def load_pump_config():
-    try:
-        with open('pump_config.txt', 'r') as f:
-            treshold = f.readline().strip()
-            time = f.readline().strip()
-            return int(treshold), int(time)
-    except OSError:
-        return None, None
+    return config.get('zones', {})
     
-def set_pump_config(treshold, time):
-    global pump_treshold
-    global pump_time
-    
-    pump_treshold = treshold
-    pump_time = time
+def set_pump_config(treshold, time, zone=None):
+    if zone is None:
+        zone = zones[0]
+    zone.treshold = treshold
+    zone.pump_time = time
 
 def save_plant_data(date, name):
-    with open('plant_data.txt', 'w', encoding='utf-8') as f:
-        f.write(f'{date}\n{name}')
+    config.set('plant', {'date': date, 'name': name})
 
-# Funkcja do odczytu danych o roślinie z pliku
+# Funkcja do odczytu danych o roślinie
 def load_plant_data():
-    try:
-        with open('plant_data.txt', 'r') as f:
-            date = f.readline().strip()
-            name = f.readline().strip()
-            return date, name
-    except OSError:
+    plant = config.get('plant')
+    if not plant:
         return None, None
+    return plant['date'], plant['name']
 
 # Funkcja do ustawiania danych o roślinie
 def set_plant_data(date, name):
@@ -384,250 +443,704 @@ def set_plant_data(date, name):
     plant_date = date
     plant_name = name
 
-def parse_query_params(query):
-    params = {}
-    for param in query.split('&'):
-        key, value = param.split('=')
-        params[key] = value
-    return params
-
-def serve_ap_website():
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)#creating socket object
-    s.bind(('', 80))
-    s.listen(5)
-    
-    ap_index = load_html('ap_index.html')
-    ap_configure = load_html('ap_configure.html')
-    
-    while True:
-        cl, addr = s.accept()
-        print('Client connected from', addr)
-        request = cl.recv(1024).decode()
-        print('Request:', request)
-
-        if 'GET / ' in request:
-            response = ap_index
-            cl.send(response)
-
-        if 'POST /configure ' in request:
-                match = ure.search(r'ssid=([^&]*)&password=(.*)', request)
-                if match:
-                    ssid = match.group(1).replace('%20', ' ').replace('+', ' ')
-                    password = match.group(2).replace('%20', ' ')
-                    save_wifi_config(ssid, password)
-                    response = ap_configure.format(ssid, password)
-                    cl.send(response)
-        cl.close()
-
-def run_ap():
-    global ap_mode
-    
-    ap = network.WLAN(network.AP_IF)
-    ap.config(essid='SmartPot', password='qqqwwweee')
-    ap.active(True)
-    while ap.active() == False:
-        logger('Starting AP...')
-    
-    logger('AP Mode Is Active IP:' + ap.ifconfig()[0])
-    
-    serve_ap_website()
+def set_watering_policy(name):
+    pump_controller.policy = watering_policies[name]
+    config.set('watering_policy', name)
+
+def migrate_legacy_config():
+    # the settings used to be kept in one text file each
+    lines = {}
+    for name in legacy_config_files:
+        try:
+            with open(name, 'r') as f:
+                lines[name] = [line.strip() for line in f]
+        except OSError:
+            pass
+    if not lines:
+        return
+    wifi = lines.get('wifi_config.txt', [])
+    if len(wifi) >= 2 and wifi[0]:
+        config.set('wifi', {'ssid': wifi[0], 'password': wifi[1]})
+    pump = [line for line in lines.get('pump_config.txt', []) if line]
+    try:
+        config.set('zones', {zone.name: {'treshold': int(pump[i * 2]), 'time': int(pump[i * 2 + 1])} for i, zone in enumerate(zones[:len(pump) // 2])})
+    except ValueError:
+        pass
+    plant = lines.get('plant_data.txt', [])
+    if len(plant) >= 2:
+        config.set('plant', {'date': plant[0], 'name': plant[1]})
+    config.flush()
+    if config.dirty:
+        # not written, the old files are read again at the next boot
+        return
+    for name in lines:
+        os.remove(name)
+    print(f'Moved {", ".join(lines)} to {config.path}')
 
+def escape_html(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
 
-def open_wifi_socket(ip):
-    # Open a socket
-    address = (ip, 80)
-    connection = socket.socket()
-    connection.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    connection.bind(address)
-    connection.listen(1)
-    return connection
 
+def portal_redirect(request):
+    # the connectivity probes of phones and laptops ask for other hosts, the
+    # redirect makes them open the sign-in window with the setup page
+    return Response(b'', 302, None, [('Location', 'http://{}/'.format(ap_ip)), ('Cache-Control', 'no-store')])
 
-def serve_wifi_website(connection):
-    global pump_time
-    global pump_treshold
-    global outside_humidity
-    global outside_temperature
-    global inside_humidity
-    global plant_date
-    global plant_name
-    global pump_active
+portal_router = Router(fallback=portal_redirect)
+
+
+@portal_router.route('/')
+def route_portal_index(request):
+    return assets.response('ap_index.html', request)
+
+
+@portal_router.route('/configure', methods=('POST',))
+def route_portal_configure(request):
+    form = request.form()
+    ssid = form.get('ssid', '')
+    password = form.get('password', '')
+    # WPA2 passphrases are 8 to 63 characters, an open network has none
+    if not 0 < len(ssid) <= 32 or (password and not 8 <= len(password) <= 63):
+        return Response('Invalid parameters', 400)
+    save_wifi_config(ssid, password)
+    logger(f'WiFi config saved for {ssid}', WIFI)
+    # connects in the background, the portal stays up
+    wifi.configure(ssid, password)
+    return Response(assets.raw('ap_configure.html').decode().format(escape_html(ssid)), 200, 'text/html')
+
+
+async def run_ap():
+    # waits for the access point mode, from the boot without WiFi settings or
+    # a long press of button 2, then serves the portal until the next reset
+    global ap_ip
+    while not ap_mode:
+        await asyncio.sleep(tick_ms / 1000)
+    ap = network.WLAN(network.AP_IF)
+    ap.config(essid=ap_ssid, password=ap_password)
+    ap.active(True)
+    while not ap.active():
+        await asyncio.sleep(0.1)
+    ap_ip = ap.ifconfig()[0]
+    logger('AP Mode Is Active IP:' + ap_ip)
+
+    assets.load('ap_index.html')
+    dns = DNSResponder(ap_ip, dns_port)
+    dns.start(ap_ip)
+    asyncio.create_task(dns.serve())
+    server = HTTPServer(portal_router)
+    await server.start(ap_ip, ap_http_port)
+    await server.wait_closed()
+
+
+def backend_data():
+    return {"treshold": zones[0].treshold, "time": zones[0].pump_time, "humidity": outside_humidity, "temperature": outside_temperature, 'soil': zones[0].moisture, 'name': plant_name, 'date': plant_date, 'pump_active': pump_active, 'pump_state': pump_controller.state, 'zones': [zone.state() for zone in zones]}
+
+backend_feed = StateFeed(backend_data)
+
+
+def pack_reading(value):
+    # tenths, -32768 while there is no reading
+    return -32768 if value == '-' or value is None else int(value * 10)
+
+
+def pack_text(text):
+    data = (text or '').encode()[:255]
+    return bytes((len(data),)) + data
+
+
+def pack_backend_data(state):
+    # Binary form of backend_data, little endian. Treshold, time and soil of
+    # the JSON are those of the first zone.
+    #   '<BhhBBB' layout version 1, temperature and humidity in tenths,
+    #             flags (bit 0 pump active), index of the pump state in
+    #             lib.pump.STATES, number of zones
+    #   per zone '<BBHB' soil (255 unknown), treshold, time, flags (bit 0
+    #             enabled, bit 1 watering), then the name
+    #   plant name and plant date
+    # texts are a length byte and UTF-8
+    parts = [struct.pack('<BhhBBB', 1, pack_reading(state['temperature']), pack_reading(state['humidity']),
+                         1 if state['pump_active'] else 0, STATES.index(state['pump_state']), len(state['zones']))]
+    for zone in state['zones']:
+        # clamped, a config saved by an older firmware may hold any int
+        parts.append(struct.pack('<BBHB', 255 if zone['soil'] is None else zone['soil'], max(0, min(255, zone['treshold'])),
+                                 max(0, min(65535, zone['time'])), (1 if zone['enabled'] else 0) | (2 if zone['watering'] else 0)))
+        parts.append(pack_text(zone['name']))
+    parts.append(pack_text(state['name']))
+    parts.append(pack_text(state['date']))
+    return b''.join(parts)
+
+# the bodies are encoded again only when backend_feed sees a change
+backend_snapshots = SnapshotCache(backend_feed, {
+    'json': ('application/json', lambda state: json.dumps(state).encode()),
+    'bin': ('application/octet-stream', pack_backend_data),
+})
+metrics.counter('snapshot_hits_total', 'Backend data requests answered from the cached body', backend_snapshots.names, 'format', read=lambda: backend_snapshots.hits)
+metrics.counter('snapshot_misses_total', 'Backend data requests that encoded the state', backend_snapshots.names, 'format', read=lambda: backend_snapshots.misses)
+metrics.counter('snapshot_encode_seconds_total', 'Time spent encoding the backend data', backend_snapshots.names, 'format', read=lambda: [us / 1000000 for us in backend_snapshots.total_encode_us])
+metrics.gauge('snapshot_encode_seconds', 'Duration of the last encoding of the backend data', backend_snapshots.names, 'format', read=lambda: [us / 1000000 for us in backend_snapshots.encode_us])
+metrics.gauge('snapshot_hit_ratio', 'Share of the backend data requests answered from the cached body', read=lambda: backend_snapshots.hit_rate())
+
+
+# STATE API
+# GET /api/v1/state returns the sections listed in fields=, POST and PATCH
+# take a JSON object of sections and change all of them in one request. The
+# whole batch is checked before the first setting is applied, so a bad value
+# changes nothing, and the config store writes it to flash once.
+state_sections = {
+    'sensors': lambda: {'temperature': outside_temperature, 'humidity': outside_humidity},
+    'pump': lambda: {'active': pump_active, 'state': pump_controller.state, 'policy': pump_controller.policy.name},
+    'plant': lambda: {'date': plant_date, 'name': plant_name},
+    'strip': lambda: {'color': strip_color, 'animation': animations.name},
+    'zones': lambda: {zone.name: zone.state() for zone in zones},
+}
+# applied in this order, switching the pump on enables every zone before
+# the zone settings come
+writable_sections = ('pump', 'zones', 'plant', 'strip')
+
+
+def api_state(fields=None):
+    state = {}
+    for name in fields.split(',') if fields else state_sections:
+        if name not in state_sections:
+            raise ValueError('Unknown field: ' + name)
+        state[name] = state_sections[name]()
+    return state
+
+
+def check_keys(section, settings, keys):
+    if not isinstance(settings, dict):
+        raise ValueError(section + ' must be an object')
+    for key in settings:
+        if key not in keys:
+            raise ValueError('Unknown setting: {}.{}'.format(section, key))
+
+
+def check_int(name, value, low, high):
+    # bool is an int subclass on CPython
+    if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+        raise ValueError('{} must be an integer from {} to {}'.format(name, low, high))
+    return value
+
+
+def check_bool(name, value):
+    if not isinstance(value, bool):
+        raise ValueError(name + ' must be true or false')
+    return value
+
+
+def check_text(name, value):
+    if not isinstance(value, str):
+        raise ValueError(name + ' must be a string')
+    return value
+
+
+def check_color(value):
+    if not isinstance(value, list) or len(value) != 3:
+        raise ValueError('strip.color must be [r, g, b]')
+    for channel in value:
+        check_int('strip.color', channel, 0, 255)
+    return value
+
+
+def plan_state_update(changes):
+    """
+    Check every setting of a POST or PATCH body.
+
+    :param changes: dict of section name to settings, e.g. {'zones': {'A': {'treshold': 40}}}
+    :return: list of (function, args) applying the changes, raises ValueError on the first bad setting
+    """
+    if not isinstance(changes, dict):
+        raise ValueError('Expected a JSON object')
+    for name in changes:
+        if name not in writable_sections:
+            raise ValueError('Unknown or read-only field: ' + name)
+    actions = []
+    pump = changes.get('pump')
+    if pump is not None:
+        check_keys('pump', pump, ('active', 'policy'))
+        if 'policy' in pump:
+            if pump['policy'] not in watering_policies:
+                raise ValueError('Unknown policy: {}'.format(pump['policy']))
+            actions.append((set_watering_policy, (pump['policy'],)))
+        if 'active' in pump:
+            actions.append((switch_pump, (check_bool('pump.active', pump['active']),)))
+    zone_changes = changes.get('zones')
+    if zone_changes is not None:
+        check_keys('zones', zone_changes, [zone.name for zone in zones])
+        for name, settings in zone_changes.items():
+            zone = zone_scheduler.zone(name)
+            section = 'zones.' + name
+            check_keys(section, settings, ('treshold', 'time', 'enabled'))
+            treshold = check_int(section + '.treshold', settings.get('treshold', zone.treshold), 0, 100)
+            pump_time = check_int(section + '.time', settings.get('time', zone.pump_time), 1, 3600)
+            actions.append((set_pump_config, (treshold, pump_time, zone)))
+            if 'enabled' in settings:
+                actions.append((setattr, (zone, 'enabled', check_bool(section + '.enabled', settings['enabled']))))
+        actions.append((save_pump_config, ()))
+    plant = changes.get('plant')
+    if plant is not None:
+        check_keys('plant', plant, ('date', 'name'))
+        date = check_text('plant.date', plant['date']) if 'date' in plant else plant_date
+        name = check_text('plant.name', plant['name']) if 'name' in plant else plant_name
+        actions.append((set_plant_data, (date, name)))
+        actions.append((save_plant_data, (date, name)))
+    strip_changes = changes.get('strip')
+    if strip_changes is not None:
+        check_keys('strip', strip_changes, ('color', 'animation', 'period'))
+        color = check_color(strip_changes['color']) if 'color' in strip_changes else None
+        animation = strip_changes.get('animation')
+        if animation is not None:
+            if animation not in EFFECTS:
+                raise ValueError('Unknown animation: {}'.format(animation))
+            for key in strip_changes:
+                if key != 'animation' and key not in EFFECTS[animation].options:
+                    raise ValueError('Animation {} has no setting {}'.format(animation, key))
+            period = check_int('strip.period', strip_changes['period'], 10, 60000) if 'period' in strip_changes else None
+            actions.append((run_strip_animation, (animation, color, period)))
+        elif color is not None:
+            actions.append((set_strip_color, (color,)))
+        elif 'period' in strip_changes:
+            raise ValueError('strip.period needs strip.animation')
+    return actions
+
+
+def update_state(changes):
+    actions = plan_state_update(changes)
+    for function, args in actions:
+        function(*args)
+
+
+# CONTROL CHANNEL
+# /ws, a WebSocket taking the same batches as PATCH /api/v1/state. Strip
+# changes are only kept, the latest one is shown on the next frame, so
+# dragging the colour picker costs one strip.show() per frame however fast
+# the browser sends. Changed sections are pushed to every client.
+strip_frame_ms = 20
+state_push_ms = 250
+pending_strip = None
+strip_coalesced = 0
+state_changed = False
+
+
+def control_open(client):
+    client.send(api_state())
+
+
+def control_message(client, text):
+    global pending_strip
+    global strip_coalesced
+    global state_changed
+    try:
+        changes = json.loads(text)
+        plan_state_update(changes)
+    except ValueError as e:
+        client.send({'error': str(e)})
+        return
+    strip_changes = changes.pop('strip', None)
+    if strip_changes is not None:
+        if pending_strip is not None:
+            strip_coalesced += 1
+        pending_strip = strip_changes
+    if changes:
+        update_state(changes)
+        state_changed = True
+
+control_channel = Channel(control_message, control_open)
+
+
+async def run_control_channel():
+    global pending_strip
+    global state_changed
+    sent = {}
+    waited = 0
     while True:
-        client = connection.accept()[0]
-        request = client.recv(1024)
-        request = str(request)
-        print(request)
-
-        match = ure.search(r'GET\s([^\s]+)', request)
-        if match:
-            path = match.group(1)
-            if '?' in path:
-                path, query = path.split('?', 1)
-                params = parse_query_params(query)
-            else:
-                params = {}
-                
-        if '/set_strip_color' in request:
-            if 'rgb' in params:
-                    rgb = params['rgb'].split(',')
-                    set_strip_color(rgb)
-                    response = 'HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\nOK'
-            else:
-                response = 'HTTP/1.1 400 Bad Request\r\nContent-Type: text/plain\r\n\r\nInvalid parameters'
-        elif '/turn_off_strip' in request:
-            set_strip_color([0,0,0])
-            response = 'HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\nOK'
-        elif '/run_animation_a' in request:
-            run_strip_animation('a')
-            response = 'HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\nOK'
-        elif '/switch_pump' in request:
-            switch_pump(not pump_active)
-            response = 'HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\nOK'
-        elif path == '/set_plant_data':
-                if 'date' in params and 'name' in params:
-                    plant_date = params['date']
-                    plant_name = params['name']
-                    set_plant_data(plant_date, plant_name)
-                    save_plant_data(plant_date, plant_name)
-                    response = 'HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\nPlant data updated'
-                else:
-                    response = 'HTTP/1.1 400 Bad Request\r\nContent-Type: text/plain\r\n\r\nInvalid parameters'
-        elif path == '/set_pump_config':
-                if 'time' in params and 'treshold' in params:
-                    pump_time = int(params['time'])
-                    pump_treshold = int(params['treshold'])
-                    set_pump_config(pump_treshold, pump_time)
-                    save_pump_config(pump_treshold, pump_time)
-                    response = 'HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\nOK'
-                else:
-                    response = 'HTTP/1.1 400 Bad Request\r\nContent-Type: text/plain\r\n\r\nInvalid parameters'
-        elif path == '/get_backend_data':
-                response = 'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n' + json.dumps({"treshold": pump_treshold, "time": pump_time, "humidity": outside_humidity, "temperature": outside_temperature, 'soil': inside_humidity, 'name': plant_name, 'date': plant_date, 'pump_active': pump_active})
-        else:
-            html_content = load_html('wifi_index.html')
-            response = b'HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n' + html_content
-            client.sendall(response)
-            client.close()
+        await asyncio.sleep(strip_frame_ms / 1000)
+        waited += strip_frame_ms
+        if pending_strip is not None:
+            strip_changes = pending_strip
+            pending_strip = None
+            try:
+                update_state({'strip': strip_changes})
+            except ValueError as e:
+                print('Strip change failed:', e)
+            state_changed = True
+        if not control_channel.clients:
             continue
-            
-        client.send(response)
-        client.close()
-    
-        
-def hardware_loop(_):
-    global pump_running
-    global logger
-    if ap_mode == True:
-        run_ap()
-    read_dht()
-    read_soil_sensor()
-    if not pump_running:
-        run_pump()
-        
-def connect_to_wifi(ssid, password):
-    global onboard_led
-    global connection_info
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-        
-    wlan.connect(ssid, password)
-    timeout = 5
+        if state_changed or waited >= state_push_ms:
+            state_changed = False
+            waited = 0
+            state = api_state()
+            changes = {name: value for name, value in state.items() if sent.get(name) != value}
+            sent = state
+            if changes:
+                control_channel.broadcast(changes)
 
-    while not wlan.isconnected() and timeout > 0:
-        print(wlan.status())
-        onboard_led.toggle()
-        logger(f'Connecting to {ssid} WiFi...')
-        time.sleep(1)
-        timeout -= 1
-    if wlan.isconnected():
-        onboard_led.on()
-        ip = wlan.ifconfig()[0]
-        connection_info = {
-                "status": 'Connected',
-                "name": ssid,
-                "ip": ip
-            }
-        logger(f'Connected to {ssid} WiFi with IP: {ip}')
-        time.sleep(3)
-        logger(None)
-        connection = open_wifi_socket(ip)
-        serve_wifi_website(connection)
-    else:
-        onboard_led.off()
-        message = None
-        if wlan.status() == -3:
-            message = 'Wrong password'
-        elif wlan.status() == -2:
-            message = 'No access point found'
-        elif wlan.status() == -1:
-            message = 'Failed to connect'
-        else:
-            message = 'Error: Unknown'
-        logger(f'Failed to connect to WiFi: {message}')
-        connection_info = {
-                "status": 'Disconnected',
-                "name": ssid,
-                "ip": None
-            }
-        time.sleep(3)
-        logger(None)
-def main():
-    global running
-    global pump_active
-    global logger
+
+router = Router(fallback=lambda request: assets.response('wifi_index.html', request))
+
+
+@router.route('/')
+def route_index(request):
+    return assets.response('wifi_index.html', request)
+
+
+@router.route('/set_strip_color')
+def route_set_strip_color(request):
+    params = request.params
+    if 'rgb' in params:
+        try:
+            rgb = check_color([int(value) for value in params['rgb'].split(',')])
+        except ValueError:
+            return Response('Invalid parameters', 400)
+        set_strip_color(rgb)
+        return Response('OK')
+    return Response('Invalid parameters', 400)
+
+
+@router.route('/turn_off_strip')
+def route_turn_off_strip(request):
+    set_strip_color([0,0,0])
+    return Response('OK')
+
+
+@router.route('/run_animation_a')
+def route_run_animation_a(request):
+    run_strip_animation('a')
+    return Response('OK')
+
+
+@router.route('/run_animation')
+def route_run_animation(request):
+    params = request.params
+    if 'name' not in params:
+        return Response('Invalid parameters', 400)
     try:
-        
-        switch_pump(pump_active)
-        
-        treshold, time = load_pump_config()
-        if treshold and time:
-            set_pump_config(treshold, time)
-        else:
-            set_pump_config(50, 5)
+        color = params['color'].split(',') if 'color' in params else None
+        period = int(params['period']) if 'period' in params else None
+        run_strip_animation(params['name'], color, period)
+    except (ValueError, TypeError, IndexError):
+        return Response('Invalid parameters', 400)
+    return Response('OK')
 
-        date, name = load_plant_data()
-        if date and name:
-            set_plant_data(date, name)
-        else:
-            set_plant_data(None, None)
-        
-        display_timer = Timer(-1)
-        display_timer.init(period=500, mode=Timer.PERIODIC, callback=run_display)
-        
-        hardware_timer = Timer(-1)
-        hardware_timer.init(period=5000, mode=Timer.PERIODIC, callback=hardware_loop) 
-    
-        ssid, password = load_wifi_config()
-        if ssid and password:
-            connect_to_wifi(ssid, password)
-        else:
-            logger('No WiFi config detected go to AP mode')
 
-    except KeyboardInterrupt:
-        print('Finished loop')
-        display_timer.deinit()
-        hardware_timer.deinit()
-        running = False
-        
-main()
-    
+@router.route('/get_animation')
+def route_get_animation(request):
+    return Response(json.dumps(animations.status()), content_type='application/json')
+
+
+@router.route('/switch_pump')
+def route_switch_pump(request):
+    switch_pump(not pump_active)
+    return Response('OK')
+
+
+@router.route('/set_plant_data')
+def route_set_plant_data(request):
+    params = request.params
+    if 'date' in params and 'name' in params:
+        set_plant_data(params['date'], params['name'])
+        save_plant_data(plant_date, plant_name)
+        return Response('Plant data updated')
+    return Response('Invalid parameters', 400)
+
+
+@router.route('/set_pump_config')
+def route_set_pump_config(request):
+    params = request.params
+    zone = zone_scheduler.zone(params.get('zone', zones[0].name))
+    if 'time' in params and 'treshold' in params and zone is not None:
+        try:
+            # the ranges of /api/v1/state, the binary backend data packs them in a byte and a short
+            treshold = check_int('treshold', int(params['treshold']), 0, 100)
+            pump_time = check_int('time', int(params['time']), 1, 3600)
+        except ValueError:
+            return Response('Invalid parameters', 400)
+        set_pump_config(treshold, pump_time, zone)
+        save_pump_config()
+        return Response('OK')
+    return Response('Invalid parameters', 400)
+
+
+@router.route('/get_pump_state')
+def route_get_pump_state(request):
+    return Response(json.dumps(pump_controller.status()), content_type='application/json')
+
+
+@router.route('/get_watering_model')
+def route_get_watering_model(request):
+    return Response(json.dumps(pump_controller.policy.state()), content_type='application/json')
+
+
+@router.route('/reset_watering_model')
+def route_reset_watering_model(request):
+    params = request.params
+    if 'zone' in params and zone_scheduler.zone(params['zone']) is None:
+        return Response('Invalid parameters', 400)
+    pump_controller.policy.reset(params.get('zone'))
+    return Response('OK')
 
 
+@router.route('/set_watering_policy')
+def route_set_watering_policy(request):
+    params = request.params
+    if params.get('name') not in watering_policies:
+        return Response('Invalid parameters', 400)
+    set_watering_policy(params['name'])
+    return Response('OK')
 
 
+@router.route('/switch_zone')
+def route_switch_zone(request):
+    zone = zone_scheduler.zone(request.params.get('zone'))
+    if zone is None:
+        return Response('Invalid parameters', 400)
+    zone.enabled = not zone.enabled
+    return Response('OK')
 
 
+@router.route('/get_backend_data')
+def route_get_backend_data(request):
+    name = request.params.get('format', 'json')
+    if name not in backend_snapshots.formats:
+        return Response('Invalid parameters', 400)
+    return backend_snapshots.response(request, name)
 
 
+@router.route('/events')
+def route_events(request):
+    return event_stream(backend_feed)
 
 
+@router.route('/logs')
+def route_logs(request):
+    params = request.params
+    try:
+        limit = int(params.get('limit', 50))
+        eventlog.parse_cursor(params.get('cursor'))
+    except ValueError:
+        return Response('Invalid parameters', 400)
+    if limit < 1:
+        # an empty page would hand back the same cursor forever
+        return Response('Invalid parameters', 400)
+    return LogStream(eventlog, params.get('cursor'), limit)
+
+
+@router.route('/metrics')
+def route_metrics(request):
+    if request.params.get('format') == 'json':
+        return Response(json.dumps(metrics.snapshot()), content_type='application/json')
+    return Response(metrics.prometheus(), content_type='text/plain; version=0.0.4')
+
+
+@router.route('/history')
+def route_history(request):
+    params = request.params
+    try:
+        start = int(params['from']) if params.get('from') else None
+        end = int(params['to']) if params.get('to') else None
+        step = int(params['step']) if params.get('step') else None
+    except ValueError:
+        return Response('Invalid parameters', 400)
+    step, buckets = history.downsample(start, end, step)
+    return Response(json.dumps({'now': int(time.time()), 'step': step, 'fields': history.fields, 'buckets': buckets}), content_type='application/json')
+
+
+@router.route('/api/v1/state', methods=('GET', 'POST', 'PATCH'))
+def route_api_state(request):
+    fields = request.params.get('fields')
+    try:
+        if request.method != 'GET':
+            changes = json.loads(bytes(request.body)) if request.body else None
+            update_state(changes)
+            # answer with the sections that were changed unless fields= asks for others
+            fields = fields or ','.join(changes)
+        state = api_state(fields)
+    except ValueError as e:
+        return Response(json.dumps({'error': str(e)}), 400, 'application/json')
+    return Response(json.dumps(state), content_type='application/json')
+
+
+@router.route('/ws')
+def route_ws(request):
+    return control_channel.accept(request)
+
+
+def handle_wifi_request(request):
+    print(request.method, request.path)
+    return router(request)
 
 
+# HTTP METRICS
+# one row per route, requests to other paths are counted as 'other'
+http_requests = metrics.counter('http_requests_total', 'HTTP requests by route', tuple(router.routes), 'route')
+http_errors = metrics.counter('http_errors_total', 'HTTP responses with a 4xx or 5xx status', tuple(router.routes), 'route')
+http_latency = metrics.histogram('http_request_duration_seconds', 'Time from the parsed request to the written response', LATENCY_BUCKETS, tuple(router.routes), 'route')
 
 
+def observe_request(request, response, us):
+    http_requests.inc(request.path)
+    if response.status >= 400:
+        http_errors.inc(request.path)
+    http_latency.observe(us, request.path)
 
 
+async def start_wifi_website(ip):
+    # Runs on the asyncio loop, the display and hardware timers keep firing
+    # while clients are served.
+    assets.load('wifi_index.html')
+    server = HTTPServer(handle_wifi_request, keep_alive=True, observer=observe_request)
+    await server.start(ip, http_port)
+    return server
 
 
+async def serve_wifi_website(ip):
+    server = await start_wifi_website(ip)
+    await server.wait_closed()
 
+
+async def run_wifi():
+    # steps the connection manager, the web server is started when the link
+    # comes up and stopped when it goes down, the address may change
+    global wifi_message_until
+    server = None
+    while True:
+        wifi.step()
+        if wifi.connected and server is None:
+            try:
+                server = await start_wifi_website(wifi.ip)
+            except OSError as e:
+                print('Web server failed to start:', e)
+        elif not wifi.connected and server is not None:
+            server.close()
+            server = None
+        if wifi_message_until is not None and time.ticks_diff(time.ticks_ms(), wifi_message_until) >= 0:
+            wifi_message_until = None
+            logger(None)
+        await asyncio.sleep(wifi_check_ms / 1000)
+
+
+async def run_services():
+    # the event log writer and the access point run with or without WiFi
+    asyncio.create_task(eventlog.writer())
+    asyncio.create_task(run_ap())
+    asyncio.create_task(run_control_channel())
+    await run_wifi()
+    
+        
+def record_history():
+    global pump_event
+    for index, zone in enumerate(zones):
+        history_values[index] = zone.moisture
+    history_values[-2] = outside_temperature
+    history_values[-1] = outside_humidity
+    history.append(time.time(), history_values, pump_event)
+    pump_event = False
+
+
+def hardware_loop(_):
+    global last_sensor_read
+    heap.sample()
+    now = time.ticks_ms()
+    if last_sensor_read is None or time.ticks_diff(now, last_sensor_read) >= sensor_period:
+        last_sensor_read = now
+        read_dht()
+        read_soil_sensor()
+        record_history()
+        for policy in watering_policies.values():
+            policy.observe()
+    run_pump(now)
+    write_config(now)
+
+
+def write_config(now):
+    global config_failures_logged
+    config.poll(now)
+    if config.failures != config_failures_logged:
+        config_failures_logged = config.failures
+        eventlog.log(CONFIG_FAILED, 'Config write failed: {}'.format(config.error), config.failures)
+        
+def wifi_changed(manager):
+    # called by the manager on every state change
+    global connection_info
+    global wifi_message_until
+    global wifi_reconnects
+    state = manager.state
+    status = manager.wlan.status()
+    if state == CONNECTED:
+        onboard_led.on()
+        connection_info = {"status": 'Connected', "name": manager.ssid, "ip": manager.ip}
+        if manager.reconnects != wifi_reconnects:
+            wifi_reconnects = manager.reconnects
+            wifi_reconnect.observe(manager.reconnect_ms)
+        logger(f'Connected to {manager.ssid} WiFi with IP: {manager.ip}', WIFI, status)
+    elif state == CONNECTING:
+        onboard_led.toggle()
+        connection_info = {"status": 'Connecting', "name": manager.ssid, "ip": None}
+        print(f'Connecting to {manager.ssid} WiFi...')
+        return
+    elif state == BACKOFF:
+        onboard_led.off()
+        connection_info = {"status": 'Disconnected', "name": manager.ssid, "ip": None}
+        logger(f'Failed to connect to WiFi: {manager.error}, next try in {time.ticks_diff(manager.deadline, manager.since) // 1000}s', WIFI_FAILED, status)
+    elif state == WIFI_IDLE and manager.lost_at is not None and connection_info["status"] == 'Connected':
+        onboard_led.off()
+        connection_info = {"status": 'Disconnected', "name": manager.ssid, "ip": None}
+        logger('WiFi connection lost', WIFI_FAILED, status)
+    else:
+        return
+    # the message stays on the display for a moment
+    wifi_message_until = time.ticks_add(time.ticks_ms(), wifi_message_ms)
+
+
+def setup():
+    # restores the saved settings and starts the timers, the simulator calls
+    # this directly to run the firmware without the web server
+    switch_pump(pump_active)
+
+    if not config.load():
+        migrate_legacy_config()
+    print(f'Config version {config.version} loaded in {config.load_us}us')
+    eventlog.log(BOOT, f'config version {config.version}', machine.reset_cause())
+
+    saved = load_pump_config()
+    for zone in zones:
+        if zone.name in saved:
+            set_pump_config(saved[zone.name]['treshold'], saved[zone.name]['time'], zone)
+    if config.get('watering_policy') in watering_policies:
+        pump_controller.policy = watering_policies[config.get('watering_policy')]
+
+    date, name = load_plant_data()
+    if date and name:
+        set_plant_data(date, name)
+    else:
+        set_plant_data(None, None)
+    
+    display_timer = Timer(-1)
+    display_timer.init(period=500, mode=Timer.PERIODIC, callback=timed(run_display, timer_duration, 'display'))
+    
+    hardware_timer = Timer(-1)
+    hardware_timer.init(period=tick_ms, mode=Timer.PERIODIC, callback=timed(hardware_loop, timer_duration, 'hardware'))
+    return display_timer, hardware_timer
+
+def main():
+    global running
+    global ap_mode
+    display_timer, hardware_timer = setup()
+    try:
+        ssid, password = load_wifi_config()
+        if ssid:
+            wifi.configure(ssid, password)
+        else:
+            logger('No WiFi config detected go to AP mode')
+            ap_mode = True
+        asyncio.run(run_services())
+
+    except KeyboardInterrupt:
+        print('Finished loop')
+        eventlog.flush()
+        display_timer.deinit()
+        hardware_timer.deinit()
+        running = False
+        
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+# Host simulator of the smart pot.
+#
+# Runs the unmodified firmware under CPython. sim/modules provides machine,
+# rp2, network, framebuf, micropython and utime, backed by a VirtualClock and
+# the devices of a Board: soil pots with pumps, a DHT11 answering with real
+# pulse trains, a recording SSD1306, a Neopixel sink behind the PIO and access
+# points giving loopback addresses. install() puts the modules on sys.path and
+# points the MicroPython time functions of the time module at the clock.
+#
+#   from sim import Simulator
+#   simulator = Simulator()
+#   firmware = simulator.boot()      # imports main.py and starts its timers
+#   simulator.run(86400)             # a day of operation
+#
+# python3 -m sim runs it from the command line.
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from sim import runtime
+from sim.board import Board
+from sim.clock import VirtualClock, ticks_add, ticks_diff
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modules')
+TIME_FUNCTIONS = ('ticks_ms', 'ticks_us', 'ticks_add', 'ticks_diff', 'sleep', 'sleep_ms', 'sleep_us', 'time')
+
+_saved_time = {}
+
+
+def install(clock=None, board=None):
+    """
+    Make the simulator the hardware of this process.
+
+    :param clock: [default: None] VirtualClock, a new one if None
+    :param board: [default: None] Board, Board.smart_pot() if None
+    :return: (clock, board)
+    """
+    clock = clock or VirtualClock()
+    runtime.clock = clock
+    runtime.board = board or Board.smart_pot()
+    for path in (os.path.join(ROOT, 'lib'), ROOT, MODULES):
+        if path in sys.path:
+            sys.path.remove(path)
+        sys.path.insert(0, path)
+    if not _saved_time:
+        for name in TIME_FUNCTIONS:
+            if hasattr(time, name):
+                _saved_time[name] = getattr(time, name)
+    time.ticks_ms = clock.ticks_ms
+    time.ticks_us = clock.ticks_us
+    time.ticks_add = ticks_add
+    time.ticks_diff = ticks_diff
+    time.sleep = clock.sleep
+    time.sleep_ms = clock.sleep_ms
+    time.sleep_us = clock.sleep_us
+    time.time = clock.time
+    import network
+    network.WLAN._interfaces.clear()
+    return clock, runtime.board
+
+
+def uninstall():
+    for name in TIME_FUNCTIONS:
+        if name in _saved_time:
+            setattr(time, name, _saved_time[name])
+        elif hasattr(time, name):
+            delattr(time, name)
+    if MODULES in sys.path:
+        sys.path.remove(MODULES)
+
+
+class Simulator:
+    def __init__(self, board=None, clock=None, flash=None, wifi=True):
+        """
+        :param board: [default: None] Board, Board.smart_pot() if None
+        :param clock: [default: None] VirtualClock, a new one if None
+        :param flash: [default: None] directory used as the flash file system, a temporary one if None
+        :param wifi: [default: True] store the credentials of the first access point
+        """
+        self.clock, self.board = install(clock, board)
+        self.flash = flash or tempfile.mkdtemp(prefix='smartpot-flash-')
+        for name in os.listdir(ROOT):
+            if name.endswith('.html') or name.endswith('.html.gz'):
+                shutil.copy(os.path.join(ROOT, name), self.flash)
+        if wifi and self.board.access_points:
+            from lib.config import ConfigStore
+            ssid, password = self.board.access_points[0][:2]
+            config = ConfigStore(os.path.join(self.flash, 'config.json'))
+            config.load()
+            config.set('wifi', {'ssid': ssid, 'password': password})
+            config.flush()
+        os.chdir(self.flash)
+        self.firmware = None
+
+    def boot(self, start=True):
+        """
+        Import main.py, a fresh copy on every call.
+
+        :param start: [default: True] call setup(), restoring the settings and starting the timers
+        :return: the firmware module
+        """
+        for name in list(sys.modules):
+            if name == 'main' or name in ('dht', 'ssd1306') or name.startswith('lib.'):
+                del sys.modules[name]
+        import main
+        self.firmware = main
+        if start:
+            main.setup()
+        return main
+
+    def run(self, seconds):
+        """
+        Run the timers for <seconds> of virtual time.
+
+        :return: real seconds it took
+        """
+        started = time.perf_counter()
+        self.clock.run(seconds)
+        return time.perf_counter() - started
+
+    def serve(self, port=8080, speed=1):
+        """
+        Run main() with the web server on 127.0.0.1:<port>, the virtual clock
+        runs <speed> times faster than real time. Blocks until interrupted.
+        """
+        firmware = self.firmware or self.boot(start=False)
+        firmware.http_port = port
+        self.clock.run_realtime(speed)
+        try:
+            firmware.main()
+        finally:
+            self.clock.stop_realtime()
+
+    def stats(self):
+        board = self.board
+        firmware = self.firmware
+        stats = {
+            'virtual_seconds': self.clock.us / 1000000,
+            'timers_fired': self.clock.timers_fired,
+            'dht_readings': sum(sensor.readings for sensor in board.dht.values()),
+            'display_bytes': board.display.bytes,
+            'display_transactions': board.display.transactions,
+            'strip_frames': board.strip.frames,
+            'pump_activations': [pot.activations for pot in board.pots],
+            'pump_seconds': [round(pot.pump_seconds, 1) for pot in board.pots],
+            'moisture': [round(pot.moisture, 1) for pot in board.pots],
+        }
+        if firmware is not None:
+            stats['frames'] = firmware.renderer.frames
+            stats['skipped_frames'] = firmware.renderer.skipped_frames
+            stats['history_samples'] = firmware.history.count
+            stats['dht_failures'] = firmware.dht11.failures
+            stats['pump_pulses'] = firmware.pump_controller.pulses
+        return stats
@@ -0,0 +1,54 @@
+# Usage:
+#   python3 -m sim [--days N] [--json] [--screen]    run the firmware for N virtual days
+#   python3 -m sim --serve PORT [--speed X]          web server on 127.0.0.1:PORT
+#
+# --pump switches the watering on, --verbose keeps the output of the firmware.
+
+import argparse
+import contextlib
+import json
+import os
+
+from sim import Simulator
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python3 -m sim')
+    parser.add_argument('--days', type=float, default=1)
+    parser.add_argument('--serve', type=int, metavar='PORT')
+    parser.add_argument('--speed', type=float, default=1)
+    parser.add_argument('--pump', action='store_true')
+    parser.add_argument('--flash')
+    parser.add_argument('--json', action='store_true')
+    parser.add_argument('--screen', action='store_true')
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    simulator = Simulator(flash=args.flash)
+    if args.serve:
+        firmware = simulator.boot(start=False)
+        firmware.pump_active = args.pump
+        simulator.serve(args.serve, args.speed)
+        return
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    with quiet:
+        firmware = simulator.boot()
+        firmware.switch_pump(args.pump)
+        real = simulator.run(args.days * 86400)
+    stats = simulator.stats()
+    stats['real_seconds'] = round(real, 2)
+    stats['speedup'] = round(stats['virtual_seconds'] / real) if real else None
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        for key, value in stats.items():
+            print(f'{key:22} {value}')
+    if args.screen:
+        print(simulator.board.display.dump())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# Wiring of the simulated board.
+#
+# Peripherals created by the firmware look up their device here by pin
+# number or bus address. Board.smart_pot() wires the devices the way main.py
+# expects them.
+
+from sim.devices import DHT11Sensor, NeopixelSink, Pot, SSD1306Recorder
+
+
+class Board:
+    def __init__(self):
+        # pin -> object with read_u16()
+        self.adc = {}
+        # pin -> object with duty(value)
+        self.pwm = {}
+        # pin -> DHT11Sensor
+        self.dht = {}
+        # (bus, address) -> object with write(data)
+        self.i2c = {}
+        # state machine id -> object with put(word)
+        self.state_machines = {}
+        # pin name or number -> level of the inputs
+        self.inputs = {}
+        # created machine.Pin objects, used by press()
+        self.pins = {}
+        # (ssid, password, bssid, channel, rssi) of the simulated access points
+        self.access_points = []
+        # a connect without a BSSID scans first, a static address skips DHCP
+        self.scan_ms = 1200
+        self.associate_ms = 300
+        self.dhcp_ms = 1000
+        self.link_up = True
+
+    @classmethod
+    def smart_pot(cls, zones=1, num_leds=8):
+        board = cls()
+        board.pots = []
+        for pin_adc, pin_pump in ((27, 26), (28, 22))[:zones]:
+            pot = Pot()
+            board.adc[pin_adc] = pot
+            board.pwm[pin_pump] = pot
+            board.pots.append(pot)
+        board.dht[5] = DHT11Sensor()
+        board.display = board.i2c[(0, 0x3C)] = SSD1306Recorder()
+        board.strip = board.state_machines[0] = NeopixelSink(num_leds)
+        board.access_points.append(('SimNet', 'simsecret', b'\x02\x00\x00\x00\x00\x01', 6, -48))
+        return board
+
+    def press(self, pin, duration_ms=100):
+        """
+        Press and release a button wired between <pin> and 3V3.
+        """
+        from sim import runtime
+        button = self.pins[pin]
+        button._set_input(1)
+        runtime.clock.sleep_ms(duration_ms)
+        button._set_input(0)
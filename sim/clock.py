@@ -0,0 +1,133 @@
+# Virtual clock of the simulator.
+#
+# Time only moves when the firmware sleeps, when a simulated peripheral costs
+# time (e.g. polling a pin) or when the simulator runs it forward with run().
+# Timers fire in order of their due time, one at a time like MicroPython soft
+# timers, so days of operation take seconds. ticks_ms and ticks_us wrap at
+# TICKS_PERIOD like on the board.
+
+import heapq
+import threading
+# bound now, install() points the time module at the virtual clock later
+from time import monotonic as _monotonic, sleep as _sleep
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALF = TICKS_PERIOD // 2
+EPOCH = 1700000000
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & TICKS_MAX
+
+
+def ticks_diff(end, start):
+    return ((end - start + TICKS_HALF) & TICKS_MAX) - TICKS_HALF
+
+
+class VirtualClock:
+    def __init__(self, epoch=EPOCH, ticks_offset=0):
+        """
+        :param epoch: [default: EPOCH] wall clock seconds at the start of the simulation
+        :param ticks_offset: [default: 0] start value of the tick counters, set it close to TICKS_PERIOD to test wrapping
+        """
+        self.us = 0
+        self.epoch = epoch
+        self.ticks_offset = ticks_offset
+        self.timers_fired = 0
+        # set by run_realtime(), sleeps then wait for the ticker thread
+        self.speed = None
+        self.lock = threading.RLock()
+        self._timers = []
+        self._sequence = 0
+        self._firing = False
+        self._ticker = None
+
+    # MicroPython time API
+
+    def ticks_ms(self):
+        return (self.us // 1000 + self.ticks_offset) & TICKS_MAX
+
+    def ticks_us(self):
+        return (self.us + self.ticks_offset) & TICKS_MAX
+
+    def time(self):
+        return self.epoch + self.us // 1000000
+
+    def time_ns(self):
+        return (self.epoch * 1000000 + self.us) * 1000
+
+    def sleep_us(self, us):
+        if self.speed is not None and threading.current_thread() is not self._ticker:
+            _sleep(us / 1000000 / self.speed)
+            return
+        self.advance(int(us))
+
+    def sleep_ms(self, ms):
+        self.sleep_us(ms * 1000)
+
+    def sleep(self, seconds):
+        self.sleep_us(seconds * 1000000)
+
+    # timers
+
+    def schedule(self, timer, delay_us):
+        with self.lock:
+            self._sequence += 1
+            timer._sequence = self._sequence
+            heapq.heappush(self._timers, (self.us + max(1, int(delay_us)), self._sequence, timer))
+
+    def cancel(self, timer):
+        # lazy removal, the heap entry is skipped when its sequence is stale
+        timer._sequence = None
+
+    def advance(self, us):
+        """
+        Move the time forward by <us>, firing the timers that become due.
+        Timers don't fire while a timer callback runs, like soft timers.
+        """
+        if self._firing:
+            self.us += us
+            return
+        with self.lock:
+            end = self.us + us
+            timers = self._timers
+            while timers and timers[0][0] <= end:
+                due, sequence, timer = heapq.heappop(timers)
+                if timer._sequence != sequence:
+                    continue
+                self.us = max(self.us, due)
+                timer._sequence = None
+                if timer._period_us:
+                    self.schedule(timer, timer._period_us - (self.us - due))
+                self._firing = True
+                try:
+                    timer._fire()
+                finally:
+                    self._firing = False
+                self.timers_fired += 1
+            self.us = max(self.us, end)
+
+    def run(self, seconds):
+        self.advance(int(seconds * 1000000))
+
+    def run_realtime(self, speed=1, step_ms=10):
+        """
+        Start a thread advancing the clock <speed> times faster than real time,
+        for running the firmware together with real network clients.
+        """
+        self.speed = speed
+
+        def tick():
+            last = _monotonic()
+            while self.speed is not None:
+                _sleep(step_ms / 1000)
+                now = _monotonic()
+                self.advance(int((now - last) * 1000000 * speed))
+                last = now
+
+        self._ticker = threading.Thread(target=tick, daemon=True)
+        self._ticker.start()
+
+    def stop_realtime(self):
+        self.speed = None
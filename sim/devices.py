@@ -0,0 +1,298 @@
+# Simulated devices attached to the board.
+
+import math
+import random
+
+from sim import runtime
+
+SOIL_MIN = 18600
+SOIL_MAX = 43000
+
+
+class Pot:
+    def __init__(self, moisture=70, drying_per_hour=1.5, gain_per_second=2.0, soak_seconds=60, noise=150,
+                 trace=None, soil_min=SOIL_MIN, soil_max=SOIL_MAX):
+        """
+        Soil of a pot with a capacitive sensor (ADC) and a pump (PWM).
+
+        :param moisture: [default: 70] initial moisture in percent
+        :param drying_per_hour: [default: 1.5] mean drying rate without a trace
+        :param gain_per_second: [default: 2.0] percent one second of pumping finally adds
+        :param soak_seconds: [default: 60] time constant of the water soaking in
+        :param noise: [default: 150] standard deviation of the raw ADC readings
+        :param trace: [default: None] list of (seconds, drying percent per second) replacing the day/night cycle
+        :param soil_min: [default: SOIL_MIN] raw reading in water
+        :param soil_max: [default: SOIL_MAX] raw reading in dry air
+        """
+        self.moisture = moisture
+        self.drying_per_hour = drying_per_hour
+        self.gain_per_second = gain_per_second
+        self.soak_seconds = soak_seconds
+        self.noise = noise
+        self.trace = trace
+        self.soil_min = soil_min
+        self.soil_max = soil_max
+        self.pending = 0
+        self.pumping = False
+        self.pump_seconds = 0
+        self.activations = 0
+        self.overflow = 0
+        self._seconds = None
+
+    def drying(self, seconds):
+        if self.trace:
+            period = self.trace[-1][0]
+            offset = seconds % period if period else 0
+            for end, rate in self.trace:
+                if offset <= end:
+                    return rate
+            return self.trace[-1][1]
+        # faster during the day, slower at night
+        return self.drying_per_hour / 3600 * (1 + 0.6 * math.sin(2 * math.pi * seconds / 86400))
+
+    def advance(self, seconds, dt):
+        if self.pumping:
+            self.pending += self.gain_per_second * dt
+            self.pump_seconds += dt
+        soaked = self.pending * min(1, dt / self.soak_seconds)
+        self.pending -= soaked
+        self.moisture += soaked - self.drying(seconds) * dt
+        if self.moisture > 100:
+            self.overflow += self.moisture - 100
+            self.moisture = 100
+        self.moisture = max(0, self.moisture)
+
+    def update(self, seconds):
+        # bring the model up to <seconds> in steps of at most one second
+        if self._seconds is None:
+            self._seconds = seconds
+        while self._seconds < seconds:
+            dt = min(1, seconds - self._seconds)
+            self._seconds += dt
+            self.advance(self._seconds, dt)
+
+    def now(self):
+        return runtime.clock.us / 1000000
+
+    # ADC side
+    def read_u16(self):
+        self.update(self.now())
+        raw = self.soil_max - self.moisture / 100 * (self.soil_max - self.soil_min) + random.gauss(0, self.noise)
+        return max(0, min(65535, int(raw)))
+
+    # PWM side
+    def duty(self, value):
+        self.update(self.now())
+        pumping = value > 0
+        if pumping and not self.pumping:
+            self.activations += 1
+        self.pumping = pumping
+
+
+class DHT11Sensor:
+    # pulse train after the host releases the line, in us
+    RELEASE = 30
+    RESPONSE = 80
+    BIT_LOW = 50
+    ZERO = 27
+    ONE = 70
+
+    def __init__(self, temperature=22.0, humidity=45.0, swing=3.0, error_rate=0.0, read_cost_us=8):
+        """
+        DHT11 answering a start signal with a real pulse train.
+
+        :param temperature: [default: 22.0] mean temperature
+        :param humidity: [default: 45.0] mean relative humidity
+        :param swing: [default: 3.0] day/night amplitude of the temperature
+        :param error_rate: [default: 0.0] probability of a corrupted bit per reading
+        :param read_cost_us: [default: 8] virtual time one pin read takes
+        """
+        self.temperature = temperature
+        self.humidity = humidity
+        self.swing = swing
+        self.error_rate = error_rate
+        self.read_cost_us = read_cost_us
+        self.readings = 0
+        self._low_since = None
+        self._edges = None
+        self._edge = 0
+        self._released = 0
+
+    def values(self):
+        seconds = runtime.clock.us / 1000000
+        day = math.sin(2 * math.pi * seconds / 86400)
+        temperature = self.temperature + self.swing * day
+        humidity = self.humidity - 2 * self.swing * day
+        return int(round(humidity)), int(round(temperature * 10))
+
+    def frame(self):
+        humidity, temperature = self.values()
+        data = [humidity, 0, temperature // 10, temperature % 10]
+        data.append(sum(data) & 0xFF)
+        if self.error_rate and random.random() < self.error_rate:
+            data[random.randrange(4)] ^= 1 << random.randrange(8)
+        return data
+
+    def host_drive(self, value):
+        # the host pulls the line low for the start signal and releases it
+        now = runtime.clock.us
+        if value == 0:
+            if self._low_since is None:
+                self._low_since = now
+            self._edges = None
+        else:
+            self._low_since = None
+
+    def host_release(self):
+        now = runtime.clock.us
+        if self._low_since is not None and now - self._low_since >= 18000:
+            self._released = now
+            self._edges = self._pulse_train()
+            self._edge = 0
+            self.readings += 1
+        self._low_since = None
+
+    def _pulse_train(self):
+        # end time (relative to the release) and level of every segment
+        edges = []
+        t = 0
+        for duration, level in ((self.RELEASE, 1), (self.RESPONSE, 0), (self.RESPONSE, 1)):
+            t += duration
+            edges.append((t, level))
+        for byte in self.frame():
+            for bit in range(7, -1, -1):
+                t += self.BIT_LOW
+                edges.append((t, 0))
+                t += self.ONE if byte >> bit & 1 else self.ZERO
+                edges.append((t, 1))
+        t += self.BIT_LOW
+        edges.append((t, 0))
+        return edges
+
+    def level(self):
+        clock = runtime.clock
+        clock.advance(self.read_cost_us)
+        if self._edges is None:
+            return 1
+        elapsed = clock.us - self._released
+        edges = self._edges
+        # reads only move forward in time, continue from the last segment
+        while self._edge < len(edges):
+            end, level = edges[self._edge]
+            if elapsed < end:
+                return level
+            self._edge += 1
+        self._edges = None
+        return 1
+
+
+class SSD1306Recorder:
+    # commands followed by argument bytes
+    ARGUMENTS = {0x20: 1, 0x21: 2, 0x22: 2, 0x81: 1, 0x8D: 1, 0xA8: 1, 0xD3: 1, 0xD5: 1, 0xD9: 1, 0xDA: 1, 0xDB: 1}
+
+    def __init__(self, width=128, height=64):
+        """
+        SSD1306 on the I2C bus, keeps the display RAM and bus statistics.
+        """
+        self.width = width
+        self.height = height
+        self.pages = height // 8
+        self.ram = bytearray(self.pages * width)
+        self.on = False
+        self.columns = (0, width - 1)
+        self.page_range = (0, self.pages - 1)
+        self._column = 0
+        self._page = 0
+        self._command = None
+        self._arguments = []
+        self.transactions = 0
+        self.bytes = 0
+        self.data_bytes = 0
+        self.flushes = 0
+
+    def write(self, data):
+        self.transactions += 1
+        self.bytes += len(data)
+        control = data[0]
+        if control & 0x40:
+            self._data(data[1:])
+        else:
+            # Co=1 control bytes alternate with command bytes
+            for i in range(1, len(data), 2 if control & 0x80 else 1):
+                self._command_byte(data[i])
+
+    def _command_byte(self, byte):
+        if self._command is not None:
+            self._arguments.append(byte)
+            if len(self._arguments) < self.ARGUMENTS[self._command]:
+                return
+            command, arguments = self._command, self._arguments
+            self._command = None
+            self._arguments = []
+            if command == 0x21:
+                self.columns = (arguments[0], arguments[1])
+                self._column = arguments[0]
+            elif command == 0x22:
+                self.page_range = (arguments[0], arguments[1])
+                self._page = arguments[0]
+            return
+        if byte in self.ARGUMENTS:
+            self._command = byte
+        elif byte & 0xFE == 0xAE:
+            self.on = bool(byte & 1)
+
+    def _data(self, data):
+        self.flushes += 1
+        self.data_bytes += len(data)
+        c0, c1 = self.columns
+        p0, p1 = self.page_range
+        for byte in data:
+            self.ram[self._page * self.width + self._column] = byte
+            # horizontal addressing mode, wraps inside the window
+            self._column += 1
+            if self._column > c1:
+                self._column = c0
+                self._page += 1
+                if self._page > p1:
+                    self._page = p0
+
+    def pixel(self, x, y):
+        return self.ram[(y // 8) * self.width + x] >> (y & 7) & 1
+
+    def dump(self):
+        """
+        The display contents as text, two rows per line.
+        """
+        lines = []
+        for y in range(0, self.height, 2):
+            lines.append(''.join(' .\'|'[self.pixel(x, y) | self.pixel(x, y + 1) << 1] for x in range(self.width)))
+        return '\n'.join(lines)
+
+
+class NeopixelSink:
+    def __init__(self, num_leds, bits=24):
+        """
+        Receives the words a state machine shifts out and collects the frames.
+
+        :param num_leds: words per frame
+        :param bits: [default: 24] bits per pixel, 32 for RGBW strips
+        """
+        self.num_leds = num_leds
+        self.bits = bits
+        self.words = 0
+        self.frames = 0
+        self.frame = [0] * num_leds
+        self._index = 0
+
+    def put(self, word):
+        self.words += 1
+        self.frame[self._index] = (word & 0xFFFFFFFF) >> (32 - self.bits)
+        self._index += 1
+        if self._index == self.num_leds:
+            self._index = 0
+            self.frames += 1
+
+    def colors(self):
+        # (first, second, third) bytes in wire order of every pixel
+        shift = self.bits - 8
+        return [tuple(word >> (shift - 8 * i) & 0xFF for i in range(self.bits // 8)) for word in self.frame]
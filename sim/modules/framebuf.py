@@ -0,0 +1,129 @@
+# framebuf module of the simulator, the monochrome formats only.
+#
+# There is no font ROM, text() draws a fixed 8x8 pattern per character code.
+# The pattern is stable, so screen dumps can be compared between runs, and
+# every character covers the same cells as on the board.
+
+MONO_VLSB = 0
+MONO_HLSB = 3
+MONO_HMSB = 4
+
+
+def _glyph(code):
+    if code == 32:
+        return bytes(8)
+    columns = bytearray(8)
+    seed = code * 2654435761 & 0xFFFFFFFF
+    for i in range(1, 6):
+        seed = (seed * 1103515245 + 12345) & 0xFFFFFFFF
+        columns[i] = (seed >> 16) & 0x7E | 0x02
+    return bytes(columns)
+
+
+_GLYPHS = [_glyph(code) for code in range(128)]
+
+
+class FrameBuffer:
+    def __init__(self, buffer, width, height, format, stride=None):
+        if format not in (MONO_VLSB, MONO_HLSB, MONO_HMSB):
+            raise ValueError('format not supported by the simulator')
+        self._buffer = buffer
+        self._width = width
+        self._height = height
+        self._format = format
+        self._stride = stride or width
+
+    def _index(self, x, y):
+        if self._format == MONO_VLSB:
+            return (y >> 3) * self._stride + x, y & 7
+        offset = y * ((self._stride + 7) >> 3) + (x >> 3)
+        return offset, (7 - (x & 7)) if self._format == MONO_HLSB else (x & 7)
+
+    def pixel(self, x, y, c=None):
+        if not (0 <= x < self._width and 0 <= y < self._height):
+            return None
+        index, bit = self._index(x, y)
+        if c is None:
+            return self._buffer[index] >> bit & 1
+        if c:
+            self._buffer[index] |= 1 << bit
+        else:
+            self._buffer[index] &= ~(1 << bit) & 0xFF
+
+    def fill(self, c):
+        value = 0xFF if c else 0
+        buffer = self._buffer
+        if self._format == MONO_VLSB and self._stride == self._width and len(buffer) == self._width * ((self._height + 7) // 8):
+            buffer[:] = bytes([value]) * len(buffer)
+            return
+        self.fill_rect(0, 0, self._width, self._height, c)
+
+    def fill_rect(self, x, y, w, h, c):
+        x0 = max(0, x)
+        y0 = max(0, y)
+        x1 = min(self._width, x + w)
+        y1 = min(self._height, y + h)
+        for yy in range(y0, y1):
+            for xx in range(x0, x1):
+                self.pixel(xx, yy, c)
+
+    def rect(self, x, y, w, h, c, f=False):
+        if f:
+            self.fill_rect(x, y, w, h, c)
+            return
+        self.fill_rect(x, y, w, 1, c)
+        self.fill_rect(x, y + h - 1, w, 1, c)
+        self.fill_rect(x, y, 1, h, c)
+        self.fill_rect(x + w - 1, y, 1, h, c)
+
+    def hline(self, x, y, w, c):
+        self.fill_rect(x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        self.fill_rect(x, y, 1, h, c)
+
+    def line(self, x0, y0, x1, y1, c):
+        dx = abs(x1 - x0)
+        dy = -abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        error = dx + dy
+        while True:
+            self.pixel(x0, y0, c)
+            if x0 == x1 and y0 == y1:
+                break
+            e2 = 2 * error
+            if e2 >= dy:
+                error += dy
+                x0 += sx
+            if e2 <= dx:
+                error += dx
+                y0 += sy
+
+    def text(self, s, x, y, c=1):
+        for char in str(s):
+            glyph = _GLYPHS[ord(char) & 0x7F]
+            for column in range(8):
+                bits = glyph[column]
+                for row in range(8):
+                    if bits >> row & 1:
+                        self.pixel(x + column, y + row, c)
+            x += 8
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        for yy in range(fbuf._height):
+            for xx in range(fbuf._width):
+                c = fbuf.pixel(xx, yy)
+                if c != key:
+                    self.pixel(x + xx, y + yy, c)
+
+    def scroll(self, dx, dy):
+        width = self._width
+        height = self._height
+        pixels = [[self.pixel(x, y) for x in range(width)] for y in range(height)]
+        for y in range(height):
+            for x in range(width):
+                sx = x - dx
+                sy = y - dy
+                if 0 <= sx < width and 0 <= sy < height:
+                    self.pixel(x, y, pixels[sy][sx])
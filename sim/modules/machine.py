@@ -0,0 +1,181 @@
+# machine module of the simulator, backed by sim.runtime.
+
+from sim import runtime
+
+PWRON_RESET = 1
+WDT_RESET = 3
+
+
+def freq(hz=None):
+    return 125000000
+
+
+def reset():
+    raise SystemExit('machine.reset()')
+
+
+def reset_cause():
+    return PWRON_RESET
+
+
+def unique_id():
+    return b'\x53\x49\x4d\x00\x00\x00\x00\x01'
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self.pull = pull
+        self._value = 0
+        self._handler = None
+        self._trigger = 0
+        self._dht = runtime.board.dht.get(id)
+        runtime.board.pins[id] = self
+        if value is not None:
+            self.value(value)
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if self._dht is not None and mode == Pin.IN and self.mode != Pin.IN:
+            self._dht.host_release()
+        self.mode = mode
+        self.pull = pull
+        if value is not None:
+            self.value(value)
+
+    def value(self, value=None):
+        if value is None:
+            if self._dht is not None and self.mode == Pin.IN:
+                return self._dht.level()
+            if self.mode == Pin.IN:
+                return runtime.board.inputs.get(self.id, 1 if self.pull == Pin.PULL_UP else 0)
+            return self._value
+        self._value = 1 if value else 0
+        if self._dht is not None and self.mode == Pin.OUT:
+            self._dht.host_drive(self._value)
+
+    __call__ = value
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def toggle(self):
+        self.value(1 - self._value)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING):
+        self._handler = handler
+        self._trigger = trigger
+
+    def _set_input(self, level):
+        previous = self.value()
+        runtime.board.inputs[self.id] = level
+        if self._handler is None or level == previous:
+            return
+        if (level and self._trigger & Pin.IRQ_RISING) or (not level and self._trigger & Pin.IRQ_FALLING):
+            self._handler(self)
+
+
+class ADC:
+    def __init__(self, pin):
+        self.id = pin.id if isinstance(pin, Pin) else pin
+        self._device = runtime.board.adc.get(self.id)
+
+    def read_u16(self):
+        if self._device is None:
+            return 0
+        return self._device.read_u16()
+
+
+class PWM:
+    def __init__(self, pin):
+        self.id = pin.id if isinstance(pin, Pin) else pin
+        self._device = runtime.board.pwm.get(self.id)
+        self._freq = 0
+        self._duty = 0
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self._duty
+        self._duty = value
+        if self._device is not None:
+            self._device.duty(value)
+
+    def deinit(self):
+        self.duty_u16(0)
+
+
+class I2C:
+    def __init__(self, id, sda=None, scl=None, freq=400000):
+        self.id = id
+        self.freq = freq
+        self.bytes = 0
+
+    def _device(self, addr):
+        device = runtime.board.i2c.get((self.id, addr))
+        if device is None:
+            raise OSError(19)  # ENODEV, like a missing ACK
+        return device
+
+    def scan(self):
+        return [addr for bus, addr in runtime.board.i2c if bus == self.id]
+
+    def _transfer(self, addr, data):
+        device = self._device(addr)
+        self.bytes += len(data) + 1
+        # address byte included, 9 clocks per byte with the ACK
+        runtime.clock.advance((len(data) + 1) * 9 * 1000000 // self.freq)
+        device.write(data)
+        return len(data)
+
+    def writeto(self, addr, buf, stop=True):
+        return self._transfer(addr, bytes(buf))
+
+    def writevto(self, addr, vector, stop=True):
+        return self._transfer(addr, b''.join(bytes(buf) for buf in vector))
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, mode=PERIODIC, period=-1, freq=-1, callback=None):
+        self._sequence = None
+        self._period_us = 0
+        self._callback = None
+        if callback is not None:
+            self.init(mode=mode, period=period, freq=freq, callback=callback)
+
+    def init(self, mode=PERIODIC, period=-1, freq=-1, callback=None):
+        clock = runtime.clock
+        clock.cancel(self)
+        if freq > 0:
+            period_us = 1000000 // freq
+        else:
+            period_us = period * 1000
+        self._callback = callback
+        self._period_us = period_us if mode == Timer.PERIODIC else 0
+        clock.schedule(self, period_us)
+
+    def deinit(self):
+        runtime.clock.cancel(self)
+        self._period_us = 0
+
+    def _fire(self):
+        if self._callback is not None:
+            self._callback(self)
@@ -0,0 +1,24 @@
+# micropython module of the simulator.
+
+
+def const(value):
+    return value
+
+
+def native(function):
+    return function
+
+
+viper = native
+
+
+def mem_info(verbose=None):
+    print('mem: simulated')
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def schedule(function, argument):
+    function(argument)
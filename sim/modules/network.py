@@ -0,0 +1,107 @@
+# network module of the simulator. Connections are to the access points of
+# sim.runtime.board, a connected interface gets a loopback address so the
+# firmware's servers are reachable from the host.
+
+from sim import runtime
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_WRONG_PASSWORD = -3
+STAT_NO_AP_FOUND = -2
+STAT_CONNECT_FAIL = -1
+STAT_GOT_IP = 3
+
+
+class WLAN:
+    _interfaces = {}
+
+    def __new__(cls, interface=STA_IF):
+        # one object per interface, like on the board
+        if interface not in cls._interfaces:
+            wlan = super().__new__(cls)
+            wlan._setup(interface)
+            cls._interfaces[interface] = wlan
+        return cls._interfaces[interface]
+
+    def _setup(self, interface):
+        self.interface = interface
+        self._active = False
+        self._status = STAT_IDLE
+        self._connected_at = None
+        self._ap = None
+        self._config = {'essid': 'PICO', 'password': '', 'channel': 1}
+        self._static = None
+        self.connects = 0
+
+    def active(self, value=None):
+        if value is None:
+            return self._active
+        self._active = bool(value)
+        if not value:
+            self.disconnect()
+
+    def config(self, *names, **values):
+        if names:
+            return self._config.get(names[0])
+        self._config.update(values)
+
+    def scan(self):
+        # blocks on the board as well
+        runtime.clock.advance(runtime.board.scan_ms * 1000)
+        if not runtime.board.link_up:
+            return []
+        return [(ssid.encode(), bssid, channel, rssi, 3, False) for ssid, _, bssid, channel, rssi in runtime.board.access_points]
+
+    def connect(self, ssid=None, key=None, bssid=None):
+        self.connects += 1
+        self._ap = None
+        self._connected_at = None
+        board = runtime.board
+        for ap_ssid, password, ap_bssid, channel, rssi in board.access_points if board.link_up else ():
+            if ap_ssid == ssid and (bssid is None or bssid == ap_bssid):
+                if password != key:
+                    self._status = STAT_WRONG_PASSWORD
+                    return
+                self._ap = (ap_ssid, ap_bssid, channel, rssi)
+                self._status = STAT_CONNECTING
+                delay_ms = board.associate_ms
+                if bssid is None:
+                    delay_ms += board.scan_ms
+                if self._static is None:
+                    delay_ms += board.dhcp_ms
+                self._connected_at = runtime.clock.us + delay_ms * 1000
+                return
+        self._status = STAT_NO_AP_FOUND
+
+    def disconnect(self):
+        self._ap = None
+        self._connected_at = None
+        self._status = STAT_IDLE
+
+    def status(self, param=None):
+        if param == 'rssi':
+            return self._ap[3] if self._ap else 0
+        if self._status == STAT_CONNECTING and runtime.clock.us >= self._connected_at:
+            self._status = STAT_GOT_IP
+        if self._status == STAT_GOT_IP and not runtime.board.link_up:
+            self._status = STAT_CONNECT_FAIL
+            self._ap = None
+        return self._status
+
+    def isconnected(self):
+        if self.interface == AP_IF:
+            return self._active
+        return self._active and self.status() == STAT_GOT_IP
+
+    def ifconfig(self, config=None):
+        if config is not None and self.interface == STA_IF:
+            self._static = None if config == 'dhcp' else tuple(config)
+            return
+        if self.interface == AP_IF and self._active:
+            return ('127.0.0.1', '255.255.255.0', '127.0.0.1', '127.0.0.1')
+        if self.isconnected():
+            return ('127.0.0.1', '255.0.0.0', '127.0.0.1', '127.0.0.1')
+        return ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
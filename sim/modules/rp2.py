@@ -0,0 +1,45 @@
+# rp2 module of the simulator. PIO programs are not executed, a state
+# machine hands the words it is given to the device of sim.runtime.board and
+# takes the time the Neopixel programs need to shift them out, 10 cycles per
+# bit. There is no DMA class, drivers fall back to StateMachine.put().
+
+from sim import runtime
+
+
+class PIO:
+    OUT_LOW = 0
+    OUT_HIGH = 1
+    SHIFT_LEFT = 0
+    SHIFT_RIGHT = 1
+
+
+def asm_pio(**options):
+    def decorator(program):
+        program.pio_options = options
+        return program
+    return decorator
+
+
+class StateMachine:
+    def __init__(self, id, program=None, freq=-1, **options):
+        self.id = id
+        self._active = 0
+        self._sink = runtime.board.state_machines.get(id)
+        self.words = 0
+        bits = getattr(program, 'pio_options', {}).get('pull_thresh', 32)
+        self._word_us = bits * 10 * 1000000 / freq if freq > 0 else 0
+
+    def active(self, value=None):
+        if value is None:
+            return self._active
+        self._active = value
+
+    def put(self, value, shift=0):
+        if isinstance(value, int):
+            value = (value,)
+        sink = self._sink
+        for word in value:
+            self.words += 1
+            if sink is not None:
+                sink.put(word << shift)
+        runtime.clock.advance(int(len(value) * self._word_us))
@@ -0,0 +1,30 @@
+# utime module of the simulator, the virtual clock of sim.runtime.
+
+from time import gmtime, localtime, mktime  # noqa: F401
+
+from sim import runtime
+from sim.clock import ticks_add, ticks_diff  # noqa: F401
+
+
+def ticks_ms():
+    return runtime.clock.ticks_ms()
+
+
+def ticks_us():
+    return runtime.clock.ticks_us()
+
+
+def time():
+    return runtime.clock.time()
+
+
+def sleep(seconds):
+    runtime.clock.sleep(seconds)
+
+
+def sleep_ms(ms):
+    runtime.clock.sleep_ms(ms)
+
+
+def sleep_us(us):
+    runtime.clock.sleep_us(us)
@@ -0,0 +1,5 @@
+# The clock and board of the running simulation, set by sim.install(). The
+# module shims in sim/modules look them up on every call.
+
+clock = None
+board = None
@@ -57,8 +57,8 @@ def read_dht():
     t_sensor = DHT11(Pin(5))
     for x in range(3):
         t_sensor.measure()
-        t_sensor_temperature = t_sensor.temperature()
-        t_sensor_humidity = t_sensor.humidity()
+        t_sensor_temperature = t_sensor.temperature
+        t_sensor_humidity = t_sensor.humidity
         print(f'Room Temperature: {t_sensor_temperature}C')
         print(f'Room Humidity: {t_sensor_humidity}%')
         time.sleep(1)
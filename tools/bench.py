@@ -0,0 +1,131 @@
+# Benchmark suite on the host simulator.
+#
+# Usage: python3 tools/bench.py [--out results.json] [--compare baseline.json] [--quick]
+#
+# Boots the firmware in the simulator (see sim/), runs the device benchmarks
+# of tools/benchmarks.py and load tests every HTTP route over loopback with
+# tools/bench_http.py. The results are written as JSON. With --compare every
+# timing is checked against a previous run and the script exits with 1 when
+# one got more than --tolerance worse. Differences below --slack (us or ms)
+# are noise and never count. The host timings of --quick runs are too noisy
+# to compare, device_us is exact in both modes.
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import sys
+import time
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TOOLS))
+sys.path.insert(0, TOOLS)
+
+ROUTES = (
+    ('index', '/'),
+    ('backend_data', '/get_backend_data'),
+    ('backend_data_bin', '/get_backend_data?format=bin'),
+    ('pump_state', '/get_pump_state'),
+    ('animation', '/get_animation'),
+    ('watering_model', '/get_watering_model'),
+    ('history', '/history'),
+    ('strip_color', '/set_strip_color?rgb=10,20,30'),
+)
+# lower is better for these keys, higher for the RATES
+TIMINGS = ('us', 'device_us', 'p50_ms', 'p99_ms')
+RATES = ('rps',)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def _bench_routes(firmware, clients, requests):
+    import bench_http
+    firmware.http_port = _free_port()
+    server = asyncio.ensure_future(firmware.serve_wifi_website('127.0.0.1'))
+    await asyncio.sleep(0.1)
+    results = {}
+    try:
+        for name, path in ROUTES:
+            results[name] = await bench_http.run('127.0.0.1', firmware.http_port, path, clients, requests)
+    finally:
+        server.cancel()
+    return results
+
+
+def run(quick=False):
+    from sim import Simulator
+    import benchmarks
+
+    rounds = 5 if quick else benchmarks.ROUNDS
+    lengths = (8, 144) if quick else benchmarks.LENGTHS
+    # the simulator takes over time.time
+    started = int(time.time())
+    simulator = Simulator()
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        firmware = simulator.boot(start=False)
+        results = benchmarks.run(firmware, lengths, rounds)
+        results['http'] = asyncio.run(_bench_routes(firmware, 2 if quick else 8, 5 if quick else 50))
+    return {
+        'backend': 'sim',
+        'python': sys.version.split()[0],
+        'time': started,
+        'results': results,
+    }
+
+
+def compare(baseline, current, tolerance=0.2, slack=10, path=''):
+    """
+    :return: list of (key, baseline value, current value) that got worse by more than <tolerance>
+    """
+    regressions = []
+    if isinstance(baseline, dict) and isinstance(current, dict):
+        for key, value in baseline.items():
+            if key in current:
+                regressions += compare(value, current[key], tolerance, slack, f'{path}.{key}' if path else key)
+    elif isinstance(baseline, (int, float)) and isinstance(current, (int, float)) and baseline > 0:
+        key = path.rsplit('.', 1)[-1]
+        if key in TIMINGS and current > baseline * (1 + tolerance) and current - baseline > slack:
+            regressions.append((path, baseline, current))
+        elif key in RATES and current < baseline * (1 - tolerance):
+            regressions.append((path, baseline, current))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='bench.py')
+    parser.add_argument('--out')
+    parser.add_argument('--compare')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--slack', type=float, default=10)
+    parser.add_argument('--quick', action='store_true')
+    args = parser.parse_args(argv)
+    # the simulator changes into its flash directory
+    out = os.path.abspath(args.out) if args.out else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    report = run(args.quick)
+    text = json.dumps(report, indent=2)
+    if out:
+        with open(out, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline['results'], report['results'], args.tolerance, args.slack)
+        for key, old, new in regressions:
+            print(f'REGRESSION {key}: {old} -> {new}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
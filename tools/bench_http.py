@@ -0,0 +1,80 @@
+# Host-side HTTP load generator for the pot web server.
+#
+# Usage: python3 tools/bench_http.py <host> [port] [path] [clients] [requests]
+#
+# Opens <clients> concurrent connections, each sending <requests> requests,
+# and prints throughput together with p50/p99 latency. Works against the
+# device on the LAN as well as against a server started on the host.
+
+import asyncio
+import sys
+import time
+
+
+async def _client(host, port, path, count, keep_alive, latencies):
+    reader = writer = None
+    for _ in range(count):
+        if writer is None:
+            reader, writer = await asyncio.open_connection(host, port)
+        started = time.perf_counter()
+        writer.write('GET {} HTTP/1.1\r\nHost: {}\r\nConnection: {}\r\n\r\n'.format(
+            path, host, 'keep-alive' if keep_alive else 'close').encode())
+        await writer.drain()
+        length = 0
+        reuse = False
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode().partition(':')
+            name = name.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'connection':
+                reuse = value.strip().lower() == 'keep-alive'
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - started)
+        if not reuse:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run(host, port=80, path='/get_backend_data', clients=8, requests=50, keep_alive=True):
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        _client(host, port, path, requests, keep_alive, latencies) for _ in range(clients)
+    ])
+    elapsed = time.perf_counter() - started
+    return {
+        'path': path,
+        'clients': clients,
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed if elapsed else 0,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if not args:
+        print('usage: bench_http.py <host> [port] [path] [clients] [requests]')
+        sys.exit(1)
+    result = asyncio.run(run(
+        args[0],
+        int(args[1]) if len(args) > 1 else 80,
+        args[2] if len(args) > 2 else '/get_backend_data',
+        int(args[3]) if len(args) > 3 else 8,
+        int(args[4]) if len(args) > 4 else 50,
+    ))
+    print(result)
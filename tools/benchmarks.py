@@ -0,0 +1,343 @@
+# Benchmarks of the hot paths, for the device and for the host simulator.
+#
+# On the device:   mpremote run tools/benchmarks.py
+# On the host:     python3 tools/bench.py (adds the HTTP routes, see there)
+#
+# Every result has 'us', the time per call, and 'device_us', the same
+# measured with time.ticks_us. On the board both are real time. Under the
+# simulator 'us' is host CPU time and 'device_us' the virtual time the
+# simulated hardware took (bus transfers, DHT pulse trains, sleeps).
+# 'alloc' is the heap allocated per call, None where gc can't tell.
+
+import gc
+import json
+import time
+
+try:
+    # CPython, time.ticks_us is the virtual clock of the simulator there
+    from time import perf_counter
+
+    def _host_us():
+        return int(perf_counter() * 1000000)
+
+    def _host_diff(end, start):
+        return end - start
+except ImportError:
+    _host_us = time.ticks_us
+    _host_diff = time.ticks_diff
+
+LENGTHS = (8, 60, 144, 300, 1000)
+ROUNDS = 50
+REPEAT = 3
+
+
+def _mem_free():
+    return gc.mem_free() if hasattr(gc, 'mem_free') else None
+
+
+def measure(func, rounds=ROUNDS, repeat=REPEAT):
+    """
+    Call <func> <rounds> times, <repeat> times over, and keep the best batch.
+
+    :return: dict with us, device_us and alloc per call
+    """
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        free = _mem_free()
+        host_started = _host_us()
+        started = time.ticks_us()
+        for _ in range(rounds):
+            func()
+        device = time.ticks_diff(time.ticks_us(), started)
+        host = _host_diff(_host_us(), host_started)
+        alloc = None
+        if free is not None:
+            alloc = max(0, free - gc.mem_free()) // rounds
+        result = {'us': host // rounds, 'device_us': device // rounds, 'alloc': alloc}
+        if best is None:
+            best = result
+        else:
+            for key, value in result.items():
+                if value is not None:
+                    best[key] = min(best[key], value)
+    return best
+
+
+def _legacy_rotate_right(strip):
+    strip.pixels = strip.pixels[-1:] + strip.pixels[:-1]
+
+
+def _legacy_show(strip):
+    sm_put = strip.sm.put
+    for pixval in strip.pixels:
+        sm_put(pixval)
+
+
+def bench_neopixel(lengths=LENGTHS, rounds=ROUNDS):
+    # the offset rotation and bulk transfer against the old slice rotation
+    # and per pixel put loop
+    from lib.neopixel import Neopixel
+    results = {}
+    for num_leds in lengths:
+        strip = Neopixel(num_leds, 0, 6, "RGB", delay=0)
+        strip.fill((10, 20, 30))
+        # string keys, the results go through JSON
+        results[str(num_leds)] = {
+            'rotate_right': measure(lambda: strip.rotate_right(1), rounds),
+            'show': measure(strip.show, rounds),
+            'legacy_rotate_right': measure(lambda: _legacy_rotate_right(strip), rounds),
+            'legacy_show': measure(lambda: _legacy_show(strip), rounds),
+            'dma': strip.dma is not None,
+        }
+        strip.clear()
+        strip.show()
+        if strip.dma is not None:
+            strip.dma.close()
+        strip.sm.active(0)
+        del strip
+    return results
+
+
+def bench_ssd1306(display, rounds=ROUNDS):
+    def full():
+        display.invalidate()
+        display.show()
+
+    def one_page():
+        display.pixel(0, 0, not display.pixel(0, 0))
+        display.show()
+
+    results = {}
+    for name, func in (('full', full), ('one_page', one_page), ('unchanged', display.show)):
+        display.show()
+        result = measure(func, rounds)
+        result['bytes'] = display.bytes_sent
+        results[name] = result
+    return results
+
+
+def bench_display(firmware, rounds=ROUNDS):
+    # run_display with values changing every frame and with a static screen
+    renderer = firmware.renderer
+    renderer.invalidate()
+    firmware.info_message = None
+    firmware.display_page = 'main'
+    temperatures = [20 + i % 10 for i in range(rounds)]
+    counter = [0]
+
+    def changing():
+        firmware.outside_temperature = temperatures[counter[0] % rounds]
+        counter[0] += 1
+        firmware.run_display(None)
+
+    results = {
+        'changing': measure(changing, rounds),
+        'unchanged': measure(lambda: firmware.run_display(None), rounds),
+    }
+    results['changing']['render_us'] = renderer.render_us
+    firmware.info_message = 'Waiting for imersia 5s'
+    results['message'] = measure(lambda: firmware.run_display(None), 1, 1)
+    firmware.info_message = None
+    return results
+
+
+def bench_dht(sensor, rounds=3):
+    # blocking reads, the sensor needs MIN_INTERVAL_US between them
+    timings = []
+    failures = 0
+    for _ in range(rounds):
+        time.sleep_ms(250)
+        try:
+            timings.append(measure(sensor.measure, 1, 1))
+        except Exception:
+            failures += 1
+    if not timings:
+        return {'failures': failures}
+    result = {
+        'us': sum(t['us'] for t in timings) // len(timings),
+        'device_us': sum(t['device_us'] for t in timings) // len(timings),
+        'driver_us': sensor.driver_us,
+        'failures': failures,
+    }
+    return result
+
+
+def bench_soil(sensor, rounds=ROUNDS):
+    result = measure(sensor.update, rounds)
+    result['burst'] = sensor.burst
+    return result
+
+
+def bench_hardware_loop(firmware, rounds=ROUNDS):
+    # a tick that reads the sensors and one that only steps the pump
+    def sensor_tick():
+        firmware.last_sensor_read = None
+        firmware.hardware_loop(None)
+
+    return {
+        'sensor_tick': measure(sensor_tick, 5),
+        'pump_tick': measure(lambda: firmware.hardware_loop(None), rounds),
+    }
+
+
+def bench_config(firmware, rounds=ROUNDS):
+    # boot time load, one write, and the writes a burst of changes costs,
+    # on a copy so the settings of the device stay untouched
+    import os
+    from lib.config import ConfigStore
+    if not firmware.config.loaded:
+        firmware.config.load()
+    store = ConfigStore('bench_config.json', quiet_ms=1000)
+    for key, value in firmware.config.data.items():
+        store.set(key, value)
+    store.flush()
+    counter = [0]
+
+    def write():
+        counter[0] += 1
+        store.set('bench', counter[0])
+        store.flush()
+
+    results = {'load': measure(store.load, rounds), 'write': measure(write, rounds)}
+    writes = store.writes
+    started = time.ticks_ms()
+    for i in range(rounds):
+        store.set('bench', -i)
+        store.poll(time.ticks_add(started, i * 100))
+    store.poll(time.ticks_add(started, rounds * 100 + store.quiet_ms))
+    results['burst'] = {'changes': rounds, 'writes': store.writes - writes, 'bytes': len(json.dumps(store.data))}
+    os.remove(store.path)
+    return results
+
+
+SAMPLE_REQUEST = (
+    b'GET /set_pump_config?zone=A&treshold=40&time=5 HTTP/1.1\r\n'
+    b'Host: 192.168.1.20\r\n'
+    b'Connection: keep-alive\r\n'
+    b'User-Agent: Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36\r\n'
+    b'Accept: */*\r\n'
+    b'Referer: http://192.168.1.20/\r\n'
+    b'Accept-Encoding: gzip, deflate\r\n'
+    b'Accept-Language: en-US,en;q=0.9,pl;q=0.8\r\n'
+    b'\r\n'
+)
+
+
+class _MemoryReader:
+    # stream reader over bytes, never suspends
+    def __init__(self, data):
+        self.data = data
+        self.view = memoryview(data)
+        self.position = 0
+
+    async def readline(self):
+        end = self.data.find(b'\n', self.position) + 1 or len(self.data)
+        line = self.data[self.position:end]
+        self.position = end
+        return line
+
+    async def readexactly(self, count):
+        data = self.data[self.position:self.position + count]
+        self.position += count
+        return data
+
+    async def readinto(self, buffer):
+        count = min(len(buffer), len(self.data) - self.position)
+        buffer[:count] = self.view[self.position:self.position + count]
+        self.position += count
+        return count
+
+
+def _complete(coroutine):
+    try:
+        coroutine.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError('coroutine suspended')
+
+
+async def _legacy_read_request(reader):
+    # the readline based parser and split('=') query parsing before the
+    # incremental parser
+    from lib.httpserver import Request
+    line = await reader.readline()
+    method, target = line.decode().split()[:2]
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line or line == b'\r\n' or line == b'\n':
+            break
+        name, _, value = line.decode().partition(':')
+        headers[name.strip().lower()] = value.strip()
+    body = b''
+    length = int(headers.get('content-length', 0))
+    if length:
+        body = await reader.readexactly(length)
+    path, _, query = target.partition('?')
+    params = {}
+    for param in query.split('&'):
+        key, value = param.split('=')
+        params[key] = value
+    return Request(method, path, query, headers, body), params
+
+
+def bench_http_parser(rounds=ROUNDS):
+    from lib.httpserver import HTTPServer, RequestParser
+    server = HTTPServer(None)
+    parser = RequestParser()
+
+    def legacy():
+        _complete(_legacy_read_request(_MemoryReader(SAMPLE_REQUEST)))
+
+    def incremental():
+        request = _complete(server._read_request(_MemoryReader(SAMPLE_REQUEST), parser))
+        request.params
+
+    return {
+        'bytes': len(SAMPLE_REQUEST),
+        'legacy': measure(legacy, rounds),
+        'incremental': measure(incremental, rounds),
+    }
+
+
+def bench_backend_data(firmware, rounds=ROUNDS):
+    # encoding the state on every request against the cached bodies,
+    # nothing changes between the calls
+    snapshots = firmware.backend_snapshots
+
+    def uncached():
+        json.dumps(firmware.backend_data()).encode()
+
+    return {
+        'json_bytes': len(snapshots.body('json')[0]),
+        'bin_bytes': len(snapshots.body('bin')[0]),
+        'uncached': measure(uncached, rounds),
+        'cached_json': measure(lambda: snapshots.body('json'), rounds),
+        'cached_bin': measure(lambda: snapshots.body('bin'), rounds),
+    }
+
+
+def run(firmware, lengths=LENGTHS, rounds=ROUNDS):
+    """
+    Run all device benchmarks against the imported main module <firmware>.
+
+    :return: dict of results by benchmark name
+    """
+    return {
+        'neopixel': bench_neopixel(lengths, rounds),
+        'ssd1306': bench_ssd1306(firmware.oled, rounds),
+        'run_display': bench_display(firmware, rounds),
+        'dht11': bench_dht(firmware.dht11),
+        'soil': bench_soil(firmware.zones[0].sensor, rounds),
+        'hardware_loop': bench_hardware_loop(firmware, rounds),
+        'config': bench_config(firmware, rounds),
+        'http_parser': bench_http_parser(rounds),
+        'backend_data': bench_backend_data(firmware, rounds),
+    }
+
+
+if __name__ == '__main__':
+    import main
+    import sys
+    print(json.dumps({'backend': sys.implementation.name, 'results': run(main)}))
@@ -0,0 +1,31 @@
+# Pre-compress the static pages so the device doesn't have to gzip them at boot.
+#
+# Usage: python3 tools/build_assets.py
+#
+# Writes '<page>.gz' next to every page, copy them to the device together with
+# the html files. lib/assets.py picks them up automatically.
+
+import gzip
+import os
+
+PAGES = ('ap_index.html', 'ap_configure.html', 'wifi_index.html')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build(root=ROOT):
+    for page in PAGES:
+        path = os.path.join(root, page)
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            raw = f.read()
+        # mtime=0 keeps the output identical between builds
+        gz = gzip.compress(raw, 9, mtime=0)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gz)
+        print('{}: {} -> {} bytes'.format(page, len(raw), len(gz)))
+
+
+if __name__ == '__main__':
+    build()
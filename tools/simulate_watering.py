@@ -0,0 +1,119 @@
+# Compare the watering policies on a simulated pot.
+#
+# Usage: python3 tools/simulate_watering.py [days] [trace.csv] [--json]
+#   e.g. python3 tools/simulate_watering.py 4 tools/traces/sunny_window.csv
+#
+# The pot dries at a rate that follows a day/night cycle, or the drying rates
+# of a recorded trace (CSV lines of seconds,moisture percent taken without
+# watering, lines starting with # are skipped). Water soaks in with a delay, so the sensor only sees part of a
+# pulse when the controller verifies it. Both policies run the real
+# PumpController, Zone, SoilSensor and History code on the virtual clock and
+# soil model of the simulator in sim/.
+
+import csv
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TICK_MS = 250
+SENSOR_PERIOD_MS = 5000
+
+
+class Pump:
+    # stands in for machine.PWM
+    def __init__(self, pot):
+        self.pot = pot
+
+    def freq(self, value):
+        pass
+
+    def duty_u16(self, value):
+        self.pot.duty(value)
+
+
+def load_trace(path):
+    # recorded moisture without watering -> drying rate per segment
+    with open(path) as f:
+        rows = [(float(row[0]), float(row[1])) for row in csv.reader(f) if row and not row[0].startswith('#')]
+    start = rows[0][0]
+    return [(t1 - start, max(0, (m0 - m1) / (t1 - t0))) for (t0, m0), (t1, m1) in zip(rows, rows[1:]) if t1 > t0]
+
+
+def simulate(policy_name, days=2, trace=None, seed=1, treshold=40, pump_time=10):
+    from sim import install
+    from sim.board import Board
+    from sim.devices import Pot
+    from lib.history import History
+    from lib.predict import PredictivePolicy
+    from lib.pump import IDLE, PumpController, ThresholdPolicy
+    from lib.soil import SoilSensor
+    from lib.zones import Zone, ZoneScheduler
+
+    random.seed(seed)
+    clock, _ = install(board=Board())
+    pot = Pot(trace=trace)
+    zone = Zone('A', SoilSensor(pot, pot.soil_min, pot.soil_max), Pump(pot), treshold=treshold, pump_time=pump_time)
+    scheduler = ZoneScheduler([zone])
+    history = History()
+    if policy_name == 'predictive':
+        policy = PredictivePolicy(history, {'A': 'soil'}, clock=clock.time)
+    else:
+        policy = ThresholdPolicy()
+    controller = PumpController(scheduler, policy=policy)
+
+    stats = {
+        'policy': policy_name,
+        'activations': 0,
+        'busy_seconds': 0.0,
+        'below_treshold_seconds': 0.0,
+        'min_moisture': 100.0,
+        'mean_moisture': 0.0,
+    }
+    dt = TICK_MS / 1000
+    ticks = int(days * 86400 * 1000 / TICK_MS)
+    pulses = 0
+    pump_event = False
+    total = 0.0
+    for tick in range(1, ticks + 1):
+        clock.advance(TICK_MS * 1000)
+        pot.update(clock.us / 1000000)
+        if tick * TICK_MS % SENSOR_PERIOD_MS == 0:
+            zone.sample()
+            history.append(clock.time(), (zone.moisture, None, None), pump_event)
+            pump_event = False
+            policy.observe()
+        controller.step(True, clock.ticks_ms())
+        if controller.pulses != pulses:
+            pulses = controller.pulses
+            pump_event = True
+        if controller.state != IDLE:
+            stats['busy_seconds'] += dt
+        if pot.moisture <= treshold:
+            stats['below_treshold_seconds'] += dt
+        stats['min_moisture'] = min(stats['min_moisture'], pot.moisture)
+        total += pot.moisture
+    stats['activations'] = pot.activations
+    stats['pump_seconds'] = pot.pump_seconds
+    stats['mean_moisture'] = total / ticks
+    stats['overflow'] = pot.overflow
+    for key in ('pump_seconds', 'busy_seconds', 'below_treshold_seconds', 'min_moisture', 'mean_moisture', 'overflow'):
+        stats[key] = round(stats[key], 1)
+    stats['model'] = policy.state()
+    return stats
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    days = float(args[0]) if args else 2
+    trace = load_trace(args[1]) if len(args) > 1 else None
+    results = [simulate(name, days, trace) for name in ('threshold', 'predictive')]
+    if '--json' in sys.argv:
+        print(json.dumps(results, indent=2))
+    else:
+        keys = ('activations', 'pump_seconds', 'busy_seconds', 'below_treshold_seconds', 'min_moisture', 'mean_moisture', 'overflow')
+        print(f'{"":24}' + ''.join(f'{result["policy"]:>14}' for result in results))
+        for key in keys:
+            print(f'{key:24}' + ''.join(f'{result[key]:>14}' for result in results))
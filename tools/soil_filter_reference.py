@@ -0,0 +1,83 @@
+# Vectorized host reference of the soil moisture filter in lib/soil.py.
+#
+# Usage: python3 tools/soil_filter_reference.py trace.csv [alpha_shift]
+#
+# A trace is a CSV file with one burst of raw ADC samples per line. The
+# script filters it with numpy and with the device code and reports the first
+# mismatch, if any, followed by the filtered values.
+
+import csv
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.soil import ALPHA_SHIFT, FRACTION_BITS, SoilFilter, median  # noqa: E402
+
+
+def load_trace(path):
+    with open(path) as f:
+        return np.array([[int(v) for v in row] for row in csv.reader(f) if row], dtype=np.int64)
+
+
+def reference(bursts, alpha_shift=ALPHA_SHIFT):
+    """
+    Filter <bursts> (n x burst array of raw samples).
+
+    :return: (smoothed raw values, variance estimates in raw units squared)
+    """
+    # median of every burst at once, the bursts have an odd length so this is
+    # always one of the samples
+    medians = np.sort(bursts, axis=1)[:, bursts.shape[1] // 2] << FRACTION_BITS
+    means = np.empty_like(medians)
+    variances = np.empty_like(medians)
+    mean = medians[0]
+    variance = 0
+    means[0] = mean
+    variances[0] = 0
+    # the EMA is a recurrence, only this part stays a loop
+    for i in range(1, len(medians)):
+        delta = medians[i] - mean
+        mean += delta >> alpha_shift
+        variance += (((delta * delta) >> FRACTION_BITS) - variance) >> alpha_shift
+        means[i] = mean
+        variances[i] = variance
+    return means >> FRACTION_BITS, variances >> FRACTION_BITS
+
+
+def device(bursts, alpha_shift=ALPHA_SHIFT):
+    soil_filter = SoilFilter(alpha_shift)
+    means = []
+    variances = []
+    for burst in bursts:
+        samples = [int(v) for v in burst]
+        means.append(soil_filter.update(median(samples, len(samples))))
+        variances.append(soil_filter.variance >> FRACTION_BITS)
+    return np.array(means), np.array(variances)
+
+
+def compare(bursts, alpha_shift=ALPHA_SHIFT):
+    """
+    :return: index of the first burst where the implementations differ, or None
+    """
+    ref_means, ref_vars = reference(bursts, alpha_shift)
+    dev_means, dev_vars = device(bursts, alpha_shift)
+    mismatch = np.nonzero((ref_means != dev_means) | (ref_vars != dev_vars))[0]
+    return int(mismatch[0]) if len(mismatch) else None
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: soil_filter_reference.py trace.csv [alpha_shift]')
+        sys.exit(1)
+    trace = load_trace(sys.argv[1])
+    shift = int(sys.argv[2]) if len(sys.argv) > 2 else ALPHA_SHIFT
+    first = compare(trace, shift)
+    if first is not None:
+        print('Mismatch at burst', first)
+        sys.exit(2)
+    means, variances = reference(trace, shift)
+    for mean, variance in zip(means, variances):
+        print(mean, variance)